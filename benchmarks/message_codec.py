@@ -0,0 +1,76 @@
+"""
+Benchmark de creación y serialización de mensajes.
+
+Compara el Message actual (slots, ID entero, codec msgpack) con la
+representación anterior (dataclass, uuid4, datetime.utcnow() y JSON).
+
+Uso: python benchmarks/message_codec.py [iteraciones]
+"""
+import json
+import sys
+import timeit
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+from uruz.core import codec
+from uruz.core.message import Message
+
+@dataclass
+class LegacyMessage:
+    id: str
+    sender_id: str
+    receiver_id: str
+    content: Dict[str, Any]
+    timestamp: datetime
+    type: str
+    metadata: Optional[Dict[str, Any]] = None
+    topic: Optional[str] = None
+
+    @classmethod
+    def create(cls, sender_id, receiver_id, content, type="text"):
+        return cls(str(uuid.uuid4()), sender_id, receiver_id, content, datetime.utcnow(), type)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "id": self.id, "sender_id": self.sender_id, "receiver_id": self.receiver_id,
+            "content": self.content, "timestamp": self.timestamp.isoformat(),
+            "type": self.type, "metadata": self.metadata, "topic": self.topic,
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "LegacyMessage":
+        fields = json.loads(data)
+        fields["timestamp"] = datetime.fromisoformat(fields["timestamp"])
+        return cls(**fields)
+
+CONTENT = {"text": "CPU usage above threshold", "value": 93.5, "tags": ["ops", "cpu"]}
+
+def bench(label: str, func, number: int) -> float:
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_op = seconds / number * 1e9
+    print(f"{label:<32} {per_op:>9.0f} ns/op")
+    return per_op
+
+def main(number: int = 100000) -> None:
+    legacy = LegacyMessage.create("monitor", "optimizer", CONTENT)
+    current = Message.create("monitor", "optimizer", CONTENT)
+    legacy_payload = legacy.to_json()
+    current_payload = codec.encode(current)
+
+    print(f"{number} iteraciones, mejor de 5")
+    results = [
+        ("create", bench("legacy create", lambda: LegacyMessage.create("a", "b", CONTENT), number),
+         bench("slotted create", lambda: Message.create("a", "b", CONTENT), number)),
+        ("encode", bench("legacy encode (json)", legacy.to_json, number),
+         bench("codec encode (msgpack)", lambda: codec.encode(current), number)),
+        ("decode", bench("legacy decode (json)", lambda: LegacyMessage.from_json(legacy_payload), number),
+         bench("codec decode (msgpack)", lambda: codec.decode(current_payload), number)),
+    ]
+    print()
+    for name, before, after in results:
+        print(f"{name:<8} {before / after:.1f}x")
+    print(f"size     {len(legacy_payload.encode())} -> {len(current_payload)} bytes")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -4,6 +4,7 @@ Ejemplo de un sistema multiagente donde varios agentes colaboran para resolver u
 
 import asyncio
 from uruz.core.environment import Environment
+from uruz.core.message import Message
 from uruz.security.vault import Vault
 
 async def main():
@@ -51,31 +52,33 @@ async def main():
         print(f"✓ Agente {config['name']} registrado")
     
     # 5. Simular proceso de desarrollo
+    # Cada paso es un request() al agente: se espera su respuesta sin sondear
     print("\n🔄 Iniciando proceso de desarrollo...")
+    broker = env.message_broker
+    
+    async def pedir(agente: str, texto: str) -> str:
+        respuesta = await broker.request(
+            Message.create("coordinador", agente, {"content": texto}),
+            timeout=300
+        )
+        return respuesta.content["response"]
     
     # 5.1 Arquitecto diseña
     print("\n👷 Arquitecto diseñando...")
-    response = await registered_agents["arquitecto"].process_message({
-        "content": """Diseña un sistema simple para gestionar una biblioteca.
-        Debe permitir agregar/eliminar libros y gestionar préstamos."""
-    })
-    diseño = response["response"]
+    diseño = await pedir("arquitecto", """Diseña un sistema simple para gestionar una biblioteca.
+        Debe permitir agregar/eliminar libros y gestionar préstamos.""")
     print(f"\nDiseño propuesto:\n{diseño}")
     
     # 5.2 Desarrollador implementa
     print("\n👨‍💻 Desarrollador implementando...")
-    response = await registered_agents["desarrollador"].process_message({
-        "content": f"Implementa en Python el siguiente diseño:\n{diseño}"
-    })
-    implementacion = response["response"]
+    implementacion = await pedir("desarrollador",
+                                 f"Implementa en Python el siguiente diseño:\n{diseño}")
     print(f"\nImplementación:\n{implementacion}")
     
     # 5.3 Tester revisa
     print("\n🔍 Tester revisando...")
-    response = await registered_agents["tester"].process_message({
-        "content": f"Revisa esta implementación y sugiere pruebas:\n{implementacion}"
-    })
-    revision = response["response"]
+    revision = await pedir("tester",
+                           f"Revisa esta implementación y sugiere pruebas:\n{implementacion}")
     print(f"\nRevisión y pruebas sugeridas:\n{revision}")
     
     # 6. Obtener métricas
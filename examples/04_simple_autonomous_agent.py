@@ -13,8 +13,6 @@ class SystemMonitorAgent(Agent):
     
     def __init__(self, name: str, config: dict = None):
         super().__init__(name, config)
-        self.check_interval = config.get("check_interval", 5)  # segundos
-        self.last_check = None
         self.thresholds = config.get("thresholds", {
             "cpu": 80,  # porcentaje
             "memory": 80,  # porcentaje
@@ -28,14 +26,14 @@ class SystemMonitorAgent(Agent):
         return {"response": "Comando no reconocido. Use 'status' para ver el estado del sistema."}
     
     async def act(self) -> list:
-        """Monitorea el sistema periódicamente y reporta alertas si es necesario."""
-        now = datetime.now()
-        if not self.last_check or (now - self.last_check).seconds >= self.check_interval:
-            self.last_check = now
-            status = await self._get_system_status()
-            alerts = self._check_alerts(status)
-            return alerts if alerts else [{"status": "normal"}]
-        return []
+        """Monitorea el sistema y reporta alertas si es necesario.
+        
+        El entorno solo invoca este método cuando vence el intervalo declarado
+        en la configuración, por lo que no es necesario comprobar la hora aquí.
+        """
+        status = await self._get_system_status()
+        alerts = self._check_alerts(status)
+        return alerts if alerts else [{"status": "normal"}]
     
     async def _get_system_status(self) -> str:
         """Obtiene el estado actual del sistema."""
@@ -61,6 +59,8 @@ class SystemMonitorAgent(Agent):
             if value > self.thresholds.get(resource.lower(), 80):
                 alerts.append({
                     "type": "alert",
+                    "topic": "ops.system.alerts",
+                    "priority": 0,  # carril urgente de los suscriptores
                     "level": "warning",
                     "message": f"¡Alerta! {resource} al {value}% (umbral: {self.thresholds[resource.lower()]}%)"
                 })
@@ -73,7 +73,7 @@ async def main():
     
     # 2. Configurar agente
     agent_config = {
-        "check_interval": 3,  # revisar cada 3 segundos
+        "interval": 3,  # el entorno lo despierta cada 3 segundos
         "thresholds": {
             "cpu": 70,
             "memory": 75,
@@ -101,7 +101,7 @@ async def main():
                 print(f"\n⚠️  {result['message']}")
             else:
                 print(f"\n✓ Sistema normal: {datetime.now().strftime('%H:%M:%S')}")
-        await asyncio.sleep(agent_config["check_interval"])
+        await asyncio.sleep(agent_config["interval"])
 
 if __name__ == "__main__":
     print("🚀 Iniciando ejemplo de agente autónomo...")
@@ -3,6 +3,7 @@ Ejemplo de un agente autónomo avanzado que monitorea y optimiza un sistema de b
 """
 
 import asyncio
+import os
 import sqlite3
 import psutil
 from datetime import datetime, timedelta
@@ -16,7 +17,6 @@ class DatabaseOptimizer(Agent):
     def __init__(self, name: str, config: dict = None):
         super().__init__(name, config)
         self.db_path = config.get("db_path", "data/storage/uruz.db")
-        self.check_interval = config.get("check_interval", 300)  # 5 minutos
         self.last_check = None
         self.last_optimization = None
         self.optimization_interval = timedelta(hours=config.get("optimization_interval", 24))
@@ -43,15 +43,14 @@ class DatabaseOptimizer(Agent):
 - metrics: muestra métricas de rendimiento"""}
     
     async def act(self) -> list:
-        """Realiza monitoreo y optimización automática."""
-        now = datetime.now()
-        actions = []
+        """Realiza monitoreo y optimización automática.
         
-        # Verificar si es tiempo de monitorear
-        if not self.last_check or (now - self.last_check).seconds >= self.check_interval:
-            self.last_check = now
-            status = await self._analyze_database()
-            actions.extend(status)
+        El entorno solo invoca este método cuando vence el intervalo declarado
+        en la configuración, así que cada llamada es una revisión.
+        """
+        now = datetime.now()
+        self.last_check = now
+        actions = await self._analyze_database()
         
         # Verificar si es tiempo de optimizar
         if not self.last_optimization or (now - self.last_optimization) >= self.optimization_interval:
@@ -179,7 +178,7 @@ class DatabaseOptimizer(Agent):
             return f"""Estado de la Base de Datos:
 - Tamaño total: {db_size:.2f}MB
 - Espacio libre: {free_space:.2f}MB
-- Última revisión: {self.last_check.strftime('%Y-%m-%d %H:%M:%S')}
+- Última revisión: {self.last_check.strftime('%Y-%m-%d %H:%M:%S') if self.last_check else 'Nunca'}
 - Última optimización: {self.last_optimization.strftime('%Y-%m-%d %H:%M:%S') if self.last_optimization else 'Nunca'}"""
             
         except Exception as e:
@@ -190,6 +189,18 @@ class DatabaseOptimizer(Agent):
         results = await self._optimize_database()
         return "\n".join(result["message"] for result in results)
     
+    def get_state(self) -> dict:
+        """Conserva las métricas entre reinicios del entorno."""
+        return {
+            "metrics": self.metrics,
+            "last_optimization": self.last_optimization
+        }
+    
+    def set_state(self, state: dict) -> None:
+        """Restaura las métricas guardadas en el snapshot."""
+        self.metrics.update(state.get("metrics", {}))
+        self.last_optimization = state.get("last_optimization")
+    
     def _get_metrics(self) -> str:
         """Obtiene las métricas de rendimiento."""
         return f"""Métricas de Rendimiento:
@@ -204,7 +215,7 @@ async def main():
     # 2. Configurar agente
     agent_config = {
         "db_path": "data/storage/uruz.db",
-        "check_interval": 10,  # 10 segundos para demo
+        "interval": 10,  # el entorno lo despierta cada 10 segundos (demo)
         "optimization_interval": 1  # 1 hora
     }
     
@@ -231,7 +242,7 @@ async def main():
                 print(f"🔧 {result['message']}")
             else:
                 print("✓ Monitoreo activo")
-        await asyncio.sleep(agent_config["check_interval"])
+        await asyncio.sleep(agent_config["interval"])
     
     # 4.3 Mostrar métricas finales
     response = await agent.process_message({"content": "metrics"})
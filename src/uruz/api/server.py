@@ -1,35 +1,35 @@
-import os
-import yaml
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from uruz.clients import clients
 from uruz.config import settings
 from uruz.core.environment import Environment
-from uruz.core.llm_agent import LLMAgent
-from uruz.core.server_agent import ServerAgent
+from uruz.core.pool import AgentPool
+from uruz.llm.ratelimit import rate_limit_stats
 
 app = FastAPI(title="Uruz Framework API")
 env = Environment()
+background_tasks = []
 
-def load_agents():
-    """Carga los agentes desde los archivos YAML."""
-    agents_dir = "agents"
-    if not os.path.exists(agents_dir):
-        return
-    
-    for filename in os.listdir(agents_dir):
-        if filename.endswith(".yaml"):
-            with open(os.path.join(agents_dir, filename)) as f:
-                config = yaml.safe_load(f)
-                
-                agent_id = os.path.splitext(filename)[0]
-                if config["type"] == "llm":
-                    agent = LLMAgent(agent_id, config["config"])
-                    env.add_agent(agent)
-                elif config["type"] == "server":
-                    agent = ServerAgent(agent_id, config["config"])
-                    env.add_agent(agent)
+@app.on_event("startup")
+async def warm_up_agents():
+    """Restaura el último snapshot y construye los agentes más usados."""
+    hot_agents = env.restore_snapshot()
+    await env.warm_up(list(dict.fromkeys(settings.WARM_AGENTS + hot_agents)))
+    if settings.SNAPSHOT_INTERVAL > 0:
+        background_tasks.append(asyncio.ensure_future(env.snapshot_periodically()))
 
-# Cargar agentes al iniciar
-load_agents()
+@app.on_event("shutdown")
+async def close_clients():
+    """Guarda un snapshot y cierra una sola vez todos los clientes compartidos."""
+    for task in background_tasks:
+        task.cancel()
+    try:
+        env.save_snapshot()
+    finally:
+        await clients.aclose_all()
 
 @app.get("/")
 async def root():
@@ -51,11 +51,49 @@ async def send_message(agent_id: str, message: dict):
     except Exception as e:
         return {"error": f"Error generando respuesta: {str(e)}"}
 
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formatea un evento Server-Sent Events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _stream_events(agent: Any, message: dict) -> AsyncIterator[str]:
+    try:
+        if hasattr(agent, "process_message_stream"):
+            async for chunk in agent.process_message_stream(message):
+                yield _sse({"text": chunk})
+        else:
+            # Agentes sin streaming (p. ej. en otro shard): la respuesta en un solo evento
+            response = await agent.process_message(message)
+            yield _sse({"text": response["response"]})
+        yield _sse({}, "done")
+    except Exception as e:
+        yield _sse({"error": f"Error generando respuesta: {str(e)}"}, "error")
+
+@app.post("/agents/{agent_id}/message/stream")
+async def stream_message(agent_id: str, message: dict):
+    """Como /message, pero envía la respuesta como eventos SSE según se genera."""
+    agent = env.get_agent(agent_id)
+    if not agent:
+        return {"error": f"Agent {agent_id} not found"}
+    return StreamingResponse(
+        _stream_events(agent, message),
+        media_type="text/event-stream",
+        # Sin buffering en proxies, que retrasaría el primer token
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/status")
 async def get_status():
     return {
         "status": "active",
         "agents": len(env.list_agents()),
+        "mailboxes": env.message_broker.get_stats(),
+        "replicas": {
+            agent_id: agent.get_stats()
+            for agent_id, agent in env.agents.items()
+            if isinstance(agent, AgentPool)
+        },
+        "rate_limits": rate_limit_stats(),
         "config": {
             "host": settings.API_HOST,
             "port": settings.API_PORT,
@@ -0,0 +1,116 @@
+"""
+Async Redis cache with a time budget.
+
+Every read is bounded by ``settings.CACHE_TIMEOUT``: a cache that is slow or
+down costs at most that long and behaves as a miss. Writes are sent in the
+background so they never delay the response that produced them, and
+multi-key reads and writes go out in a single round trip.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Dict, List, Optional, Set
+from ..clients import clients, get_async_redis, redis_key
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+class AsyncRedisProvider:
+    """Caché sobre ``redis.asyncio`` que nunca excede su presupuesto de tiempo."""
+
+    def __init__(self, host: str = settings.REDIS_HOST,
+                 port: int = settings.REDIS_PORT, db: int = 0,
+                 timeout: Optional[float] = None):
+        # Cliente compartido por proceso; cada instancia toma una referencia
+        self._client_key = (*redis_key(host, port, db), True)
+        self.redis = get_async_redis(host, port, db)
+        self.timeout = settings.CACHE_TIMEOUT if timeout is None else timeout
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._writes: Set[asyncio.Task] = set()
+
+    def close(self) -> None:
+        """Libera la referencia al cliente compartido."""
+        if self.redis is not None:
+            self.redis = None
+            clients.release("redis.asyncio", self._client_key)
+
+    async def _run(self, operation: Awaitable, default: Any,
+                   timeout: Optional[float] = None) -> Any:
+        """Ejecuta una operación dentro del presupuesto; si no, devuelve ``default``."""
+        try:
+            return await asyncio.wait_for(operation, self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return default
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"Cache operation failed: {e}")
+            return default
+
+    def _load(self, value: Optional[str]) -> Optional[Any]:
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def get_cache(self, key: str) -> Optional[Any]:
+        """Obtiene un valor de caché."""
+        return self._load(await self._run(self.redis.get(key), None))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Obtiene varios valores con un solo MGET."""
+        if not keys:
+            return []
+        values = await self._run(self.redis.mget(keys), None)
+        return [self._load(value) for value in (values or [None] * len(keys))]
+
+    async def set_cache(self, key: str, value: Any, expire: Optional[int] = None,
+                        timeout: Optional[float] = None) -> bool:
+        """Almacena un valor en caché."""
+        result = await self._run(self.redis.set(key, json.dumps(value), ex=expire),
+                                 None, timeout)
+        return bool(result)
+
+    async def set_many(self, items: Dict[str, Any], expire: Optional[int] = None,
+                       timeout: Optional[float] = None) -> bool:
+        """Almacena varios valores en un solo pipeline."""
+        if not items:
+            return True
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, json.dumps(value), ex=expire)
+        return await self._run(pipe.execute(), None, timeout) is not None
+
+    async def delete_cache(self, key: str) -> bool:
+        """Elimina un valor de caché."""
+        return bool(await self._run(self.redis.delete(key), 0))
+
+    def set_many_later(self, items: Dict[str, Any], expire: Optional[int] = None) -> None:
+        """Programa una escritura en segundo plano, fuera del camino de la respuesta."""
+        if not items or self.redis is None:
+            return
+        task = asyncio.ensure_future(
+            self.set_many(items, expire, timeout=settings.CACHE_WRITE_TIMEOUT)
+        )
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def flush_writes(self) -> None:
+        """Espera a que terminen las escrituras en segundo plano."""
+        if self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de la caché."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "pending_writes": len(self._writes),
+            "timeout": self.timeout,
+        }
@@ -2,6 +2,7 @@ import redis
 from typing import Any, Optional, Dict, List
 from datetime import timedelta
 import json
+from ..clients import clients, get_redis, redis_key
 from ..config import settings
 
 class RedisProvider:
@@ -10,12 +11,15 @@ class RedisProvider:
     def __init__(self, host: str = settings.REDIS_HOST, 
                  port: int = settings.REDIS_PORT,
                  db: int = 0):
-        self.redis = redis.Redis(
-            host=host,
-            port=port,
-            db=db,
-            decode_responses=True
-        )
+        # Cliente compartido por proceso; cada instancia toma una referencia
+        self._client_key = redis_key(host, port, db)
+        self.redis = get_redis(host, port, db)
+        
+    def close(self) -> None:
+        """Libera la referencia al cliente compartido."""
+        if self.redis is not None:
+            self.redis = None
+            clients.release("redis", self._client_key)
         
     def set_cache(self, key: str, value: Any, 
                  expire: Optional[int] = None) -> bool:
@@ -1,10 +1,8 @@
 import click
 from uruz.config import settings
 from uruz.utils.logging import setup_logging, logger
-from uruz.core.environment import Environment
+from uruz.core.manifest import INDEX_FILENAME, ManifestIndex
 from uruz.security.vault import Vault
-from uruz.core.llm_agent import LLMAgent
-from uruz.core.server_agent import ServerAgent
 from uruz.storage.database_manager import DatabaseManager
 import uvicorn
 import os
@@ -13,8 +11,6 @@ import yaml
 from typing import List
 from .security.credentials import setup_credentials, list_credentials
 
-env = Environment()
-
 @click.group()
 def cli():
     """CLI para el framework Uruz."""
@@ -96,14 +92,8 @@ def create_agent(name: str, type: str):
         # Guardar configuración
         with open(f"agents/{name}.yaml", "w") as f:
             yaml.dump(config, f)
-        
-        # Crear y registrar el agente
-        if type == "llm":
-            agent = LLMAgent(name, config["config"])
-            env.add_agent(agent)
-        elif type == "server":
-            agent = ServerAgent(name, config["config"])
-            env.add_agent(agent)
+        # El agente se construye al usarlo; list-agents y el entorno lo
+        # encuentran al refrescar el índice de manifiestos
         
         click.echo(f"Agente {name} creado exitosamente")
         
@@ -115,8 +105,13 @@ def create_agent(name: str, type: str):
 def list_agents():
     """Lista todos los agentes disponibles."""
     try:
-        env = Environment()
-        agents = env.get_state()["agents"]
+        # Leer el índice compilado sin construir un Environment
+        index = ManifestIndex(
+            settings.URUZ_AGENTS_DIR,
+            os.path.join(settings.URUZ_DATA_DIR, INDEX_FILENAME)
+        )
+        index.refresh()
+        agents = sorted(index.agent_ids())
         click.echo("Agentes activos:")
         for agent in agents:
             click.echo(f"  - {agent}")
@@ -166,7 +161,9 @@ def show_metrics():
             click.echo(f"Timestamp: {metric.timestamp}")
             click.echo(f"Tipo: {metric.request_type}")
             click.echo(f"Tiempo: {metric.processing_time:.2f}s")
-            click.echo(f"Tokens: {metric.tokens_used}")
+            click.echo(f"Tokens: {metric.tokens_used} "
+                       f"(entrada {metric.input_tokens or 0}, salida {metric.output_tokens or 0}, "
+                       f"caché {metric.cached_tokens or 0})")
             click.echo(f"Estado: {'✓' if metric.success else '✗'}")
             if metric.error_message:
                 click.echo(f"Error: {metric.error_message}")
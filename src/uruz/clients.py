@@ -0,0 +1,208 @@
+"""
+Process-wide registry of shared clients.
+
+Creating a Redis connection pool, an LLM SDK client or a SQLAlchemy engine
+per agent opens hundreds of pools and sockets. The registry hands out one
+reference-counted client per endpoint and credentials, with pool sizes taken
+from settings, and closes everything once on shutdown.
+"""
+import asyncio
+import atexit
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def fingerprint(secret: Optional[str]) -> str:
+    """Huella de una credencial para usarla en claves sin exponerla."""
+    return hashlib.sha256((secret or "").encode()).hexdigest()[:16]
+
+class ClientRegistry:
+    """Registro de clientes compartidos con conteo de referencias."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (kind, key) -> [client, refcount, closer]
+        self._entries: Dict[Tuple[str, Hashable], list] = {}
+
+    def acquire(self, kind: str, key: Hashable, factory: Callable[[], Any],
+                closer: Optional[Callable[[Any], Any]] = None) -> Any:
+        """Obtiene el cliente de ``(kind, key)``, creándolo si no existe.
+
+        Args:
+            kind: Tipo de cliente (``redis``, ``anthropic``, ...).
+            key: Endpoint y huella de credenciales que identifican al cliente.
+            factory: Crea el cliente la primera vez.
+            closer: Libera el cliente; puede devolver una corrutina.
+        """
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                entry = [factory(), 0, closer]
+                self._entries[(kind, key)] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, kind: str, key: Hashable) -> None:
+        """Libera una referencia; el cliente se cierra con la última."""
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._entries[(kind, key)]
+        self._close(kind, entry[0], entry[2])
+
+    def refcount(self, kind: str, key: Hashable) -> int:
+        """Número de referencias activas de un cliente."""
+        entry = self._entries.get((kind, key))
+        return entry[1] if entry else 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """Clientes abiertos por tipo."""
+        stats: Dict[str, int] = {}
+        for kind, _ in self._entries:
+            stats[kind] = stats.get(kind, 0) + 1
+        return stats
+
+    def close_all(self) -> None:
+        """Cierra todos los clientes, independientemente de sus referencias."""
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for (kind, _), (client, _, closer) in entries.items():
+            self._close(kind, client, closer)
+
+    async def aclose_all(self) -> None:
+        """Versión asíncrona de ``close_all`` para clientes asíncronos."""
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for (kind, _), (client, _, closer) in entries.items():
+            try:
+                result = closer(client) if closer else None
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Error closing {kind} client: {e}")
+
+    @staticmethod
+    def _close(kind: str, client: Any, closer: Optional[Callable]) -> None:
+        if closer is None:
+            return
+        try:
+            result = closer(client)
+            if asyncio.iscoroutine(result):
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    asyncio.run(result)
+                else:
+                    loop.create_task(result)
+        except Exception as e:
+            logger.warning(f"Error closing {kind} client: {e}")
+
+clients = ClientRegistry()
+atexit.register(clients.close_all)
+
+def redis_key(host: str, port: int, db: int) -> Hashable:
+    return (host, port, db)
+
+def get_redis(host: str = settings.REDIS_HOST, port: int = settings.REDIS_PORT,
+              db: int = 0) -> Any:
+    """Cliente Redis compartido (con su connection pool) por host, puerto y db."""
+    import redis
+
+    def factory():
+        pool = redis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        return redis.Redis(connection_pool=pool)
+
+    return clients.acquire("redis", redis_key(host, port, db), factory,
+                           lambda client: client.connection_pool.disconnect())
+
+def get_async_redis(host: str = settings.REDIS_HOST, port: int = settings.REDIS_PORT,
+                    db: int = 0, decode_responses: bool = True) -> Any:
+    """Cliente ``redis.asyncio`` compartido por host, puerto y db.
+
+    Con ``decode_responses=False`` las respuestas llegan como bytes, para
+    payloads binarios.
+    """
+    import redis.asyncio as aioredis
+
+    def factory():
+        return aioredis.Redis(
+            host=host,
+            port=port,
+            db=db,
+            decode_responses=decode_responses,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+
+    return clients.acquire("redis.asyncio", (*redis_key(host, port, db), decode_responses),
+                           factory, lambda client: client.aclose())
+
+def _llm_http_options(sdk: Any) -> Dict[str, Any]:
+    """Pool HTTP asíncrono y timeouts comunes para los SDK de LLM."""
+    # Usar las clases Limits/Timeout del transporte HTTP que trae cada SDK
+    limits = type(sdk.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS
+    )
+    return {
+        "http_client": sdk.DefaultAsyncHttpxClient(limits=limits),
+        "timeout": sdk.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        # Los reintentos los hace uruz.llm.retry, dentro del plazo de cada petición
+        "max_retries": 0,
+    }
+
+def anthropic_key(api_key: Optional[str]) -> Hashable:
+    return fingerprint(api_key)
+
+def get_anthropic(api_key: Optional[str] = None) -> Any:
+    """Cliente ``AsyncAnthropic`` compartido por API key, con un pool HTTP común."""
+    import anthropic
+
+    def factory():
+        return anthropic.AsyncAnthropic(api_key=api_key, **_llm_http_options(anthropic))
+
+    return clients.acquire("anthropic", anthropic_key(api_key), factory,
+                           lambda client: client.close())
+
+def openai_key(api_key: Optional[str]) -> Hashable:
+    return fingerprint(api_key)
+
+def get_openai(api_key: Optional[str] = None) -> Any:
+    """Cliente ``AsyncOpenAI`` compartido por API key, con un pool HTTP común."""
+    import openai
+
+    def factory():
+        return openai.AsyncOpenAI(api_key=api_key, **_llm_http_options(openai))
+
+    return clients.acquire("openai", openai_key(api_key), factory,
+                           lambda client: client.close())
+
+def get_engine(url: str) -> Any:
+    """Engine SQLAlchemy compartido por URL de conexión."""
+    from sqlalchemy import create_engine
+
+    def factory():
+        options = {}
+        if not url.startswith("sqlite"):
+            options = {
+                "pool_size": settings.DB_POOL_SIZE,
+                "max_overflow": settings.DB_MAX_OVERFLOW,
+                "pool_pre_ping": True,
+            }
+        return create_engine(url, **options)
+
+    return clients.acquire("sqlalchemy", url, factory,
+                           lambda engine: engine.dispose())
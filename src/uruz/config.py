@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -16,6 +16,20 @@ class Settings(BaseSettings):
     URUZ_DATA_DIR: str = "data"
     URUZ_CONFIG_DIR: str = "config"
     
+    # Ejecución de agentes
+    STEP_MAX_CONCURRENCY: int = 64
+    STEP_AGENT_TIMEOUT: float = 30.0
+    WARM_AGENTS: List[str] = []
+    SHARD_COUNT: int = 0  # 0 = un shard por CPU
+    MESSAGE_BROKER: str = "memory"  # memory/redis
+    MAILBOX_CAPACITY: int = 1000
+    MAILBOX_OVERFLOW_POLICY: str = "block"  # block/drop_oldest/reject
+    MAILBOX_BATCH_WINDOW: float = 0.05  # segundos
+    MAILBOX_LANE_WEIGHTS: List[int] = [16, 4, 1]  # carriles de prioridad alta/normal/baja
+    MAILBOX_SCHEDULING: str = "weighted"  # strict/weighted
+    REQUEST_TIMEOUT: float = 30.0  # segundos
+    SNAPSHOT_INTERVAL: float = 60.0  # segundos; 0 = solo al apagar
+    
     # API Keys
     OPENAI_API_KEY: Optional[str] = None
     ANTHROPIC_API_KEY: Optional[str] = None
@@ -26,6 +40,11 @@ class Settings(BaseSettings):
     # Redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+    REDIS_MAX_CONNECTIONS: int = 50
+    # Presupuesto de cada lectura de caché, en segundos. Cubre varios RTT de un
+    # Redis en red y sigue siendo poco frente a la llamada al LLM que ahorra
+    CACHE_TIMEOUT: float = 0.05
+    CACHE_WRITE_TIMEOUT: float = 1.0  # escrituras en segundo plano
     
     # API Server
     API_HOST: str = "0.0.0.0"
@@ -33,9 +52,38 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///data/storage/uruz.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
     
     # LLM Configuration
     DEFAULT_LLM_PROVIDER: str = "anthropic"
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_TIMEOUT: float = 60.0  # segundos por petición
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_MAX_RETRIES: int = 2  # reintentos de uruz.llm.retry; los SDK no reintentan
+    LLM_RETRY_BASE_DELAY: float = 0.5  # segundos, se duplica en cada reintento
+    LLM_RETRY_MAX_DELAY: float = 8.0
+    LLM_DEADLINE: float = 120.0  # segundos por petición, reintentos incluidos
+    LLM_HEDGE: bool = False  # segunda petición si la primera pasa del percentil
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MAX_RATIO: float = 0.1  # fracción máxima de peticiones duplicadas
+    LLM_SINGLEFLIGHT_LOCK_MS: int = 0  # lock entre procesos; 0 = solo dentro del proceso
+    # Límites por "proveedor" o "proveedor:modelo": {"rpm": ..., "tpm": ...}
+    LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = {}
+    LLM_RATE_LIMIT_BACKEND: str = "local"  # local/redis (compartido entre procesos)
+    LLM_CONCURRENCY_INITIAL: int = 16  # peticiones en curso al arrancar; luego AIMD
+    LLM_CONCURRENCY_MIN: int = 1
+    LLM_LATENCY_TOLERANCE: float = 2.0  # latencia/referencia que cuenta como congestión
+    LLM_CONTEXT_WINDOW: Optional[int] = None  # modelos sin ventana conocida; None = sin recorte
+    LLM_PROMPT_OVERFLOW: str = "trim"  # trim/reject para prompts que no caben
+    LLM_EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    LLM_EMBED_BATCH_SIZE: int = 256  # textos por petición de embeddings
+    LLM_EMBED_BATCH_WINDOW: float = 0.005  # segundos
+    LLM_SEMANTIC_CACHE: bool = False  # caché por similitud de prompts, por agente
+    LLM_SEMANTIC_EMBEDDER: str = "openai"  # modelo de embeddings de la caché semántica
+    LLM_SEMANTIC_THRESHOLD: float = 0.95  # similitud coseno mínima
+    LLM_SEMANTIC_CAPACITY: int = 1000  # respuestas por agente
     LLM_CONFIG: Dict[str, Any] = {
         "model": "claude-3-haiku-20240307",
         "temperature": 0.7,
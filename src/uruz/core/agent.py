@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 class Agent(ABC):
     """Clase base para todos los agentes."""
@@ -13,7 +13,29 @@ class Agent(ABC):
         """Procesar un mensaje entrante."""
         pass
     
+    async def process_messages(self, batch: List[Any]) -> List[Dict[str, Any]]:
+        """Procesar un lote de mensajes.
+        
+        Los agentes que declaran ``batch_size`` en su configuración reciben
+        los mensajes del broker agrupados aquí. La implementación por
+        defecto los procesa uno a uno; se puede sobrescribir para resolver
+        todo el lote en una sola operación.
+        """
+        return [await self.process_message(message) for message in batch]
+    
     @abstractmethod
     async def act(self) -> List[Dict[str, Any]]:
         """Realizar acciones autónomas."""
+        pass
+    
+    def get_state(self) -> Optional[Dict[str, Any]]:
+        """Estado en memoria a conservar entre reinicios (opcional)."""
+        return None
+    
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """Restaura el estado guardado por get_state()."""
+        pass
+    
+    def close(self) -> None:
+        """Libera los clientes compartidos del agente al retirarlo del entorno."""
         pass 
\ No newline at end of file
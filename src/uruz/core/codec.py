@@ -0,0 +1,55 @@
+"""
+Binary wire codec for messages.
+
+Messages that cross a process or Redis boundary are packed with msgpack as
+a fixed-order array prefixed by a format version, which is smaller and
+faster to encode and decode than the JSON of ``Message.to_dict()``. A
+decoder rejects versions it does not know instead of guessing.
+
+Content and metadata must be made of msgpack types (dicts, lists, str,
+bytes, numbers, bool and None).
+"""
+import msgpack
+from .message import Message
+
+CODEC_VERSION = 1
+# Campos del payload, sin contar la versión
+_FIELD_COUNT = 11
+
+class CodecError(ValueError):
+    """Error al codificar o decodificar un mensaje."""
+
+def encode(message: Message) -> bytes:
+    """Serializa un mensaje."""
+    try:
+        return msgpack.packb([
+            CODEC_VERSION,
+            message.id,
+            message.sender_id,
+            message.receiver_id,
+            message.content,
+            message.created_at,
+            message.type,
+            message.metadata,
+            message.topic,
+            message.correlation_id,
+            message.reply_to,
+            message.priority,
+        ], use_bin_type=True)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise CodecError(f"Cannot encode message {message.id}: {e}") from e
+
+def decode(data: bytes) -> Message:
+    """Reconstruye un mensaje serializado con ``encode``."""
+    try:
+        fields = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except Exception as e:
+        raise CodecError(f"Invalid message payload: {e}") from e
+    if not isinstance(fields, list) or not fields:
+        raise CodecError("Invalid message payload")
+    if fields[0] != CODEC_VERSION:
+        raise CodecError(f"Unsupported message codec version: {fields[0]}")
+    if len(fields) - 1 != _FIELD_COUNT:
+        raise CodecError(f"Invalid message payload: expected {_FIELD_COUNT} fields, "
+                         f"got {len(fields) - 1}")
+    return Message(*fields[1:])
@@ -1,18 +1,46 @@
 """
 Environment module for Uruz Framework.
 """
+import asyncio
+import logging
 import os
+import time
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import yaml
 from ..config import settings
+from .manifest import INDEX_FILENAME, ManifestIndex
+from .message import PRIORITY_NORMAL, Message, MessageBroker
+from .pool import AgentPool
+from .scheduler import Scheduler, parse_schedule
+from .snapshot import SNAPSHOT_FILENAME, load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
 
 class Environment:
     """Manages the environment and agents for Uruz Framework."""
     
-    def __init__(self):
-        """Initialize the environment."""
+    def __init__(self, max_concurrency: Optional[int] = None,
+                 agent_timeout: Optional[float] = None,
+                 message_broker: Optional[MessageBroker] = None):
+        """Initialize the environment.
+        
+        Args:
+            max_concurrency: Maximum number of agents acting at the same time
+                during a step.
+            agent_timeout: Default time in seconds an agent may spend in act().
+            message_broker: Broker to use; defaults to the one selected by
+                settings.MESSAGE_BROKER ("memory" or "redis").
+        """
         self.agents = {}
+        self._manifests: Dict[str, Dict[str, Any]] = {}
+        self._pending_states: Dict[str, Dict[str, Any]] = {}
+        self.message_broker = message_broker or self._create_broker()
+        self.message_broker.resolver = self.get_agent
+        self.scheduler = Scheduler()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.max_concurrency = max_concurrency or settings.STEP_MAX_CONCURRENCY
+        self.agent_timeout = agent_timeout or settings.STEP_AGENT_TIMEOUT
         self.agents_dir = os.getenv('URUZ_AGENTS_DIR', 'agents')
         self.data_dir = os.getenv('URUZ_DATA_DIR', 'data')
         self.config_dir = os.getenv('URUZ_CONFIG_DIR', 'config')
@@ -22,48 +50,338 @@ class Environment:
             Path(dir_path).mkdir(parents=True, exist_ok=True)
         
         # Cargar agentes existentes
+        self.manifest_index = ManifestIndex(
+            self.agents_dir, os.path.join(self.data_dir, INDEX_FILENAME)
+        )
         self._load_agents()
     
+    @staticmethod
+    def _create_broker() -> MessageBroker:
+        """Create the broker selected in settings."""
+        if settings.MESSAGE_BROKER == 'redis':
+            from .redis_broker import RedisStreamBroker
+            return RedisStreamBroker()
+        return MessageBroker()
+    
     def _load_agents(self):
-        """Load agents from YAML files."""
-        if not os.path.exists(self.agents_dir):
-            return
+        """Load agent manifests from the compiled index.
+        
+        Agents are not instantiated here; each one is built on its first
+        get_agent() call (or by warm_up()), so startup cost scales with the
+        agents actually used rather than with the agents defined. Only YAML
+        files that changed since the index was written are re-parsed.
+        """
+        self.manifest_index.refresh()
+        for agent_id, manifest in self.manifest_index.manifests().items():
+            self._register_manifest(agent_id, manifest)
+    
+    def reload(self) -> List[str]:
+        """Apply manifest changes made on disk since the last load.
+        
+        Only agents whose manifest changed or disappeared are affected.
+        Changed agents that were already built are rebuilt right away; the
+        rest will be built on their next use.
+        
+        Returns:
+            The IDs of the agents that changed or were removed.
+        """
+        changed, removed = self.manifest_index.refresh()
+        manifests = self.manifest_index.manifests()
+        
+        for agent_id in removed:
+            self._manifests.pop(agent_id, None)
+            self._drop_agent(agent_id)
+        
+        for agent_id in changed:
+            was_built = self._drop_agent(agent_id)
+            self._register_manifest(agent_id, manifests[agent_id])
+            if was_built:
+                self.get_agent(agent_id)
+        
+        return changed + removed
+    
+    async def watch_manifests(self, interval: float = 2.0,
+                              stop_event: Optional[asyncio.Event] = None) -> None:
+        """Periodically reload manifests until stop_event is set."""
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            try:
+                changes = self.reload()
+                if changes:
+                    logger.info(f"Reloaded agents: {', '.join(changes)}")
+            except Exception as e:
+                logger.error(f"Error reloading agent manifests: {e}")
+            try:
+                await asyncio.wait_for(stop_event.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _drop_agent(self, agent_id: str) -> bool:
+        """Forget a built agent. Returns whether it had been built."""
+        agent = self.agents.pop(agent_id, None)
+        self.message_broker.unsubscribe(agent_id)
+        self.message_broker.topics.remove_subscriber(agent_id)
+        self.scheduler.remove(agent_id)
+        if agent is not None and hasattr(agent, 'close'):
+            # Libera sus referencias en el registro de clientes compartidos
+            try:
+                agent.close()
+            except Exception as e:
+                logger.error(f"Error closing agent {agent_id}: {e}")
+        return agent is not None
+    
+    def _register_manifest(self, agent_id: str, manifest: Dict[str, Any]) -> None:
+        """Register a parsed manifest so the agent can be built on demand."""
+        self._manifests[agent_id] = manifest
+        
+        # Los tópicos se suscriben antes de construir el agente
+        for pattern in (manifest.get('config') or {}).get('topics', []):
+            self.message_broker.subscribe_topic(pattern, agent_id)
+        
+        # Los agentes con schedule deben construirse cuando les toque actuar
+        schedule = parse_schedule(manifest.get('config'))
+        if schedule is not None and agent_id not in self.agents:
+            self.scheduler.add(agent_id, schedule)
+    
+    def _build_agent(self, agent_id: str) -> Any:
+        """Instantiate an agent from its manifest without registering it.
+        
+        Manifests that declare ``replicas`` produce an AgentPool, which
+        behaves like a single agent.
+        """
+        manifest = self._manifests[agent_id]
+        config = manifest.get('config') or {}
+        
+        # Importar dinámicamente la clase del agente
+        if 'agent_class' in config:
+            module_path, class_name = config['agent_class'].rsplit('.', 1)
+            module = __import__(module_path, fromlist=[class_name])
+            agent_class = getattr(module, class_name)
+        elif manifest.get('type') == 'server':
+            from ..core.server_agent import ServerAgent
+            agent_class = ServerAgent
+        else:
+            from ..core.llm_agent import LLMAgent
+            agent_class = LLMAgent
+        
+        replicas = manifest.get('replicas')
+        if replicas and replicas != 1:
+            return AgentPool.from_manifest(
+                agent_id, lambda: agent_class(agent_id, config), replicas
+            )
+        return agent_class(agent_id, config)
+    
+    async def warm_up(self, agent_ids: Optional[List[str]] = None) -> List[str]:
+        """Build the given agents in parallel ahead of their first use.
+        
+        Args:
+            agent_ids: Agents to build; defaults to settings.WARM_AGENTS.
             
-        for filename in os.listdir(self.agents_dir):
-            if filename.endswith('.yaml'):
-                agent_path = os.path.join(self.agents_dir, filename)
-                try:
-                    with open(agent_path) as f:
-                        config = yaml.safe_load(f)
-                        agent_id = os.path.splitext(filename)[0]
-                        
-                        # Importar dinámicamente la clase del agente
-                        if 'agent_class' in config.get('config', {}):
-                            module_path, class_name = config['config']['agent_class'].rsplit('.', 1)
-                            module = __import__(module_path, fromlist=[class_name])
-                            agent_class = getattr(module, class_name)
-                        else:
-                            from ..core.llm_agent import LLMAgent
-                            agent_class = LLMAgent
-                        
-                        # Crear instancia del agente
-                        agent = agent_class(agent_id, config.get('config', {}))
-                        self.add_agent(agent)
-                        
-                except Exception as e:
-                    print(f"Error loading agent {filename}: {e}")
+        Returns:
+            The IDs of the agents that are ready.
+        """
+        if agent_ids is None:
+            agent_ids = settings.WARM_AGENTS
+        pending = [agent_id for agent_id in agent_ids
+                   if agent_id in self._manifests and agent_id not in self.agents]
+        
+        loop = asyncio.get_running_loop()
+        outcomes = await asyncio.gather(
+            *(loop.run_in_executor(None, self._build_agent, agent_id)
+              for agent_id in pending),
+            return_exceptions=True
+        )
+        for agent_id, agent in zip(pending, outcomes):
+            if isinstance(agent, Exception):
+                logger.error(f"Error building agent {agent_id}: {agent}")
+            elif agent_id not in self.agents:
+                self.add_agent(agent)
+        
+        return [agent_id for agent_id in agent_ids if agent_id in self.agents]
     
     def add_agent(self, agent: Any) -> None:
-        """Add an agent to the environment."""
+        """Add an agent to the environment, replacing any agent with the same ID."""
+        previous = self.agents.get(agent.agent_id)
         self.agents[agent.agent_id] = agent
+        state = self._pending_states.pop(agent.agent_id, None)
+        if state is not None and hasattr(agent, 'set_state'):
+            agent.set_state(state)
+        config = agent.config or {}
+        if config.get('batch_size') and hasattr(agent, 'process_messages'):
+            self.message_broker.subscribe(
+                agent.agent_id, agent.process_messages,
+                batch_size=config['batch_size'],
+                batch_window=config.get('batch_window', settings.MAILBOX_BATCH_WINDOW)
+            )
+        else:
+            self.message_broker.subscribe(agent.agent_id, agent.process_message)
+        if previous is not None and previous is not agent:
+            # Se quitan después de suscribir la nueva instancia: el mailbox
+            # sigue abierto y conserva los mensajes pendientes
+            for callback in (previous.process_message,
+                             getattr(previous, 'process_messages', None)):
+                if callback is not None:
+                    self.message_broker.unsubscribe(agent.agent_id, callback)
+        mailbox = self.message_broker.subscribers.get(agent.agent_id)
+        if mailbox is not None and hasattr(agent, 'attach_mailbox'):
+            agent.attach_mailbox(mailbox)
+        for pattern in (agent.config or {}).get('topics', []):
+            self.message_broker.subscribe_topic(pattern, agent.agent_id)
+        
+        schedule = parse_schedule(agent.config)
+        if schedule is not None:
+            self.scheduler.add(agent.agent_id, schedule)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        else:
+            self.scheduler.remove(agent.agent_id)
+    
+    async def step(self) -> List[Dict[str, Any]]:
+        """Run act() on every agent that is due and collect their actions.
+        
+        Agents without a schedule act on every step; scheduled agents only
+        act once their deadline has passed. Actions that carry a ``topic``
+        key are also published to the agents subscribed to that topic.
+        Agents that fail or exceed their timeout do not abort the step; they
+        contribute an error entry instead.
+        """
+        popped = self.scheduler.pop_due()
+        try:
+            due = [agent_id for agent_id in popped
+                   if self.get_agent(agent_id) is not None]
+            agents = [agent for agent_id, agent in self.agents.items()
+                      if agent_id not in self.scheduler]
+            agents.extend(self.agents[agent_id] for agent_id in due)
+            if not agents:
+                return []
+            
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            outcomes = await asyncio.gather(
+                *(self._act(agent, semaphore) for agent in agents)
+            )
+        finally:
+            # También los que no se pudieron construir: se reintentan en su
+            # siguiente deadline en lugar de quedar fuera del heap
+            for agent_id in popped:
+                self.scheduler.reschedule(agent_id)
+        
+        results = []
+        for actions in outcomes:
+            results.extend(actions)
+        return results
+    
+    async def _publish_actions(self, agent_id: str,
+                               actions: List[Dict[str, Any]]) -> None:
+        """Publish the actions that name a topic to its subscribers.
+        
+        An action may set ``priority`` to pick the receivers' mailbox lane.
+        """
+        for action in actions:
+            topic = action.get("topic") if isinstance(action, dict) else None
+            if topic:
+                message = Message.create(
+                    sender_id=agent_id,
+                    receiver_id=topic,
+                    content=action,
+                    type=action.get("type", "event"),
+                    priority=action.get("priority", PRIORITY_NORMAL)
+                )
+                await self.message_broker.publish_topic(topic, message)
+    
+    async def run(self, on_results: Optional[Any] = None,
+                  tick: Optional[float] = None,
+                  stop_event: Optional[asyncio.Event] = None) -> None:
+        """Run steps until stop_event is set.
+        
+        The loop sleeps until the next scheduled agent is due instead of
+        polling every agent. Agents without a schedule act whenever the loop
+        wakes up; pass ``tick`` to bound the sleep so they act at least that
+        often.
+        
+        Args:
+            on_results: Optional callable (sync or async) receiving the
+                actions of each step.
+            tick: Maximum number of seconds to sleep between steps.
+            stop_event: Event that ends the loop when set.
+        """
+        stop_event = stop_event or asyncio.Event()
+        self._wakeup = asyncio.Event()
+        try:
+            while not stop_event.is_set():
+                results = await self.step()
+                if results and on_results is not None:
+                    outcome = on_results(results)
+                    if asyncio.iscoroutine(outcome):
+                        await outcome
+                
+                timeout = tick
+                deadline = self.scheduler.next_deadline()
+                if deadline is not None:
+                    delay = max(0.0, deadline - time.monotonic())
+                    timeout = delay if timeout is None else min(timeout, delay)
+                
+                self._wakeup.clear()
+                waiters = [asyncio.ensure_future(self._wakeup.wait()),
+                           asyncio.ensure_future(stop_event.wait())]
+                try:
+                    await asyncio.wait(waiters, timeout=timeout,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for waiter in waiters:
+                        waiter.cancel()
+        finally:
+            self._wakeup = None
+    
+    async def _act(self, agent: Any,
+                   semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        """Run a single agent's act() within the concurrency and time limits."""
+        timeout = (agent.config or {}).get("timeout", self.agent_timeout)
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout if timeout is not None else None
+            try:
+                actions = list(await asyncio.wait_for(agent.act(), timeout) or [])
+            except asyncio.TimeoutError:
+                logger.warning(f"Agent {agent.agent_id} timed out after {timeout}s")
+                return [{
+                    "type": "error",
+                    "agent_id": agent.agent_id,
+                    "message": f"act() timed out after {timeout}s"
+                }]
+            except Exception as e:
+                logger.error(f"Error in agent {agent.agent_id}: {e}")
+                return [{
+                    "type": "error",
+                    "agent_id": agent.agent_id,
+                    "message": str(e)
+                }]
+            # El reparto a los topics comparte el plazo de act(): con la
+            # política "block" un buzón lleno no puede bloquear el step
+            remaining = max(deadline - loop.time(), 0) if deadline is not None else None
+            try:
+                await asyncio.wait_for(self._publish_actions(agent.agent_id, actions), remaining)
+            except asyncio.TimeoutError:
+                logger.warning(f"Agent {agent.agent_id} timed out publishing its actions; "
+                               f"some topic subscribers did not receive them")
+            except Exception as e:
+                logger.error(f"Error publishing actions of agent {agent.agent_id}: {e}")
+            return actions
     
     def get_agent(self, agent_id: str) -> Any:
-        """Get an agent by ID."""
-        return self.agents.get(agent_id)
+        """Get an agent by ID, building it from its manifest on first use."""
+        agent = self.agents.get(agent_id)
+        if agent is None and agent_id in self._manifests:
+            try:
+                agent = self._build_agent(agent_id)
+            except Exception as e:
+                logger.error(f"Error building agent {agent_id}: {e}")
+                return None
+            self.add_agent(agent)
+        return agent
     
     def list_agents(self) -> List[str]:
-        """List all agent IDs."""
-        return list(self.agents.keys())
+        """List all agent IDs, including those not built yet."""
+        return list(dict.fromkeys([*self._manifests, *self.agents]))
     
     def get_state(self) -> Dict[str, Any]:
         """Get the current state of the environment."""
@@ -76,6 +394,63 @@ class Environment:
             }
         }
     
+    def save_snapshot(self, path: Optional[str] = None) -> str:
+        """Save agent state and warm-up hints to a local file.
+        
+        Returns:
+            The path of the snapshot file.
+        """
+        path = path or os.path.join(self.data_dir, SNAPSHOT_FILENAME)
+        states = {}
+        for agent_id, agent in self.agents.items():
+            state = agent.get_state() if hasattr(agent, 'get_state') else None
+            if state is not None:
+                states[agent_id] = state
+        # Conservar el estado de agentes restaurados que aún no se usaron
+        states = {**self._pending_states, **states}
+        save_snapshot(path, states, list(self.agents))
+        return path
+    
+    def restore_snapshot(self, path: Optional[str] = None) -> List[str]:
+        """Restore a snapshot saved by save_snapshot().
+        
+        Agent state is applied when each agent is built. Agents whose
+        manifest is no longer in the agents directory are ignored, so the
+        YAML files stay the source of truth.
+        
+        Returns:
+            The agents that were built when the snapshot was taken, to be
+            passed to warm_up().
+        """
+        data = load_snapshot(path or os.path.join(self.data_dir, SNAPSHOT_FILENAME))
+        if data is None:
+            return []
+        
+        for agent_id, state in data['states'].items():
+            agent = self.agents.get(agent_id)
+            if agent is not None and hasattr(agent, 'set_state'):
+                agent.set_state(state)
+            elif agent_id in self._manifests:
+                self._pending_states[agent_id] = state
+        
+        return [agent_id for agent_id in data['warm_agents']
+                if agent_id in self._manifests or agent_id in self.agents]
+    
+    async def snapshot_periodically(self, interval: Optional[float] = None,
+                                    stop_event: Optional[asyncio.Event] = None) -> None:
+        """Save a snapshot every ``interval`` seconds until stop_event is set."""
+        interval = interval or settings.SNAPSHOT_INTERVAL
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                logger.error(f"Error saving environment snapshot: {e}")
+    
     def save_agent_config(self, agent_id: str, config: Dict[str, Any]) -> None:
         """Save agent configuration to YAML file."""
         config_path = os.path.join(self.agents_dir, f"{agent_id}.yaml")
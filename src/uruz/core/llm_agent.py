@@ -1,6 +1,18 @@
-from typing import Dict, Any, List
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, Any, List
 from .agent import Agent
+from .message import Message
 from ..llm import get_provider
+from ..llm.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+BATCH_PROMPT = """Responde a cada una de las siguientes solicitudes de forma independiente.
+Devuelve únicamente un array JSON de {count} strings, con las respuestas en el mismo orden.
+
+{requests}"""
 
 class LLMAgent(Agent):
     """Agente que usa un modelo de lenguaje."""
@@ -12,11 +24,104 @@ class LLMAgent(Agent):
             raise ValueError(f"Provider {config.get('provider')} not found")
         self.llm = provider_class(config)
     
+    def close(self) -> None:
+        """Libera los clientes compartidos del proveedor."""
+        self.llm.close()
+    
+    @staticmethod
+    def _get_prompt(message: Any) -> str:
+        """Extrae el texto de un mensaje de la API o del broker."""
+        content = message.content if isinstance(message, Message) else message["content"]
+        if isinstance(content, dict):
+            content = content.get("content", content.get("text", json.dumps(content)))
+        return str(content)
+    
     async def process_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """Procesa un mensaje usando el LLM."""
-        response = await self.llm.generate(message["content"])
+        response = await self.llm.generate(self._get_prompt(message))
         return {"response": response}
     
+    async def process_message_stream(self, message: Dict[str, Any]) -> AsyncIterator[str]:
+        """Procesa un mensaje emitiendo la respuesta del LLM según se genera."""
+        async for chunk in self.llm.stream(self._get_prompt(message)):
+            yield chunk
+    
+    async def process_messages(self, batch: List[Any]) -> List[Dict[str, Any]]:
+        """Responde un lote de mensajes con una sola llamada al LLM.
+        
+        Los prompts ya cacheados se responden con una sola consulta a la
+        caché y solo el resto va al LLM. Si la respuesta no es un array JSON
+        con una respuesta por mensaje, se procesan los mensajes por separado.
+        """
+        if len(batch) == 1:
+            return [await self.process_message(batch[0])]
+        
+        prompts = [self._get_prompt(message) for message in batch]
+        answers = await self.llm.cached_responses(prompts)
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if len(missing) == 1:
+            answers[missing[0]] = await self.llm.generate(prompts[missing[0]])
+        elif missing:
+            generated = await self._generate_batch([prompts[i] for i in missing])
+            for i, answer in zip(missing, generated):
+                answers[i] = answer
+        return [{"response": answer} for answer in answers]
+    
+    @staticmethod
+    def _parse_batch(text: str) -> Any:
+        """Lee el array JSON de una respuesta de lote, aunque venga en un bloque ```json."""
+        start, end = text.find("["), text.rfind("]")
+        if start == -1 or end < start:
+            raise ValueError("No JSON array in batch response")
+        return json.loads(text[start:end + 1])
+    
+    def _split_batch(self, prompts: List[str]) -> List[List[str]]:
+        """Reparte los prompts en lotes cuyo prompt completo quepa en la ventana del modelo.
+        
+        Un prompt de lote no se puede recortar: perdería solicitudes y el
+        modelo podría inventar sus respuestas.
+        """
+        budget = self.llm._prompt_budget()
+        if budget is None:
+            return [prompts]
+        # La suma de las estimaciones por línea acota la estimación del prompt entero
+        overhead = estimate_tokens(BATCH_PROMPT.format(count=len(prompts), requests=""))
+        chunks, chunk, used = [], [], overhead
+        for prompt in prompts:
+            tokens = estimate_tokens(f"{len(chunk) + 1}. {prompt}\n")
+            if chunk and used + tokens > budget:
+                chunks.append(chunk)
+                chunk, used = [], overhead
+                tokens = estimate_tokens(f"1. {prompt}\n")
+            chunk.append(prompt)
+            used += tokens
+        chunks.append(chunk)
+        return chunks
+    
+    async def _generate_batch(self, prompts: List[str]) -> List[str]:
+        """Genera las respuestas de varios prompts con una llamada por lote que quepa."""
+        chunks = self._split_batch(prompts)
+        if len(chunks) > 1:
+            generated = await asyncio.gather(*(self._generate_batch(chunk) for chunk in chunks))
+            return [answer for answers in generated for answer in answers]
+        if len(prompts) == 1:
+            # No cabe junto a otros: va solo, con la política de desborde del agente
+            return [await self.llm.generate(prompts[0])]
+        requests = "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(prompts, 1))
+        prompt = BATCH_PROMPT.format(count=len(prompts), requests=requests)
+        try:
+            answers = self._parse_batch(await self.llm.generate(prompt))
+            if isinstance(answers, list) and len(answers) == len(prompts):
+                # No se cachean por prompt: salieron de un prompt compartido con
+                # otros remitentes, que podrían haber condicionado la respuesta
+                return [str(answer) for answer in answers]
+        except ValueError:
+            pass
+        
+        logger.warning(f"Agent {self.agent_id} got an invalid batch response; "
+                       f"processing {len(prompts)} messages one by one")
+        return list(await asyncio.gather(*(self.llm.generate(prompt) for prompt in prompts)))
+    
     async def act(self) -> List[Dict[str, Any]]:
         """Este agente no realiza acciones autónomas."""
-        return [] 
\ No newline at end of file
+        return []
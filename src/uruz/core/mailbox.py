@@ -0,0 +1,353 @@
+"""
+Bounded per-agent mailboxes.
+
+Each subscribed agent gets its own queue and a dedicated consumer task, so
+publishing a message only waits for it to be enqueued, never for the
+receiver to process it. When a mailbox is full the configured overflow
+policy decides whether the publisher waits, the oldest message is dropped
+or the new message is rejected.
+
+Mailboxes can also group messages into micro-batches, closed when
+``batch_size`` messages are waiting or ``batch_window`` seconds have passed
+since the first one, for handlers that process a whole batch at once.
+
+Messages are queued in one FIFO lane per ``priority`` (0 is the most
+urgent), so control messages do not wait behind a backlog of bulk work.
+Lanes are served either strictly by priority or by weighted round robin,
+which still lets lower lanes progress, and the time each message waited in
+its lane is measured per lane.
+
+Batches are delivered one at a time unless ``concurrency`` is raised, as
+an agent pool does to keep each of its replicas busy.
+
+For messages that expect a reply (``reply_to`` set), the value returned by
+the handler, or the error it raised, is passed to ``on_reply``.
+"""
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+REJECT = "reject"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, REJECT)
+
+STRICT = "strict"
+WEIGHTED = "weighted"
+SCHEDULING_POLICIES = (STRICT, WEIGHTED)
+
+class MailboxFullError(Exception):
+    """Se lanza cuando un mailbox con política ``reject`` está lleno.
+
+    ``messages`` son los mensajes que no se encolaron.
+    """
+
+    def __init__(self, message: str, messages: Optional[List[Any]] = None):
+        super().__init__(message)
+        self.messages = messages or []
+
+class LaneQueue(asyncio.Queue):
+    """asyncio.Queue con un carril FIFO por prioridad y espera medida por carril.
+
+    La capacidad es común a todos los carriles. El carril de cada mensaje es
+    su atributo ``priority``, acotado al número de carriles.
+    """
+
+    def __init__(self, maxsize: int = 0, weights: Tuple[int, ...] = (1,),
+                 scheduling: str = WEIGHTED):
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {scheduling}")
+        if not weights or min(weights) < 1:
+            raise ValueError("Lane weights must be positive integers")
+        self.weights = tuple(weights)
+        self.scheduling = scheduling
+        lanes = len(self.weights)
+        self.dequeued = [0] * lanes
+        self.total_wait = [0.0] * lanes
+        self.max_wait = [0.0] * lanes
+        # Crédito acumulado de cada carril (round robin ponderado suave)
+        self._credit = [0] * lanes
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = [collections.deque() for _ in self.weights]
+        self._size = 0
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def lane_depths(self) -> List[int]:
+        """Mensajes pendientes en cada carril."""
+        return [len(lane) for lane in self._queue]
+
+    def _put(self, item: Any) -> None:
+        # Sin prioridad, el carril normal (PRIORITY_NORMAL de core.message)
+        lane = min(max(getattr(item, "priority", 1), 0), len(self._queue) - 1)
+        self._queue[lane].append((time.monotonic(), item))
+        self._size += 1
+
+    def _get(self) -> Any:
+        lane = self._next_lane()
+        enqueued_at, item = self._queue[lane].popleft()
+        self._size -= 1
+        waited = time.monotonic() - enqueued_at
+        self.dequeued[lane] += 1
+        self.total_wait[lane] += waited
+        if waited > self.max_wait[lane]:
+            self.max_wait[lane] = waited
+        return item
+
+    def _next_lane(self) -> int:
+        ready = [lane for lane, items in enumerate(self._queue) if items]
+        if self.scheduling == STRICT or len(ready) == 1:
+            return ready[0]
+        total = 0
+        for lane in ready:
+            self._credit[lane] += self.weights[lane]
+            total += self.weights[lane]
+        chosen = max(ready, key=lambda lane: self._credit[lane])
+        self._credit[chosen] -= total
+        return chosen
+
+    def pop_lowest(self) -> Any:
+        """Saca el mensaje más antiguo del carril menos urgente con mensajes."""
+        for lane in reversed(self._queue):
+            if lane:
+                self._size -= 1
+                item = lane.popleft()[1]
+                self._wakeup_next(self._putters)
+                return item
+        raise asyncio.QueueEmpty
+
+    def get_lane_stats(self) -> List[Dict[str, Any]]:
+        """Profundidad y tiempos de espera de cada carril."""
+        return [
+            {
+                "lane": lane,
+                "weight": self.weights[lane],
+                "depth": len(self._queue[lane]),
+                "dequeued": self.dequeued[lane],
+                "avg_wait": (self.total_wait[lane] / self.dequeued[lane]
+                             if self.dequeued[lane] else 0.0),
+                "max_wait": self.max_wait[lane],
+            }
+            for lane in range(len(self._queue))
+        ]
+
+class Mailbox:
+    """Cola acotada de mensajes de un agente con su tarea consumidora."""
+
+    def __init__(self, agent_id: str, capacity: int = 1000,
+                 overflow_policy: str = BLOCK, batch_size: int = 1,
+                 batch_window: float = 0.0,
+                 lane_weights: Optional[List[int]] = None,
+                 scheduling: str = WEIGHTED):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {scheduling}")
+        self.agent_id = agent_id
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        self.lane_weights = tuple(lane_weights or (1,))
+        self.scheduling = scheduling
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        # Lotes que se entregan a la vez; más de uno solo si el handler lo admite
+        self.concurrency = 1
+        # Los handlers reciben un mensaje; los batch_handlers, una lista
+        self.handlers: List[Callable] = []
+        self.batch_handlers: List[Callable] = []
+        # Callback opcional invocado con cada lote: mensajes entregados y fallidos
+        self.on_delivered: Optional[Callable[[List[Any], List[Any]], None]] = None
+        # Callback opcional con los mensajes descartados sin entregar: los que
+        # tiró la política drop_oldest y los abandonados al cerrar el mailbox
+        self.on_discarded: Optional[Callable[[List[Any], List[Any]], None]] = None
+        # Corrutina opcional que responde (mensaje, resultado, error) a un request
+        self.on_reply: Optional[Callable[[Any, Any, Optional[Exception]], Any]] = None
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self._queue: Optional[LaneQueue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._active: Set[asyncio.Task] = set()
+
+    @property
+    def depth(self) -> int:
+        """Número de mensajes pendientes."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def put(self, message: Any) -> None:
+        """Encola un mensaje aplicando la política de desborde."""
+        queue = self._start()
+        if queue.full():
+            if self.overflow_policy == REJECT:
+                self.rejected += 1
+                raise MailboxFullError(f"Mailbox for {self.agent_id} is full", [message])
+            if self.overflow_policy == DROP_OLDEST:
+                # Se descarta de los carriles menos urgentes
+                dropped = queue.pop_lowest()
+                queue.task_done()
+                self.dropped += 1
+                self._discard([dropped], [])
+        await queue.put(message)
+
+    async def put_many(self, messages: List[Any]) -> None:
+        """Encola varios mensajes; sin esperas si caben todos.
+
+        Raises:
+            MailboxFullError: Con política ``reject``, tras intentar todos,
+                con los mensajes que no cupieron.
+        """
+        queue = self._start()
+        if self.capacity <= 0 or queue.qsize() + len(messages) <= self.capacity:
+            for message in messages:
+                queue.put_nowait(message)
+            return
+        rejected = []
+        for message in messages:
+            try:
+                await self.put(message)
+            except MailboxFullError:
+                rejected.append(message)
+        if rejected:
+            raise MailboxFullError(f"Mailbox for {self.agent_id} is full", rejected)
+
+    async def join(self) -> None:
+        """Espera a que se procesen todos los mensajes encolados."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def close(self) -> None:
+        """Detiene la tarea consumidora; los mensajes pendientes se descartan."""
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        for task in self._active:
+            task.cancel()
+        if self._queue is not None:
+            abandoned = []
+            while not self._queue.empty():
+                abandoned.append(self._queue.get_nowait())
+                self._queue.task_done()
+            self._discard([], abandoned)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores del mailbox."""
+        return {
+            "depth": self.depth,
+            "capacity": self.capacity,
+            "overflow_policy": self.overflow_policy,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "concurrency": self.concurrency,
+            "scheduling": self.scheduling,
+            "lanes": self._queue.get_lane_stats() if self._queue is not None else [],
+        }
+
+    def _start(self) -> LaneQueue:
+        # La cola y el consumidor se crean dentro del loop que los usa
+        if self._queue is None:
+            self._queue = LaneQueue(self.capacity, self.lane_weights, self.scheduling)
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.ensure_future(self._consume())
+        return self._queue
+
+    async def _consume(self) -> None:
+        while True:
+            if len(self._active) >= self.concurrency:
+                await asyncio.wait(self._active, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            batch = await self._next_batch()
+            if self.concurrency <= 1 and not self._active:
+                await self._process(batch)
+                continue
+            task = asyncio.ensure_future(self._process(batch))
+            self._active.add(task)
+            task.add_done_callback(self._active.discard)
+
+    async def _process(self, batch: List[Any]) -> None:
+        try:
+            await self._deliver(batch)
+        except asyncio.CancelledError:
+            # Cerrado a mitad de la entrega: el lote queda sin confirmar
+            self._discard([], batch)
+            raise
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _next_batch(self) -> List[Any]:
+        """Espera un mensaje y agrupa los siguientes según tamaño y ventana."""
+        batch = [await self._queue.get()]
+        if self.batch_size == 1:
+            return batch
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _deliver(self, batch: List[Any]) -> None:
+        # Primer resultado (o error) de cada mensaje, por posición en el lote
+        outcomes: Dict[int, Tuple[Any, Optional[Exception]]] = {}
+        # Posiciones de los mensajes con algún handler fallido
+        failed = set()
+        for handler in list(self.batch_handlers):
+            results, error = await self._call(handler, batch, len(batch))
+            for index in range(len(batch)):
+                if error is not None:
+                    failed.add(index)
+                    outcomes.setdefault(index, (None, error))
+                elif (isinstance(results, list) and len(results) == len(batch)
+                      and results[index] is not None):
+                    outcomes.setdefault(index, (results[index], None))
+        for handler in list(self.handlers):
+            for index, message in enumerate(batch):
+                result, error = await self._call(handler, message, 1)
+                if error is not None:
+                    failed.add(index)
+                if result is not None or error is not None:
+                    outcomes.setdefault(index, (result, error))
+        if self.on_reply is not None:
+            for index, (result, error) in outcomes.items():
+                if getattr(batch[index], "reply_to", None):
+                    await self.on_reply(batch[index], result, error)
+        if self.on_delivered is not None:
+            self.on_delivered([m for i, m in enumerate(batch) if i not in failed],
+                              [m for i, m in enumerate(batch) if i in failed])
+
+    def _discard(self, dropped: List[Any], abandoned: List[Any]) -> None:
+        if self.on_discarded is not None and (dropped or abandoned):
+            self.on_discarded(dropped, abandoned)
+
+    async def _call(self, handler: Callable, payload: Any,
+                    count: int) -> Tuple[Any, Optional[Exception]]:
+        try:
+            result = await handler(payload)
+            self.delivered += count
+            return result, None
+        except Exception as e:
+            self.failed += count
+            logger.error(f"Error delivering message to {self.agent_id}: {e}")
+            return None, e
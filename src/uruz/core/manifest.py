@@ -0,0 +1,103 @@
+"""
+Compiled index of agent manifests.
+
+Parsing thousands of YAML files on every start is slow, so the parsed
+manifests are stored in a binary index under the data directory. Each entry
+is keyed on the file's mtime and size; a refresh only re-parses the files
+that changed since the index was written.
+"""
+import logging
+import os
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+import yaml
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+INDEX_FILENAME = "manifests.idx"
+
+class ManifestIndex:
+    """Índice de manifiestos YAML con recarga incremental."""
+
+    def __init__(self, agents_dir: str, index_path: Optional[str] = None):
+        self.agents_dir = agents_dir
+        self.index_path = index_path
+        # filename -> (mtime_ns, size, agent_id, manifest)
+        self._entries: Dict[str, Tuple[int, int, str, Dict[str, Any]]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        """Carga el índice compilado desde disco, si existe y es válido."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "rb") as f:
+                data = pickle.load(f)
+            if (data.get("version") == INDEX_VERSION
+                    and data.get("agents_dir") == os.path.abspath(self.agents_dir)):
+                self._entries = data["entries"]
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest index {self.index_path}: {e}")
+
+    def save(self) -> None:
+        """Escribe el índice de forma atómica."""
+        if not self.index_path:
+            return
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "version": INDEX_VERSION,
+                "agents_dir": os.path.abspath(self.agents_dir),
+                "entries": self._entries,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self) -> Tuple[List[str], List[str]]:
+        """Sincroniza el índice con el directorio de agentes.
+
+        Returns:
+            Una tupla ``(changed, removed)`` con los IDs de agentes nuevos o
+            modificados y los de agentes cuyo manifiesto desapareció.
+        """
+        changed, removed, seen = [], [], set()
+        if os.path.isdir(self.agents_dir):
+            with os.scandir(self.agents_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".yaml") or not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+                    stat = entry.stat()
+                    cached = self._entries.get(entry.name)
+                    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                        continue
+
+                    agent_id = os.path.splitext(entry.name)[0]
+                    try:
+                        with open(entry.path) as f:
+                            manifest = yaml.safe_load(f) or {}
+                    except Exception as e:
+                        # Puede estar a medio escribir: se mantiene la última versión
+                        # válida y se vuelve a intentar en el siguiente refresh
+                        logger.error(f"Error loading agent {entry.name}: {e}")
+                        continue
+                    self._entries[entry.name] = (
+                        stat.st_mtime_ns, stat.st_size, agent_id, manifest
+                    )
+                    changed.append(agent_id)
+
+        removed.extend(self._entries.pop(name)[2]
+                       for name in list(self._entries) if name not in seen)
+        if changed or removed:
+            self.save()
+        return changed, removed
+
+    def manifests(self) -> Dict[str, Dict[str, Any]]:
+        """Devuelve los manifiestos indexados por ID de agente."""
+        return {agent_id: manifest
+                for _, _, agent_id, manifest in self._entries.values()}
+
+    def agent_ids(self) -> List[str]:
+        """Devuelve los IDs de todos los agentes indexados."""
+        return [entry[2] for entry in self._entries.values()]
@@ -1,48 +1,360 @@
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
-from datetime import datetime
-import uuid
+from typing import Any, Callable, Dict, List, Optional, Union
+from datetime import datetime, timezone
+import asyncio
+import itertools
+import random
+import time
+from ..config import settings
+from .mailbox import Mailbox
+from .topics import TopicIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# IDs enteros monótonos; el prefijo aleatorio los separa entre procesos
+_ids = itertools.count(random.getrandbits(32) << 31)
+
+# Prioridades: cada una es un carril del mailbox del receptor (0 = el más urgente)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Tipos de las respuestas a un request()
+REPLY = "reply"
+REPLY_ERROR = "reply_error"
+REPLY_TYPES = (REPLY, REPLY_ERROR)
+
+class RequestError(Exception):
+    """El receptor de un request() falló al procesarlo."""
 
-@dataclass
 class Message:
-    """Representa un mensaje entre agentes."""
+    """Representa un mensaje entre agentes.
     
-    id: str
-    sender_id: str
-    receiver_id: str
-    content: Dict[str, Any]
-    timestamp: datetime
-    type: str
-    metadata: Optional[Dict[str, Any]] = None
+    La hora de creación se guarda como segundos epoch (``created_at``) y
+    solo se convierte a ``datetime`` al leer ``timestamp``. Los mensajes de
+    un request/reply llevan ``correlation_id`` y, en la petición,
+    ``reply_to`` con el destinatario de la respuesta. ``priority`` elige el
+    carril del mailbox del receptor.
+    """
+    
+    __slots__ = ("id", "sender_id", "receiver_id", "content", "created_at",
+                 "type", "metadata", "topic", "correlation_id", "reply_to",
+                 "priority")
+    
+    def __init__(self, id: Union[int, str], sender_id: str, receiver_id: str,
+                 content: Dict[str, Any],
+                 timestamp: Union[datetime, float, None] = None,
+                 type: str = "text", metadata: Optional[Dict[str, Any]] = None,
+                 topic: Optional[str] = None,
+                 correlation_id: Union[int, str, None] = None,
+                 reply_to: Optional[str] = None,
+                 priority: int = PRIORITY_NORMAL):
+        self.id = id
+        self.sender_id = sender_id
+        self.receiver_id = receiver_id
+        self.content = content
+        self.created_at = time.time() if timestamp is None else _epoch(timestamp)
+        self.type = type
+        self.metadata = metadata
+        self.topic = topic
+        self.correlation_id = correlation_id
+        self.reply_to = reply_to
+        self.priority = priority
     
     @classmethod
-    def create(cls, sender_id: str, receiver_id: str, content: Dict[str, Any], type: str = "text"):
+    def create(cls, sender_id: str, receiver_id: str, content: Dict[str, Any], type: str = "text",
+               priority: int = PRIORITY_NORMAL):
         """Crea un nuevo mensaje."""
-        return cls(
-            id=str(uuid.uuid4()),
-            sender_id=sender_id,
-            receiver_id=receiver_id,
-            content=content,
-            timestamp=datetime.utcnow(),
-            type=type
-        )
+        return cls(next(_ids), sender_id, receiver_id, content, time.time(), type,
+                   priority=priority)
+    
+    def reply(self, content: Any, type: str = REPLY) -> "Message":
+        """Crea la respuesta a este mensaje, dirigida a ``reply_to``, con su prioridad."""
+        return Message(next(_ids), self.receiver_id, self.reply_to or self.sender_id,
+                       content, time.time(), type,
+                       correlation_id=self.id if self.correlation_id is None else self.correlation_id,
+                       priority=self.priority)
+    
+    @property
+    def timestamp(self) -> datetime:
+        """Hora de creación (UTC, sin zona horaria)."""
+        return datetime.fromtimestamp(self.created_at, timezone.utc).replace(tzinfo=None)
+    
+    @timestamp.setter
+    def timestamp(self, value: Union[datetime, float]) -> None:
+        self.created_at = _epoch(value)
+    
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        return (f"Message(id={self.id!r}, sender_id={self.sender_id!r}, "
+                f"receiver_id={self.receiver_id!r}, content={self.content!r}, "
+                f"timestamp={self.timestamp!r}, type={self.type!r}, "
+                f"metadata={self.metadata!r}, topic={self.topic!r}, "
+                f"correlation_id={self.correlation_id!r}, reply_to={self.reply_to!r}, "
+                f"priority={self.priority!r})")
+    
+    def __reduce__(self):
+        # Pickle compacto para cruzar procesos (shards)
+        return (self.__class__, (self.id, self.sender_id, self.receiver_id, self.content,
+                                 self.created_at, self.type, self.metadata, self.topic,
+                                 self.correlation_id, self.reply_to, self.priority))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte el mensaje en un dict serializable a JSON."""
+        return {
+            "id": self.id,
+            "sender_id": self.sender_id,
+            "receiver_id": self.receiver_id,
+            "content": self.content,
+            "timestamp": self.timestamp.isoformat(),
+            "type": self.type,
+            "metadata": self.metadata,
+            "topic": self.topic,
+            "correlation_id": self.correlation_id,
+            "reply_to": self.reply_to,
+            "priority": self.priority,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        """Reconstruye un mensaje creado con to_dict()."""
+        return cls(**{**data, "timestamp": datetime.fromisoformat(data["timestamp"])})
+
+def _epoch(value: Union[datetime, float]) -> float:
+    """Segundos epoch de un datetime (naive = UTC) o de un número."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
 
 class MessageBroker:
-    """Gestiona el enrutamiento de mensajes entre agentes."""
+    """Gestiona el enrutamiento de mensajes entre agentes.
+    
+    Cada agente suscrito tiene un mailbox acotado con su propia tarea
+    consumidora: publicar solo espera a que el mensaje quede encolado.
+    ``request()`` publica un mensaje y espera su respuesta, que el receptor
+    envía devolviendo un valor desde su handler. Cada mailbox tiene un
+    carril por prioridad, atendidos en orden estricto o ponderado.
+    """
     
-    def __init__(self):
-        self.subscribers = {}
+    def __init__(self, capacity: Optional[int] = None,
+                 overflow_policy: Optional[str] = None,
+                 lane_weights: Optional[List[int]] = None,
+                 scheduling: Optional[str] = None):
+        self.subscribers: Dict[str, Mailbox] = {}
+        self.topics = TopicIndex()
+        self.capacity = capacity or settings.MAILBOX_CAPACITY
+        self.overflow_policy = overflow_policy or settings.MAILBOX_OVERFLOW_POLICY
+        # Un carril por prioridad en cada mailbox, con su peso
+        self.lane_weights = lane_weights or settings.MAILBOX_LANE_WEIGHTS
+        self.scheduling = scheduling or settings.MAILBOX_SCHEDULING
+        # Callable opcional que materializa agentes aún no suscritos
+        self.resolver = None
+        # correlation_id -> future de los request() en curso
+        self._waiters: Dict[Any, asyncio.Future] = {}
     
     async def publish(self, message: Message) -> None:
-        """Publica un mensaje para su entrega."""
-        if message.receiver_id in self.subscribers:
-            await self.subscribers[message.receiver_id](message)
-    
-    def subscribe(self, agent_id: str, callback):
-        """Suscribe un agente para recibir mensajes."""
-        self.subscribers[agent_id] = callback
-    
-    def unsubscribe(self, agent_id: str):
-        """Cancela la suscripción de un agente."""
-        if agent_id in self.subscribers:
-            del self.subscribers[agent_id] 
\ No newline at end of file
+        """Publica un mensaje para su entrega.
+        
+        Raises:
+            MailboxFullError: Si el mailbox del receptor está lleno y su
+                política de desborde es ``reject``.
+        """
+        if message.type in REPLY_TYPES and self._resolve_reply(message):
+            return
+        if message.receiver_id not in self.subscribers and self.resolver:
+            self.resolver(message.receiver_id)
+        mailbox = self.subscribers.get(message.receiver_id)
+        if mailbox is not None:
+            await mailbox.put(message)
+    
+    async def publish_many(self, messages: List[Message]) -> None:
+        """Publica varios mensajes agrupándolos por receptor.
+        
+        Cada mailbox recibe sus mensajes en una sola operación, y la entrega
+        a distintos receptores se hace en paralelo.
+        """
+        by_receiver: Dict[str, List[Message]] = {}
+        for message in messages:
+            if message.type in REPLY_TYPES and self._resolve_reply(message):
+                continue
+            by_receiver.setdefault(message.receiver_id, []).append(message)
+        
+        mailboxes = []
+        for receiver_id, batch in by_receiver.items():
+            if receiver_id not in self.subscribers and self.resolver:
+                self.resolver(receiver_id)
+            mailbox = self.subscribers.get(receiver_id)
+            if mailbox is not None:
+                mailboxes.append(mailbox.put_many(batch))
+        await asyncio.gather(*mailboxes)
+    
+    async def publish_topic(self, topic: str, message: Message) -> int:
+        """Publica un mensaje para todos los agentes suscritos al tópico.
+        
+        La entrega a cada mailbox se hace en paralelo, de modo que un
+        receptor lento no retrasa a los demás.
+        
+        Returns:
+            El número de agentes que recibieron el mensaje.
+        """
+        message.topic = topic
+        mailboxes = []
+        for agent_id in self.topics.match(topic):
+            if agent_id not in self.subscribers and self.resolver:
+                self.resolver(agent_id)
+            mailbox = self.subscribers.get(agent_id)
+            if mailbox is not None:
+                mailboxes.append(mailbox)
+        
+        outcomes = await asyncio.gather(
+            *(mailbox.put(message) for mailbox in mailboxes),
+            return_exceptions=True
+        )
+        delivered = 0
+        for mailbox, outcome in zip(mailboxes, outcomes):
+            if isinstance(outcome, Exception):
+                logger.warning(f"Topic {topic} not delivered to {mailbox.agent_id}: {outcome}")
+            else:
+                delivered += 1
+        return delivered
+    
+    async def request(self, message: Message, timeout: Optional[float] = None) -> Message:
+        """Publica un mensaje y espera la respuesta del receptor.
+        
+        Si el handler del receptor devuelve un valor, se envía como respuesta;
+        si falla, el request falla con ``RequestError``. El waiter se elimina
+        al recibir la respuesta, al vencer el plazo o al cancelar la espera.
+        
+        Args:
+            message: Mensaje a enviar; su ``id`` se usa como correlation_id.
+            timeout: Segundos de espera; por defecto settings.REQUEST_TIMEOUT.
+            
+        Returns:
+            El mensaje de respuesta.
+            
+        Raises:
+            asyncio.TimeoutError: Si no llega respuesta a tiempo.
+            RequestError: Si el receptor falló al procesar el mensaje.
+        """
+        if message.correlation_id is None:
+            message.correlation_id = message.id
+        if message.reply_to is None:
+            message.reply_to = self._reply_address(message)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[message.correlation_id] = future
+        try:
+            await self.publish(message)
+            return await asyncio.wait_for(
+                future, settings.REQUEST_TIMEOUT if timeout is None else timeout
+            )
+        finally:
+            self._waiters.pop(message.correlation_id, None)
+    
+    def _reply_address(self, message: Message) -> str:
+        """Destinatario de la respuesta a un request()."""
+        return message.sender_id
+    
+    def _resolve_reply(self, message: Message) -> bool:
+        """Completa el request() que espera esta respuesta, si lo hay.
+        
+        Sin request esperando, el mensaje se entrega como uno más.
+        """
+        future = self._waiters.pop(message.correlation_id, None)
+        if future is None:
+            return False
+        if not future.done():
+            if message.type == REPLY_ERROR:
+                future.set_exception(RequestError((message.content or {}).get("error")))
+            else:
+                future.set_result(message)
+        return True
+    
+    async def _send_reply(self, message: Message, result: Any,
+                          error: Optional[Exception]) -> None:
+        """Responde un request() con el resultado del handler del receptor."""
+        if error is not None:
+            reply = message.reply({"error": str(error)}, REPLY_ERROR)
+        else:
+            reply = message.reply(result)
+        try:
+            await self.publish(reply)
+        except Exception as e:
+            logger.warning(f"Reply to {reply.receiver_id} not delivered: {e}")
+    
+    def pending_requests(self) -> int:
+        """Número de request() esperando respuesta."""
+        return len(self._waiters)
+    
+    def subscribe_topic(self, pattern: str, agent_id: str) -> None:
+        """Suscribe un agente a un patrón de tópicos (``ops.*.alerts``, ``ops.#``)."""
+        self.topics.add(pattern, agent_id)
+    
+    def unsubscribe_topic(self, pattern: str, agent_id: str) -> None:
+        """Cancela la suscripción de un agente a un patrón de tópicos."""
+        self.topics.remove(pattern, agent_id)
+    
+    def subscribe(self, agent_id: str, callback: Callable,
+                  capacity: Optional[int] = None,
+                  overflow_policy: Optional[str] = None,
+                  batch_size: Optional[int] = None,
+                  batch_window: Optional[float] = None) -> None:
+        """Suscribe un callback para recibir los mensajes de un agente.
+        
+        Si se indica ``batch_size``, el callback recibe listas de mensajes
+        agrupadas por tamaño o por ventana de tiempo (``batch_window``).
+        """
+        mailbox = self.subscribers.get(agent_id)
+        if mailbox is None:
+            mailbox = Mailbox(agent_id,
+                              capacity or self.capacity,
+                              overflow_policy or self.overflow_policy,
+                              lane_weights=self.lane_weights,
+                              scheduling=self.scheduling)
+            mailbox.on_reply = self._send_reply
+            self.subscribers[agent_id] = mailbox
+        
+        if batch_size:
+            mailbox.batch_size = batch_size
+            mailbox.batch_window = batch_window or 0.0
+            handlers = mailbox.batch_handlers
+        else:
+            handlers = mailbox.handlers
+        if callback not in handlers:
+            handlers.append(callback)
+    
+    def unsubscribe(self, agent_id: str, callback: Optional[Callable] = None):
+        """Cancela la suscripción de un agente (o solo de uno de sus callbacks)."""
+        mailbox = self.subscribers.get(agent_id)
+        if mailbox is None:
+            return
+        for handlers in (mailbox.handlers, mailbox.batch_handlers):
+            if callback in handlers:
+                handlers.remove(callback)
+        if callback is None or not (mailbox.handlers or mailbox.batch_handlers):
+            mailbox.close()
+            del self.subscribers[agent_id]
+    
+    async def join(self) -> None:
+        """Espera a que todos los mailboxes se vacíen."""
+        await asyncio.gather(*(mailbox.join() for mailbox in list(self.subscribers.values())))
+    
+    def queue_depths(self) -> Dict[str, int]:
+        """Devuelve el número de mensajes pendientes por agente."""
+        return {agent_id: mailbox.depth for agent_id, mailbox in self.subscribers.items()}
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Devuelve los contadores de cada mailbox."""
+        return {agent_id: mailbox.get_stats() for agent_id, mailbox in self.subscribers.items()}
+    
+    def close(self) -> None:
+        """Detiene todos los consumidores."""
+        for mailbox in self.subscribers.values():
+            mailbox.close()
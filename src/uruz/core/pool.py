@@ -0,0 +1,255 @@
+"""
+Replicated agent instances.
+
+An agent manifest may declare ``replicas`` to run several instances of the
+same agent. ``AgentPool`` behaves like a single agent, dispatching each
+message to the replica with the fewest in-flight requests and scaling the
+number of replicas between its bounds as load changes.
+
+Load is the pool's backlog: requests in flight plus, once the pool is
+attached to its mailbox, messages waiting there. The mailbox delivers as
+many messages at a time as there are replicas, and a periodic check adds
+replicas while the backlog stays high and removes idle ones even when no
+request arrives.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class Replica:
+    """Una instancia de agente y sus contadores."""
+
+    def __init__(self, index: int, agent: Any):
+        self.index = index
+        self.agent = agent
+        self.in_flight = 0
+        self.handled = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.last_used = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de la réplica."""
+        return {
+            "replica": self.index,
+            "in_flight": self.in_flight,
+            "handled": self.handled,
+            "errors": self.errors,
+            "avg_time": self.total_time / self.handled if self.handled else 0.0,
+        }
+
+class AgentPool:
+    """Pool de réplicas de un agente con despacho a la menos cargada."""
+
+    def __init__(self, agent_id: str, factory: Callable[[], Any],
+                 min_replicas: int = 1, max_replicas: Optional[int] = None,
+                 scale_up_threshold: int = 2, idle_timeout: float = 60.0,
+                 scale_interval: float = 1.0):
+        """Initialize the pool.
+
+        Args:
+            agent_id: ID shared by every replica.
+            factory: Callable that builds a new replica.
+            min_replicas: Replicas kept alive at all times.
+            max_replicas: Upper bound when scaling up; defaults to min_replicas.
+            scale_up_threshold: Backlog per replica (queued plus in-flight
+                requests) that triggers a new replica.
+            idle_timeout: Seconds a replica above the minimum may stay idle
+                before being removed.
+            scale_interval: Seconds between periodic scaling checks while
+                the pool is above its minimum or has a backlog.
+        """
+        if min_replicas < 1:
+            raise ValueError("An agent pool needs at least one replica")
+        self.agent_id = agent_id
+        self.factory = factory
+        self.min_replicas = min_replicas
+        self.max_replicas = max(max_replicas or min_replicas, min_replicas)
+        self.scale_up_threshold = scale_up_threshold
+        self.idle_timeout = idle_timeout
+        self.scale_interval = scale_interval
+        self.replicas: List[Replica] = []
+        # Mailbox del agente, si el pool recibe mensajes del broker
+        self.mailbox: Optional[Any] = None
+        self._next_index = 0
+        self._scaling = False
+        self._autoscaler: Optional[asyncio.Task] = None
+        for _ in range(min_replicas):
+            self._add_replica(factory())
+        self.config = self.replicas[0].agent.config
+
+    @classmethod
+    def from_manifest(cls, agent_id: str, factory: Callable[[], Any],
+                      replicas: Union[int, Dict[str, Any]]) -> "AgentPool":
+        """Crea un pool a partir del valor ``replicas`` de un manifiesto.
+
+        Acepta un entero (réplicas fijas) o un dict con ``min``, ``max``,
+        ``scale_up_threshold``, ``idle_timeout`` y ``scale_interval``.
+        """
+        if isinstance(replicas, int):
+            return cls(agent_id, factory, replicas, replicas)
+        return cls(
+            agent_id, factory,
+            min_replicas=replicas.get("min", 1),
+            max_replicas=replicas.get("max"),
+            scale_up_threshold=replicas.get("scale_up_threshold", 2),
+            idle_timeout=replicas.get("idle_timeout", 60.0),
+            scale_interval=replicas.get("scale_interval", 1.0),
+        )
+
+    def attach_mailbox(self, mailbox: Any) -> None:
+        """Usa la profundidad del mailbox para escalar y le deja entregar un mensaje por réplica."""
+        self.mailbox = mailbox
+        self._sync_concurrency()
+
+    @property
+    def in_flight(self) -> int:
+        """Peticiones en curso en todas las réplicas."""
+        return sum(replica.in_flight for replica in self.replicas)
+
+    @property
+    def backlog(self) -> int:
+        """Peticiones en curso más los mensajes que esperan en el mailbox."""
+        return self.in_flight + (self.mailbox.depth if self.mailbox is not None else 0)
+
+    async def process_message(self, message: Any) -> Any:
+        """Procesa un mensaje en la réplica con menos peticiones en curso."""
+        return await self._dispatch("process_message", message)
+
+    async def process_messages(self, batch: List[Any]) -> List[Any]:
+        """Procesa un lote completo en la réplica con menos peticiones en curso."""
+        return await self._dispatch("process_messages", batch)
+
+    async def process_message_stream(self, message: Any) -> AsyncIterator[str]:
+        """Transmite la respuesta de la réplica con menos peticiones en curso."""
+        with self._checkout() as replica:
+            async for chunk in replica.agent.process_message_stream(message):
+                yield chunk
+
+    async def _dispatch(self, method: str, payload: Any) -> Any:
+        with self._checkout() as replica:
+            return await getattr(replica.agent, method)(payload)
+
+    @contextlib.contextmanager
+    def _checkout(self) -> Iterator[Replica]:
+        """Reserva la réplica menos cargada mientras dura la petición."""
+        replica = min(self.replicas, key=lambda r: r.in_flight)
+        self._check_backlog()
+        if self.max_replicas > self.min_replicas and self._autoscaler is None:
+            self._autoscaler = asyncio.ensure_future(self._autoscale())
+
+        replica.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield replica
+        except Exception:
+            replica.errors += 1
+            raise
+        finally:
+            replica.in_flight -= 1
+            replica.handled += 1
+            replica.last_used = time.monotonic()
+            replica.total_time += replica.last_used - start
+            self._scale_down()
+
+    async def act(self) -> List[Dict[str, Any]]:
+        """Las acciones autónomas las realiza solo la réplica principal."""
+        return await self.replicas[0].agent.act()
+
+    def get_state(self) -> Optional[Dict[str, Any]]:
+        """Estado de la réplica principal."""
+        return self.replicas[0].agent.get_state()
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """Restaura el estado en todas las réplicas."""
+        for replica in self.replicas:
+            replica.agent.set_state(state)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores del pool y de cada réplica."""
+        return {
+            "replicas": len(self.replicas),
+            "min_replicas": self.min_replicas,
+            "max_replicas": self.max_replicas,
+            "in_flight": self.in_flight,
+            "backlog": self.backlog,
+            "per_replica": [replica.get_stats() for replica in self.replicas],
+        }
+
+    def close(self) -> None:
+        """Detiene el autoescalado y libera los clientes de todas las réplicas."""
+        if self._autoscaler is not None:
+            self._autoscaler.cancel()
+        for replica in self.replicas:
+            self._close_agent(replica.agent)
+
+    def _close_agent(self, agent: Any) -> None:
+        """Cierra una réplica retirada para que sus clientes compartidos se liberen."""
+        if not hasattr(agent, "close"):
+            return
+        try:
+            agent.close()
+        except Exception as e:
+            logger.error(f"Error closing a replica of agent {self.agent_id}: {e}")
+
+    def _add_replica(self, agent: Any) -> None:
+        self.replicas.append(Replica(self._next_index, agent))
+        self._next_index += 1
+        self._sync_concurrency()
+
+    def _sync_concurrency(self) -> None:
+        if self.mailbox is not None:
+            self.mailbox.concurrency = len(self.replicas)
+
+    def _check_backlog(self) -> None:
+        """Añade una réplica si cada una tiene de media ``scale_up_threshold`` peticiones."""
+        if self.backlog >= self.scale_up_threshold * len(self.replicas):
+            self._scale_up()
+
+    async def _autoscale(self) -> None:
+        """Revisa la carga periódicamente mientras haya algo que escalar."""
+        try:
+            while len(self.replicas) > self.min_replicas or self.backlog:
+                await asyncio.sleep(self.scale_interval)
+                self._check_backlog()
+                self._scale_down()
+        finally:
+            self._autoscaler = None
+
+    def _scale_up(self) -> None:
+        """Construye una réplica nueva en segundo plano; se llama desde el bucle de eventos."""
+        if self._scaling or len(self.replicas) >= self.max_replicas:
+            return
+        self._scaling = True
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self.factory)
+        future.add_done_callback(self._on_replica_built)
+
+    def _on_replica_built(self, future: asyncio.Future) -> None:
+        self._scaling = False
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f"Error scaling up agent {self.agent_id}: {future.exception()}")
+            return
+        if len(self.replicas) < self.max_replicas:
+            self._add_replica(future.result())
+            logger.info(f"Agent {self.agent_id} scaled up to {len(self.replicas)} replicas")
+        else:
+            self._close_agent(future.result())
+
+    def _scale_down(self) -> None:
+        """Retira réplicas ociosas por encima del mínimo."""
+        now = time.monotonic()
+        for replica in list(self.replicas[self.min_replicas:]):
+            if len(self.replicas) <= self.min_replicas:
+                break
+            if replica.in_flight == 0 and now - replica.last_used > self.idle_timeout:
+                self.replicas.remove(replica)
+                self._sync_concurrency()
+                self._close_agent(replica.agent)
+                logger.info(f"Agent {self.agent_id} scaled down to {len(self.replicas)} replicas")
@@ -0,0 +1,353 @@
+"""
+Distributed message broker on Redis Streams.
+
+Every agent has a stream (``uruz:agent:<agent_id>``) read through a consumer
+group, so agents can talk across processes and hosts. Messages for agents
+subscribed in the same process skip Redis and serialization entirely and go
+straight to their mailbox. Entries are acknowledged once the local handlers
+have run without error, or once the mailbox's ``drop_oldest`` policy
+drops them. Entries whose handler failed, that a full ``reject`` mailbox
+refused, that were still queued when their mailbox closed, or that were
+left pending by a consumer that died, are reclaimed after ``claim_idle_ms``.
+An entry delivered ``max_deliveries`` times is moved to the agent's
+dead-letter stream (``<stream>:dead``) instead of being retried forever.
+
+Only agents subscribed in a process consume from their stream there; an
+agent that is not built anywhere accumulates its messages until some
+process builds it. Replies to ``request()`` go to a per-process inbox
+stream, read only once this process has issued a request. Entries carry the msgpack payload of ``core.codec``, so
+the Redis client must not decode responses.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Set
+from ..clients import get_async_redis
+from . import codec
+from .mailbox import MailboxFullError
+from .message import REPLY_TYPES, Message, MessageBroker
+
+logger = logging.getLogger(__name__)
+
+class RedisStreamBroker(MessageBroker):
+    """MessageBroker distribuido con atajo local para agentes del proceso."""
+
+    def __init__(self, redis_client: Any = None, group: str = "uruz",
+                 consumer: Optional[str] = None,
+                 stream_prefix: str = "uruz:agent:",
+                 block_ms: int = 1000, read_count: int = 100,
+                 claim_idle_ms: int = 30000, maxlen: int = 100000,
+                 max_deliveries: int = 5, **kwargs: Any):
+        """Initialize the broker.
+
+        Args:
+            redis_client: ``redis.asyncio`` client created with
+                ``decode_responses=False``; defaults to the shared one.
+            group: Consumer group name shared by every process.
+            consumer: This process' consumer name; defaults to host-pid.
+            stream_prefix: Prefix of the per-agent stream keys.
+            block_ms: How long a read blocks waiting for new entries.
+            read_count: Maximum entries fetched per read.
+            claim_idle_ms: Idle time after which pending entries of other
+                consumers are reclaimed.
+            maxlen: Approximate maximum length of each stream.
+            max_deliveries: Deliveries after which a pending entry is moved
+                to the dead-letter stream.
+        """
+        super().__init__(**kwargs)
+        self.redis = (redis_client if redis_client is not None
+                      else get_async_redis(decode_responses=False))
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.stream_prefix = stream_prefix
+        self.block_ms = block_ms
+        self.read_count = read_count
+        self.claim_idle_ms = claim_idle_ms
+        self.maxlen = maxlen
+        self.max_deliveries = max_deliveries
+        self.dead_letters = 0
+        self.local_deliveries = 0
+        self.remote_deliveries = 0
+        self._groups: Set[str] = set()
+        # Entradas leídas que aún no se confirmaron
+        self._in_flight: Set[str] = set()
+        self._last_reclaim = 0.0
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        # Destinatario de las respuestas a los request() de este proceso
+        self.inbox = f"_reply.{self.consumer}"
+        self._inbox_active = False
+
+    def stream_key(self, agent_id: str) -> str:
+        """Clave del stream de un agente."""
+        return f"{self.stream_prefix}{agent_id}"
+
+    @staticmethod
+    def encode(message: Message) -> Dict[str, bytes]:
+        """Serializa un mensaje como campos de una entrada de stream."""
+        return {"m": codec.encode(message)}
+
+    @staticmethod
+    def decode(fields: Dict[bytes, bytes]) -> Message:
+        """Reconstruye un mensaje leído de un stream."""
+        return codec.decode(fields[b"m"])
+
+    async def publish(self, message: Message) -> None:
+        """Entrega localmente si el receptor vive en este proceso; si no, vía Redis."""
+        if message.type in REPLY_TYPES and self._resolve_reply(message):
+            # Si la espera no está en este proceso, llega por el inbox de destino
+            return
+        if message.receiver_id not in self.subscribers and self.resolver:
+            self.resolver(message.receiver_id)
+        if message.receiver_id in self.subscribers:
+            self.local_deliveries += 1
+            await super().publish(message)
+            return
+        self.remote_deliveries += 1
+        await self._xadd(message)
+
+    async def _xadd(self, message: Message) -> None:
+        await self.redis.xadd(self.stream_key(message.receiver_id),
+                              self.encode(message),
+                              maxlen=self.maxlen, approximate=True)
+
+    async def publish_many(self, messages: List[Message]) -> None:
+        """Publica varios mensajes; los remotos se envían en un solo pipeline."""
+        messages = [m for m in messages
+                    if m.type not in REPLY_TYPES or not self._resolve_reply(m)]
+        if self.resolver:
+            for receiver_id in {m.receiver_id for m in messages} - set(self.subscribers):
+                self.resolver(receiver_id)
+        local = [m for m in messages if m.receiver_id in self.subscribers]
+        remote = [m for m in messages if m.receiver_id not in self.subscribers]
+        if local:
+            self.local_deliveries += len(local)
+            await super().publish_many(local)
+        if remote:
+            self.remote_deliveries += len(remote)
+            pipe = self.redis.pipeline(transaction=False)
+            for message in remote:
+                pipe.xadd(self.stream_key(message.receiver_id), self.encode(message),
+                          maxlen=self.maxlen, approximate=True)
+            await pipe.execute()
+
+    def subscribe(self, agent_id: str, callback: Any, *args: Any, **kwargs: Any) -> None:
+        """Suscribe un agente local y empieza a consumir su stream."""
+        super().subscribe(agent_id, callback, *args, **kwargs)
+        mailbox = self.subscribers[agent_id]
+        mailbox.on_delivered = self._settle
+        # Lo que la política de desborde tira se confirma; lo abandonado al cerrar, no
+        mailbox.on_discarded = self._settle
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Sin loop activo: el consumo empieza con start()
+            return
+        self.start()
+
+    async def request(self, message: Message, timeout: Optional[float] = None) -> Message:
+        """Como MessageBroker.request(), con la respuesta recibida en el inbox."""
+        self._inbox_active = True
+        self.start()
+        return await super().request(message, timeout)
+
+    def _reply_address(self, message: Message) -> str:
+        return self.inbox
+
+    def start(self) -> None:
+        """Arranca la tarea que consume los streams de los agentes locales."""
+        if self._task is None or self._task.done():
+            self._running = True
+            self._task = asyncio.ensure_future(self._consume_streams())
+
+    async def stop(self) -> None:
+        """Detiene el consumo de streams al terminar la lectura en curso.
+
+        Cancelar una lectura bloqueante obliga al cliente a descartar su
+        conexión, así que solo se cancela si no termina a tiempo.
+        """
+        if self._task is None:
+            return
+        self._running = False
+        try:
+            await asyncio.wait_for(self._task, self.block_ms / 1000 + 1.0)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = super().get_stats()
+        for agent_id, mailbox_stats in stats.items():
+            mailbox_stats["stream"] = self.stream_key(agent_id)
+            mailbox_stats["dead_letter_stream"] = self.dead_letter_key(self.stream_key(agent_id))
+        return stats
+
+    async def _ensure_groups(self, streams: List[str]) -> None:
+        for stream in streams:
+            if stream in self._groups:
+                continue
+            try:
+                await self.redis.xgroup_create(stream, self.group, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self._groups.add(stream)
+
+    async def _consume_streams(self) -> None:
+        while self._running:
+            streams = [self.stream_key(agent_id) for agent_id in list(self.subscribers)]
+            if self._inbox_active:
+                streams.append(self.stream_key(self.inbox))
+            if not streams:
+                await asyncio.sleep(self.block_ms / 1000)
+                continue
+            try:
+                await self._ensure_groups(streams)
+                await self._reclaim(streams)
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer,
+                    {stream: ">" for stream in streams},
+                    count=self.read_count, block=self.block_ms
+                )
+                if not response:
+                    # Cede el loop aunque el servidor no haya bloqueado la lectura
+                    await asyncio.sleep(0)
+                    continue
+                for stream, entries in response:
+                    await self._dispatch(stream, entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading agent streams: {e}")
+                await asyncio.sleep(self.block_ms / 1000)
+
+    async def _reclaim(self, streams: List[str]) -> None:
+        """Reclama entradas pendientes de consumidores caídos."""
+        now = time.monotonic()
+        if now - self._last_reclaim < self.claim_idle_ms / 2000:
+            return
+        self._last_reclaim = now
+        for stream in streams:
+            response = await self.redis.xautoclaim(
+                stream, self.group, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id="0-0",
+                count=self.read_count
+            )
+            # Las entradas que este proceso aún tiene en sus mailboxes no se repiten
+            entries = [entry for entry in (response[1] if response else [])
+                       if entry[0] not in self._in_flight]
+            entries = await self._dead_letter(stream, entries)
+            if entries:
+                logger.info(f"Reclaimed {len(entries)} pending entries from {stream}")
+                await self._dispatch(stream, entries)
+
+    def dead_letter_key(self, stream: str) -> str:
+        """Clave del stream de mensajes muertos de un stream."""
+        return f"{stream}:dead"
+
+    @staticmethod
+    def _id_key(entry_id: Any) -> tuple:
+        """Orden numérico de un ID de entrada (``<ms>-<seq>``)."""
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode()
+        return tuple(int(part) for part in entry_id.split("-"))
+
+    async def _dead_letter(self, stream: str, entries: List[Any]) -> List[Any]:
+        """Mueve al stream de mensajes muertos las entradas entregadas demasiadas veces.
+
+        Returns:
+            Las entradas que aún se pueden volver a entregar.
+        """
+        if not entries:
+            return entries
+        ids = sorted((entry[0] for entry in entries), key=self._id_key)
+        pending = await self.redis.xpending_range(
+            stream, self.group, min=ids[0], max=ids[-1], count=len(ids) * 2
+        )
+        deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+        retry = []
+        for entry_id, fields in entries:
+            if not fields or deliveries.get(entry_id, 0) <= self.max_deliveries:
+                retry.append((entry_id, fields))
+                continue
+            logger.warning(f"Moving entry {entry_id} of {stream} to the dead-letter stream "
+                           f"after {deliveries[entry_id] - 1} deliveries")
+            await self.redis.xadd(self.dead_letter_key(stream), fields,
+                                  maxlen=self.maxlen, approximate=True)
+            await self.redis.xack(stream, self.group, entry_id)
+            self.dead_letters += 1
+        return retry
+
+    async def _dispatch(self, stream: Any, entries: List[Any]) -> None:
+        if isinstance(stream, bytes):
+            stream = stream.decode()
+        agent_id = stream[len(self.stream_prefix):]
+        mailbox = self.subscribers.get(agent_id)
+        messages = []
+        for entry_id, fields in entries:
+            if not fields:
+                # Entrada eliminada por MAXLEN mientras estaba pendiente
+                await self.redis.xack(stream, self.group, entry_id)
+                continue
+            try:
+                message = self.decode(fields)
+            except Exception as e:
+                logger.error(f"Dropping undecodable entry {entry_id} from {stream}: {e}")
+                await self.redis.xack(stream, self.group, entry_id)
+                continue
+            if message.type in REPLY_TYPES and self._resolve_reply(message):
+                # Las respuestas esperadas no pasan por mailboxes: completan su request()
+                await self.redis.xack(stream, self.group, entry_id)
+                continue
+            if mailbox is None:
+                if agent_id == self.inbox:
+                    # Respuesta tardía u otro mensaje en el inbox: nadie más leerá esta entrada
+                    logger.debug(f"Dropping message {message.id} from inbox {stream}: "
+                                 f"no request waiting for it")
+                    await self.redis.xack(stream, self.group, entry_id)
+                # Si no, el agente ya no vive aquí: queda pendiente para quien lo aloje
+                continue
+            message.metadata = {**(message.metadata or {}),
+                                "_stream": stream, "_entry_id": entry_id}
+            self._in_flight.add(entry_id)
+            messages.append(message)
+        if not messages:
+            return
+        try:
+            await mailbox.put_many(messages)
+        except MailboxFullError as e:
+            # Sin confirmar: se reclaman cuando haya sitio, hasta max_deliveries
+            logger.warning(f"Mailbox of {agent_id} refused {len(e.messages)} stream entries")
+            self._settle([], e.messages)
+        except BaseException:
+            self._settle([], messages)
+            raise
+
+    @staticmethod
+    def _entries(messages: List[Any]) -> Dict[str, List[str]]:
+        """IDs de entrada de los mensajes leídos de streams, por stream."""
+        by_stream: Dict[str, List[str]] = {}
+        for message in messages:
+            metadata = getattr(message, "metadata", None) or {}
+            if "_entry_id" in metadata:
+                by_stream.setdefault(metadata["_stream"], []).append(metadata["_entry_id"])
+        return by_stream
+
+    def _settle(self, delivered: List[Any], failed: List[Any]) -> None:
+        """Confirma las entradas procesadas; las fallidas quedan pendientes."""
+        for stream, entry_ids in self._entries(delivered).items():
+            asyncio.ensure_future(self._ack(stream, entry_ids))
+        for entry_ids in self._entries(failed).values():
+            # Sin confirmar, _reclaim las volverá a entregar pasado claim_idle_ms
+            self._in_flight.difference_update(entry_ids)
+
+    async def _ack(self, stream: str, entry_ids: List[str]) -> None:
+        try:
+            await self.redis.xack(stream, self.group, *entry_ids)
+        except Exception as e:
+            logger.error(f"Error acknowledging stream entries: {e}")
+        finally:
+            # Hasta confirmar, _reclaim no debe volver a entregar estas entradas
+            self._in_flight.difference_update(entry_ids)
@@ -0,0 +1,191 @@
+"""
+Timer scheduling for autonomous agents.
+
+Agents declare when they want to act through their config, either with a
+fixed ``interval`` in seconds or with a cron-like ``schedule`` expression.
+The scheduler keeps a min-heap of next-run deadlines so that only agents
+that are due get woken up.
+"""
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+class IntervalSchedule:
+    """Ejecuta un agente cada ``seconds`` segundos."""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive, got {seconds}")
+        self.seconds = float(seconds)
+
+    def delay_after(self, now: datetime) -> float:
+        """Segundos hasta la siguiente ejecución."""
+        return self.seconds
+
+class CronSchedule:
+    """Ejecuta un agente según una expresión cron de cinco campos.
+
+    Soporta ``*``, valores, rangos (``1-5``), pasos (``*/15``, ``0-30/5``),
+    listas separadas por comas y los alias ``@hourly``, ``@daily``, etc.
+    El día de la semana va de 0 (domingo) a 6; 7 también es domingo.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression: {expression!r}")
+
+        self.minutes = self._parse_field(fields[0], 0, 59)
+        self.hours = self._parse_field(fields[1], 0, 23)
+        self.days = self._parse_field(fields[2], 1, 31)
+        self.months = self._parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in self._parse_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        """Convierte un campo cron en el conjunto de valores permitidos."""
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"Invalid cron step: {step_str!r}")
+
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_str, end_str = part.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field {field!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        """Aplica la semántica cron para día del mes y día de la semana."""
+        weekday = (moment.weekday() + 1) % 7
+        day_ok = moment.day in self.days
+        weekday_ok = weekday in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, now: datetime) -> datetime:
+        """Devuelve el primer minuto estrictamente posterior a ``now``."""
+        moment = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+
+        while moment < limit:
+            if moment.month not in self.months:
+                year = moment.year + (moment.month == 12)
+                month = moment.month % 12 + 1
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+                continue
+            if moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+    def delay_after(self, now: datetime) -> float:
+        """Segundos hasta la siguiente ejecución."""
+        return (self.next_after(now) - now).total_seconds()
+
+def parse_schedule(config: Optional[Dict[str, Any]]) -> Optional[Any]:
+    """Obtiene el schedule declarado en la configuración de un agente.
+
+    Returns:
+        Un ``IntervalSchedule``, un ``CronSchedule`` o ``None`` si el agente
+        no declara ninguno y debe actuar en cada step.
+    """
+    config = config or {}
+    if config.get("schedule"):
+        return CronSchedule(config["schedule"])
+    if config.get("interval"):
+        return IntervalSchedule(config["interval"])
+    return None
+
+class Scheduler:
+    """Min-heap de deadlines de ejecución por agente."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._schedules: Dict[str, Any] = {}
+        self._deadlines: Dict[str, float] = {}
+        self._counter = itertools.count()
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._schedules
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def add(self, agent_id: str, schedule: Any,
+            delay: float = 0.0) -> None:
+        """Registra un agente; por defecto su primera ejecución es inmediata."""
+        self._schedules[agent_id] = schedule
+        self._push(agent_id, time.monotonic() + delay)
+
+    def remove(self, agent_id: str) -> None:
+        """Elimina un agente; su entrada en el heap se descarta al salir."""
+        self._schedules.pop(agent_id, None)
+        self._deadlines.pop(agent_id, None)
+
+    def reschedule(self, agent_id: str) -> None:
+        """Calcula el siguiente deadline de un agente tras ejecutarse."""
+        schedule = self._schedules.get(agent_id)
+        if schedule is not None:
+            delay = schedule.delay_after(datetime.now())
+            self._push(agent_id, time.monotonic() + delay)
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """Extrae los agentes cuyo deadline ya venció."""
+        now = time.monotonic() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, agent_id = heapq.heappop(self._heap)
+            if self._deadlines.get(agent_id) == deadline:
+                del self._deadlines[agent_id]
+                due.append(agent_id)
+        return due
+
+    def next_deadline(self) -> Optional[float]:
+        """Deadline (reloj monotónico) más próximo, o ``None`` si no hay."""
+        while self._heap:
+            deadline, _, agent_id = self._heap[0]
+            if self._deadlines.get(agent_id) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def _push(self, agent_id: str, deadline: float) -> None:
+        self._deadlines[agent_id] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), agent_id))
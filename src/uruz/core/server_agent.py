@@ -1,9 +1,10 @@
-from typing import Dict, Any, List, Tuple
+from typing import AsyncIterator, Dict, Any, List, Tuple
 from time import time
 from .llm_agent import LLMAgent
 from ..security.vault import Vault
 from ..storage.database_manager import DatabaseManager
 from ..config import settings
+from ..llm.tokens import Usage
 import paramiko
 import os
 
@@ -96,6 +97,7 @@ class ServerAgent(LLMAgent):
         start_time = time()
         success = True
         error_message = None
+        usage = Usage()
         
         try:
             # Obtener credenciales
@@ -114,7 +116,9 @@ class ServerAgent(LLMAgent):
             No inventes información que no esté en las credenciales.
             """
             
-            response = await self.llm.generate(enhanced_prompt)
+            result = await self.llm.complete(enhanced_prompt)
+            usage = result.usage
+            response = result.text
             
             # Si el mensaje incluye una solicitud de ejecutar un comando
             if "lista" in message["content"].lower() and "directorio" in message["content"].lower():
@@ -144,14 +148,22 @@ class ServerAgent(LLMAgent):
                 agent_id=self.agent_id,
                 request_type="message",
                 processing_time=end_time - start_time,
-                tokens_used=len(message["content"]),
+                tokens_used=usage.total_tokens,
+                input_tokens=usage.input_tokens,
+                output_tokens=usage.output_tokens,
+                cached_tokens=usage.cached_tokens,
                 success=success,
                 error_message=error_message,
                 metadata={
                     "message_type": "command" if "lista" in message["content"].lower() else "query"
                 }
             )
-    
+
+    async def process_message_stream(self, message: Dict[str, Any]) -> AsyncIterator[str]:
+        """Emite la respuesta completa: puede depender de un comando SSH ejecutado al final."""
+        response = await self.process_message(message)
+        yield response["response"]
+
     async def act(self) -> List[Dict[str, Any]]:
         """Este agente no realiza acciones autónomas."""
         return [] 
\ No newline at end of file
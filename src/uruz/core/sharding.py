@@ -0,0 +1,465 @@
+"""
+Multi-process sharded environment.
+
+A single ``Environment`` runs every agent on one event loop, so a CPU-bound
+agent stalls the rest. ``ShardedEnvironment`` spreads agents across worker
+processes by hashing their ``agent_id``. Each worker runs its own
+``Environment`` holding only the agents of its shard, and the coordinator
+talks to the workers over pipes while exposing the usual ``step()``,
+``get_agent()`` and ``message_broker`` API.
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ..config import settings
+from .environment import Environment
+from .manifest import INDEX_FILENAME, ManifestIndex
+from .message import REPLY_TYPES, Message, MessageBroker
+
+logger = logging.getLogger(__name__)
+
+# Dirección de respuesta de los request() hechos desde un shard
+REPLY_PREFIX = "_shard."
+
+def shard_for(agent_id: str, num_shards: int) -> int:
+    """Devuelve el shard de un agente (estable entre procesos)."""
+    return zlib.crc32(agent_id.encode()) % num_shards
+
+def owner_shard(receiver_id: str, num_shards: int) -> int:
+    """Shard que recibe los mensajes de ``receiver_id``: el de su agente o el del request()."""
+    if receiver_id.startswith(REPLY_PREFIX):
+        return int(receiver_id[len(REPLY_PREFIX):])
+    return shard_for(receiver_id, num_shards)
+
+class _ShardBroker(MessageBroker):
+    """Broker de un worker que reenvía al coordinador los mensajes ajenos.
+
+    Cada shard solo conoce los tópicos de sus agentes, así que los
+    publicados en un tópico también se reenvían al coordinador, que los
+    reparte al resto de shards.
+    """
+
+    def __init__(self, shard_id: int, num_shards: int,
+                 forward: Callable[[Message], None],
+                 forward_topic: Optional[Callable[[str, Message], None]] = None):
+        super().__init__()
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self.forward = forward
+        self.forward_topic = forward_topic
+        self.reply_address = f"{REPLY_PREFIX}{shard_id}"
+
+    async def publish(self, message: Message) -> None:
+        """Entrega localmente o reenvía al shard dueño del receptor."""
+        if owner_shard(message.receiver_id, self.num_shards) != self.shard_id:
+            self.forward(message)
+            return
+        if message.receiver_id == self.reply_address:
+            if message.type not in REPLY_TYPES or not self._resolve_reply(message):
+                logger.debug(f"Dropping reply {message.correlation_id}: no request waiting")
+            return
+        await super().publish(message)
+
+    async def publish_many(self, messages: List[Message]) -> None:
+        """Entrega juntos los mensajes locales y reenvía los de otros shards."""
+        local = []
+        for message in messages:
+            if (owner_shard(message.receiver_id, self.num_shards) != self.shard_id
+                    or message.receiver_id == self.reply_address):
+                await self.publish(message)
+            else:
+                local.append(message)
+        if local:
+            await super().publish_many(local)
+
+    async def publish_topic(self, topic: str, message: Message) -> int:
+        """Entrega a los suscriptores del shard y reenvía el mensaje a los demás shards.
+
+        Returns:
+            Los agentes de este shard que lo recibieron; la entrega en los
+            demás shards es asíncrona.
+        """
+        if self.forward_topic is not None:
+            self.forward_topic(topic, message)
+        return await self.deliver_topic(topic, message)
+
+    async def deliver_topic(self, topic: str, message: Message) -> int:
+        """Entrega un mensaje de tópico solo a los suscriptores de este shard."""
+        return await super().publish_topic(topic, message)
+
+    def _reply_address(self, message: Message) -> str:
+        return self.reply_address
+
+class _ShardEnvironment(Environment):
+    """Environment de un worker que solo gestiona los agentes de su shard."""
+
+    def __init__(self, shard_id: int, num_shards: int,
+                 forward: Callable[[Message], None],
+                 forward_topic: Optional[Callable[[str, Message], None]] = None):
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        # El broker se inyecta antes de cargar los manifiestos, que suscriben tópicos
+        super().__init__(message_broker=_ShardBroker(shard_id, num_shards,
+                                                     forward, forward_topic))
+
+    def _register_manifest(self, agent_id: str, manifest: Dict[str, Any]) -> None:
+        if shard_for(agent_id, self.num_shards) == self.shard_id:
+            super()._register_manifest(agent_id, manifest)
+
+async def _op_add_agent(env: Environment, agent: Any) -> None:
+    env.add_agent(agent)
+
+async def _op_step(env: Environment, _: Any) -> List[Dict[str, Any]]:
+    return await env.step()
+
+async def _op_process_message(env: Environment, payload: Tuple[str, Any]) -> Any:
+    agent_id, message = payload
+    agent = env.get_agent(agent_id)
+    if agent is None:
+        raise KeyError(f"Agent {agent_id} not found")
+    return await agent.process_message(message)
+
+async def _op_act(env: Environment, agent_id: str) -> List[Dict[str, Any]]:
+    agent = env.get_agent(agent_id)
+    if agent is None:
+        raise KeyError(f"Agent {agent_id} not found")
+    return await agent.act()
+
+async def _op_publish(env: Environment, message: Message) -> None:
+    await env.message_broker.publish(message)
+
+async def _op_publish_many(env: Environment, messages: List[Message]) -> None:
+    await env.message_broker.publish_many(messages)
+
+async def _op_publish_topic(env: Environment, payload: Tuple[str, Message]) -> int:
+    topic, message = payload
+    return await env.message_broker.deliver_topic(topic, message)
+
+async def _op_join(env: Environment, _: Any) -> None:
+    await env.message_broker.join()
+
+async def _op_list_agents(env: Environment, _: Any) -> List[str]:
+    return env.list_agents()
+
+async def _op_reload(env: Environment, _: Any) -> List[str]:
+    return env.reload()
+
+_SHARD_OPS = {
+    "add_agent": _op_add_agent,
+    "step": _op_step,
+    "process_message": _op_process_message,
+    "act": _op_act,
+    "publish": _op_publish,
+    "publish_many": _op_publish_many,
+    "publish_topic": _op_publish_topic,
+    "join": _op_join,
+    "list_agents": _op_list_agents,
+    "reload": _op_reload,
+}
+
+def _shard_main(shard_id: int, num_shards: int, conn: Any) -> None:
+    """Punto de entrada de un proceso worker."""
+    asyncio.run(_serve_shard(shard_id, num_shards, conn))
+
+async def _serve_shard(shard_id: int, num_shards: int, conn: Any) -> None:
+    """Atiende las peticiones del coordinador hasta recibir ``stop``."""
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def send(reply: Tuple[Any, Any, Any]) -> None:
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # El resultado no se pudo serializar: informar el error
+            conn.send((reply[0], False, RuntimeError(f"Unpicklable result: {e}")))
+
+    def forward(message: Message) -> None:
+        send((None, "route", message))
+
+    def forward_topic(topic: str, message: Message) -> None:
+        send((None, "route_topic", (shard_id, topic, message)))
+
+    def reader() -> None:
+        while True:
+            try:
+                item = conn.recv()
+            except (EOFError, OSError):
+                item = (None, "stop", None)
+            loop.call_soon_threadsafe(inbox.put_nowait, item)
+            if item[1] == "stop":
+                return
+
+    async def handle(request_id: int, op: str, payload: Any) -> None:
+        try:
+            send((request_id, True, await _SHARD_OPS[op](env, payload)))
+        except Exception as e:
+            send((request_id, False, e))
+
+    env = _ShardEnvironment(shard_id, num_shards, forward, forward_topic)
+    threading.Thread(target=reader, daemon=True).start()
+
+    tasks = set()
+    while True:
+        request_id, op, payload = await inbox.get()
+        if op == "stop":
+            break
+        task = loop.create_task(handle(request_id, op, payload))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if request_id is not None:
+        send((request_id, True, None))
+    conn.close()
+
+class RemoteAgent:
+    """Proxy de un agente que vive en un proceso worker."""
+
+    def __init__(self, environment: "ShardedEnvironment", agent_id: str):
+        self.environment = environment
+        self.agent_id = agent_id
+        self.config: Dict[str, Any] = {}
+
+    async def process_message(self, message: Any) -> Any:
+        """Procesa un mensaje en el shard del agente."""
+        return await self.environment._call_agent("process_message",
+                                                  self.agent_id, (self.agent_id, message))
+
+    async def act(self) -> List[Dict[str, Any]]:
+        """Ejecuta act() en el shard del agente."""
+        return await self.environment._call_agent("act", self.agent_id, self.agent_id)
+
+class _CoordinatorBroker:
+    """Broker del coordinador: enruta cada mensaje al shard del receptor."""
+
+    def __init__(self, environment: "ShardedEnvironment"):
+        self.environment = environment
+
+    async def publish(self, message: Message) -> None:
+        """Publica un mensaje para su entrega."""
+        await self.environment._call(self._owner(message), "publish", message)
+
+    async def publish_many(self, messages: List[Message]) -> None:
+        """Publica varios mensajes con una petición por shard."""
+        by_shard: Dict[int, List[Message]] = {}
+        for message in messages:
+            by_shard.setdefault(self._owner(message), []).append(message)
+        await asyncio.gather(
+            *(self.environment._call(shard_id, "publish_many", batch)
+              for shard_id, batch in by_shard.items())
+        )
+
+    async def publish_topic(self, topic: str, message: Message,
+                            exclude: Optional[int] = None) -> int:
+        """Publica un mensaje en un tópico en todos los shards (salvo ``exclude``).
+
+        Returns:
+            El número de agentes que recibieron el mensaje.
+        """
+        delivered = await asyncio.gather(
+            *(self.environment._call(shard_id, "publish_topic", (topic, message))
+              for shard_id in range(self.environment.num_shards) if shard_id != exclude)
+        )
+        return sum(delivered)
+
+    def _owner(self, message: Message) -> int:
+        return owner_shard(message.receiver_id, self.environment.num_shards)
+
+    async def join(self) -> None:
+        """Espera a que se vacíen los mailboxes de todos los shards."""
+        await asyncio.gather(
+            *(self.environment._call(shard_id, "join")
+              for shard_id in range(self.environment.num_shards))
+        )
+
+class ShardedEnvironment:
+    """Environment que reparte los agentes entre varios procesos worker."""
+
+    def __init__(self, num_shards: Optional[int] = None, mp_context: Any = None):
+        """Initialize the sharded environment.
+
+        Args:
+            num_shards: Number of worker processes; defaults to
+                settings.SHARD_COUNT or the number of CPUs.
+            mp_context: multiprocessing context used to start the workers.
+        """
+        self.num_shards = num_shards or settings.SHARD_COUNT or os.cpu_count() or 1
+        self.message_broker = _CoordinatorBroker(self)
+        self.agents_dir = os.getenv('URUZ_AGENTS_DIR', 'agents')
+        self.data_dir = os.getenv('URUZ_DATA_DIR', 'data')
+        self.manifest_index = ManifestIndex(
+            self.agents_dir, os.path.join(self.data_dir, INDEX_FILENAME)
+        )
+        self.manifest_index.refresh()
+        self._added: List[str] = []
+        self._ctx = mp_context or multiprocessing.get_context()
+        self._processes: List[Any] = []
+        self._conns: List[Any] = []
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        """Arranca los procesos worker."""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        for shard_id in range(self.num_shards):
+            parent_conn, child_conn = self._ctx.Pipe()
+            process = self._ctx.Process(
+                target=_shard_main,
+                args=(shard_id, self.num_shards, child_conn),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._processes.append(process)
+            self._conns.append(parent_conn)
+
+        # Los hilos lectores se inician después de crear todos los procesos
+        for shard_id, conn in enumerate(self._conns):
+            threading.Thread(target=self._read, args=(shard_id, conn),
+                             daemon=True).start()
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Detiene los workers de forma ordenada."""
+        if self._loop is None:
+            return
+        await asyncio.gather(
+            *(self._call(shard_id, "stop") for shard_id in range(self.num_shards)),
+            return_exceptions=True
+        )
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._processes, self._conns = [], []
+        self._loop = None
+
+    async def __aenter__(self) -> "ShardedEnvironment":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def shard_for(self, agent_id: str) -> int:
+        """Devuelve el shard de un agente."""
+        return shard_for(agent_id, self.num_shards)
+
+    def add_agent(self, agent: Any) -> None:
+        """Envía un agente (serializable con pickle) a su shard."""
+        shard_id = self.shard_for(agent.agent_id)
+        future = asyncio.ensure_future(self._call(shard_id, "add_agent", agent))
+        future.add_done_callback(self._log_failure)
+        if agent.agent_id not in self._added:
+            self._added.append(agent.agent_id)
+
+    def get_agent(self, agent_id: str) -> Optional[RemoteAgent]:
+        """Devuelve un proxy del agente, o None si no existe."""
+        if agent_id in self._added or agent_id in self.manifest_index.agent_ids():
+            return RemoteAgent(self, agent_id)
+        return None
+
+    def list_agents(self) -> List[str]:
+        """List all agent IDs."""
+        return list(dict.fromkeys([*self.manifest_index.agent_ids(), *self._added]))
+
+    async def step(self) -> List[Dict[str, Any]]:
+        """Ejecuta un step en todos los shards en paralelo."""
+        outcomes = await asyncio.gather(
+            *(self._call(shard_id, "step") for shard_id in range(self.num_shards))
+        )
+        results = []
+        for actions in outcomes:
+            results.extend(actions)
+        return results
+
+    async def reload(self) -> List[str]:
+        """Aplica en todos los shards los cambios de manifiestos."""
+        self.manifest_index.refresh()
+        outcomes = await asyncio.gather(
+            *(self._call(shard_id, "reload") for shard_id in range(self.num_shards))
+        )
+        return [agent_id for changes in outcomes for agent_id in changes]
+
+    async def _call_agent(self, op: str, agent_id: str, payload: Any) -> Any:
+        return await self._call(self.shard_for(agent_id), op, payload)
+
+    async def _call(self, shard_id: int, op: str, payload: Any = None) -> Any:
+        """Envía una petición a un shard y espera su respuesta."""
+        if self._loop is None:
+            raise RuntimeError("ShardedEnvironment is not started")
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = (shard_id, future)
+        try:
+            self._conns[shard_id].send((request_id, op, payload))
+        except Exception:
+            self._pending.pop(request_id, None)
+            raise
+        return await future
+
+    def _read(self, shard_id: int, conn: Any) -> None:
+        """Hilo lector de las respuestas de un shard."""
+        loop = self._loop
+        while True:
+            try:
+                request_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                self._call_soon(loop, self._fail_shard, shard_id)
+                return
+            if request_id is None:
+                self._call_soon(loop, self._route, ok, result)
+            else:
+                self._call_soon(loop, self._resolve, request_id, ok, result)
+
+    @staticmethod
+    def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable, *args: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # El loop ya se cerró
+            pass
+
+    def _resolve(self, request_id: int, ok: bool, result: Any) -> None:
+        _, future = self._pending.pop(request_id, (None, None))
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(result)
+
+    def _fail_shard(self, shard_id: int) -> None:
+        for request_id, (owner, future) in list(self._pending.items()):
+            if owner == shard_id:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Shard {shard_id} exited"))
+
+    def _route(self, kind: str, payload: Any) -> None:
+        """Reenvía un mensaje publicado en un shard al shard del receptor.
+
+        Los mensajes de tópico (``route_topic``) se reparten al resto de
+        shards, que los entregan a sus suscriptores.
+        """
+        if kind == "route_topic":
+            origin, topic, message = payload
+            publish = self.message_broker.publish_topic(topic, message, exclude=origin)
+        else:
+            publish = self.message_broker.publish(payload)
+        future = asyncio.ensure_future(publish)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Sharded environment request failed: {future.exception()}")
@@ -0,0 +1,57 @@
+"""
+Warm-start snapshots of an Environment.
+
+A snapshot is a compact binary file holding the state reported by each agent
+and the list of agents that were hot when it was taken. Restoring it at boot
+lets a restarted process rebuild its hot agents up front and resume their
+in-memory state instead of starting cold. Manifests are not included: the
+compiled manifest index already makes loading them cheap.
+"""
+import logging
+import os
+import pickle
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILENAME = "snapshot.bin"
+
+def save_snapshot(path: str, states: Dict[str, Any], warm_agents: List[str]) -> None:
+    """Escribe un snapshot de forma atómica.
+
+    Los estados que no se pueden serializar se omiten con un aviso.
+    """
+    serializable = {}
+    for agent_id, state in states.items():
+        try:
+            pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+            serializable[agent_id] = state
+        except Exception as e:
+            logger.warning(f"Skipping unpicklable state of agent {agent_id}: {e}")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.time(),
+            "states": serializable,
+            "warm_agents": warm_agents,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """Lee un snapshot; devuelve None si no existe o no es compatible."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+    if data.get("version") != SNAPSHOT_VERSION:
+        return None
+    return data
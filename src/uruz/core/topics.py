@@ -0,0 +1,114 @@
+"""
+Topic index for wildcard subscriptions.
+
+Topics are dot-separated segments such as ``ops.db.alerts``. Patterns may
+use ``*`` to match exactly one segment and a trailing ``#`` to match zero
+or more segments. Patterns are stored in a segment trie, so matching a
+topic costs time proportional to its depth rather than to the number of
+subscribers.
+"""
+from typing import Dict, FrozenSet, Hashable, List, Set
+
+SINGLE = "*"
+MULTI = "#"
+MATCH_CACHE_SIZE = 4096
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.subscribers: Set[Hashable] = set()
+
+def _split(topic: str) -> List[str]:
+    segments = topic.split(".")
+    if not all(segments):
+        raise ValueError(f"Invalid topic: {topic!r}")
+    return segments
+
+class TopicIndex:
+    """Trie de patrones de tópicos y sus suscriptores."""
+
+    def __init__(self):
+        self._root = _Node()
+        self._cache: Dict[str, FrozenSet[Hashable]] = {}
+
+    def add(self, pattern: str, subscriber: Hashable) -> None:
+        """Registra un suscriptor para un patrón."""
+        segments = _split(pattern)
+        if MULTI in segments[:-1]:
+            raise ValueError(f"'{MULTI}' is only allowed as the last segment: {pattern!r}")
+        node = self._root
+        for segment in segments:
+            node = node.children.setdefault(segment, _Node())
+        node.subscribers.add(subscriber)
+        self._cache.clear()
+
+    def remove(self, pattern: str, subscriber: Hashable) -> None:
+        """Elimina un suscriptor de un patrón y poda las ramas vacías."""
+        path = [self._root]
+        for segment in _split(pattern):
+            node = path[-1].children.get(segment)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].subscribers.discard(subscriber)
+
+        segments = _split(pattern)
+        for depth in range(len(segments), 0, -1):
+            node = path[depth]
+            if node.subscribers or node.children:
+                break
+            del path[depth - 1].children[segments[depth - 1]]
+        self._cache.clear()
+
+    def remove_subscriber(self, subscriber: Hashable) -> None:
+        """Elimina un suscriptor de todos sus patrones."""
+        for pattern in self.patterns(subscriber):
+            self.remove(pattern, subscriber)
+
+    def patterns(self, subscriber: Hashable) -> List[str]:
+        """Patrones a los que está suscrito un suscriptor."""
+        found, stack = [], [(self._root, [])]
+        while stack:
+            node, prefix = stack.pop()
+            if subscriber in node.subscribers:
+                found.append(".".join(prefix))
+            for segment, child in node.children.items():
+                stack.append((child, prefix + [segment]))
+        return found
+
+    def match(self, topic: str) -> FrozenSet[Hashable]:
+        """Devuelve los suscriptores de todos los patrones que casan con ``topic``."""
+        cached = self._cache.get(topic)
+        if cached is not None:
+            return cached
+
+        matched: Set[Hashable] = set()
+        nodes = [self._root]
+        for segment in _split(topic):
+            next_nodes = []
+            for node in nodes:
+                multi = node.children.get(MULTI)
+                if multi is not None:
+                    matched |= multi.subscribers
+                exact = node.children.get(segment)
+                if exact is not None:
+                    next_nodes.append(exact)
+                single = node.children.get(SINGLE)
+                if single is not None:
+                    next_nodes.append(single)
+            nodes = next_nodes
+            if not nodes:
+                break
+
+        for node in nodes:
+            matched |= node.subscribers
+            multi = node.children.get(MULTI)
+            if multi is not None:
+                matched |= multi.subscribers
+
+        if len(self._cache) >= MATCH_CACHE_SIZE:
+            self._cache.clear()
+        result = self._cache[topic] = frozenset(matched)
+        return result
@@ -1,10 +1,12 @@
 from .base import LLMProvider
 from .openai_provider import OpenAIProvider
 from .anthropic_provider import AnthropicProvider
+from .router import RouterProvider
 
 PROVIDERS = {
     "openai": OpenAIProvider,
-    "anthropic": AnthropicProvider
+    "anthropic": AnthropicProvider,
+    "router": RouterProvider
 }
 
 def get_provider(name: str) -> type:
@@ -1,6 +1,7 @@
-from typing import Dict, Any
-from anthropic import Anthropic
+from typing import AsyncIterator, Dict, Any
 from .base import LLMProvider
+from .tokens import LLMResult, Usage
+from ..clients import anthropic_key, clients, get_anthropic
 from ..config import settings
 import logging
 
@@ -9,44 +10,53 @@ logger = logging.getLogger(__name__)
 class AnthropicProvider(LLMProvider):
     """Proveedor de LLM usando Anthropic Claude."""
     
+    name = "anthropic"
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         # Siempre usar la API key de settings
-        self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        self.client = get_anthropic(settings.ANTHROPIC_API_KEY)
         # Usar configuración del settings como valores por defecto
         self.model = config.get("model", settings.LLM_CONFIG["model"])
         self.max_tokens = config.get("max_tokens", settings.LLM_CONFIG["max_tokens"])
         self.temperature = config.get("temperature", settings.LLM_CONFIG["temperature"])
         self.system_prompt = config.get("system_prompt", "")
     
-    async def generate(self, prompt: str) -> str:
-        """Genera una respuesta usando Claude."""
-        try:
-            # Intentar obtener respuesta cacheada
-            cached_response = self._get_cached_response(prompt)
-            if cached_response:
-                return cached_response
-                
-            # Generar nueva respuesta
-            message = await self.client.messages.create(
-                model=self.model,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
-            
-            response = message.content[0].text
-            
-            # Cachear la respuesta
-            self._cache_response(prompt, response)
-            
-            return response
-            
-        except Exception as e:
-            logger.error(f"Error generando respuesta con Claude: {e}")
-            raise 
\ No newline at end of file
+    def close(self) -> None:
+        """Libera el cliente compartido de Anthropic."""
+        super().close()
+        if self.client is not None:
+            self.client = None
+            clients.release("anthropic", anthropic_key(settings.ANTHROPIC_API_KEY))
+    
+    def _params(self, prompt: str) -> Dict[str, Any]:
+        params = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "timeout": self.timeout,
+        }
+        if self.system_prompt:
+            params["system"] = self.system_prompt
+        return params
+    
+    async def _request(self, prompt: str) -> LLMResult:
+        message = await self.client.messages.create(**self._params(prompt))
+        return LLMResult(message.content[0].text, Usage.from_anthropic(message.usage))
+    
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Genera una respuesta con Claude emitiendo el texto según llega."""
+        return self._cached_stream(prompt, self._stream)
+    
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        async with self.client.messages.stream(**self._params(prompt)) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+            self.usage.add(Usage.from_anthropic(message.usage))
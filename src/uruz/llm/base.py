@@ -1,33 +1,294 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, Optional
+import asyncio
 import hashlib
-from ..cache.redis_provider import RedisProvider
+import logging
+from ..cache.async_redis_provider import AsyncRedisProvider
+from ..config import settings
+from .ratelimit import RateLimiter, get_rate_limiter
+from .retry import Hedger, RetryPolicy
+from .semantic_cache import SemanticCache
+from .singleflight import SingleFlight, acquire_lock, release_lock
+from .tokens import LLMResult, Usage, context_window, estimate_tokens, fit_prompt
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto revisa la caché quien espera la llamada de otro proceso
+LOCK_POLL_INTERVAL = 0.05
 
 class LLMProvider(ABC):
     """Clase base para proveedores de LLM."""
     
+    # Nombre del proveedor en PROVIDERS y en settings.LLM_RATE_LIMITS
+    name = "llm"
+    # Llamadas en curso del proceso, compartidas por todos los proveedores
+    flights = SingleFlight()
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self.cache = RedisProvider()
+        # Timeout por petición al LLM (``llm_timeout``); ``timeout`` es el de act().
+        # Los clientes compartidos usan settings.LLM_TIMEOUT
+        self.timeout = config.get("llm_timeout", settings.LLM_TIMEOUT)
+        self._embedding_provider: Optional["LLMProvider"] = None
+        self._limiter: Optional[RateLimiter] = None
+        self.retry = RetryPolicy(config.get("max_retries"), deadline=config.get("deadline"))
+        self.hedger = Hedger() if config.get("hedge", settings.LLM_HEDGE) else None
+        # Antes de tomar clientes compartidos: una configuración inválida no deja nada abierto
+        self.semantic_cache = self._create_semantic_cache()
+        self.cache = AsyncRedisProvider()
+        # Tokens reales consumidos por el proveedor desde que se creó
+        self.usage = Usage()
+        
+    def close(self) -> None:
+        """Libera los clientes compartidos del proveedor."""
+        self.cache.close()
+        if self._embedding_provider is not None:
+            self._embedding_provider.close()
+            self._embedding_provider = None
+    
+    def _create_semantic_cache(self) -> Optional[SemanticCache]:
+        """Crea la caché semántica si ``semantic_cache`` (o la configuración global) la activa.
+        
+        ``semantic_cache`` puede ser un bool o un dict con ``embedder``
+        (``openai`` o una corrutina), ``threshold`` y ``capacity``. El
+        embedder tiene que ser un modelo de embeddings real: con uno léxico
+        una pregunta y su negación superan el umbral y se serviría la
+        respuesta contraria.
+        """
+        options = self.config.get("semantic_cache", settings.LLM_SEMANTIC_CACHE)
+        if not options:
+            return None
+        options = options if isinstance(options, dict) else {}
+        embedder = options.get("embedder", settings.LLM_SEMANTIC_EMBEDDER)
+        if embedder == "hashing":
+            raise ValueError("HashingEmbedder is for tests only; the semantic cache "
+                             "needs a real embedding model such as 'openai'")
+        if embedder == "openai":
+            from .openai_provider import OpenAIProvider
+            if not isinstance(self, OpenAIProvider):
+                self._embedding_provider = OpenAIProvider({"semantic_cache": False})
+            embedder = (self._embedding_provider or self).embed
+        elif not callable(embedder):
+            raise ValueError(f"Unknown semantic cache embedder: {embedder}")
+        return SemanticCache(
+            embedder,
+            threshold=options.get("threshold", settings.LLM_SEMANTIC_THRESHOLD),
+            capacity=options.get("capacity", settings.LLM_SEMANTIC_CAPACITY),
+        )
         
     def _get_cache_key(self, prompt: str) -> str:
-        """Genera una clave de caché para un prompt."""
-        # Incluir configuración relevante en la clave
-        cache_key = f"{prompt}:{self.config.get('model')}:{self.config.get('temperature')}"
-        return f"llm:response:{hashlib.md5(cache_key.encode()).hexdigest()}"
+        """Genera una clave de caché para un prompt.
+        
+        La clave es también la de single-flight: incluye el proveedor, el
+        modelo efectivo (no solo el configurado), la temperatura y el system
+        prompt, para que solo coincidan peticiones idénticas.
+        """
+        parts = (
+            self.name,
+            getattr(self, "model", None),
+            getattr(self, "temperature", self.config.get("temperature")),
+            getattr(self, "system_prompt", self.config.get("system_prompt", "")),
+            prompt,
+        )
+        return f"llm:response:{hashlib.md5(repr(parts).encode()).hexdigest()}"
         
-    def _get_cached_response(self, prompt: str) -> Optional[str]:
-        """Obtiene una respuesta cacheada."""
+    async def _get_cached_response(self, prompt: str) -> Optional[str]:
+        """Obtiene una respuesta cacheada, exacta o de un prompt equivalente."""
         cache_key = self._get_cache_key(prompt)
-        return self.cache.get_cache(cache_key)
+        cached = await self.cache.get_cache(cache_key)
+        if cached is None and self.semantic_cache is not None:
+            cached = await self.semantic_cache.lookup(prompt)
+        return cached
         
     def _cache_response(self, prompt: str, response: str,
                        expire: int = 3600) -> None:
-        """Almacena una respuesta en caché."""
-        cache_key = self._get_cache_key(prompt)
-        self.cache.set_cache(cache_key, response, expire)
+        """Almacena una respuesta en caché, en segundo plano."""
+        self.cache_responses({prompt: response}, expire)
+    
+    async def cached_responses(self, prompts: List[str]) -> List[Optional[str]]:
+        """Respuestas cacheadas de varios prompts, en una sola consulta."""
+        answers = await self.cache.get_many([self._get_cache_key(prompt) for prompt in prompts])
+        if self.semantic_cache is not None:
+            for i, answer in enumerate(answers):
+                if answer is None:
+                    answers[i] = await self.semantic_cache.lookup(prompts[i])
+        return answers
+    
+    def cache_responses(self, responses: Dict[str, str], expire: int = 3600) -> None:
+        """Almacena en segundo plano las respuestas de varios prompts."""
+        self.cache.set_many_later(
+            {self._get_cache_key(prompt): response for prompt, response in responses.items()},
+            expire
+        )
+        if self.semantic_cache is not None:
+            self.semantic_cache.add_later(responses)
+    
+    @property
+    def limiter(self) -> RateLimiter:
+        """Limitador compartido del proveedor y modelo."""
+        if self._limiter is None:
+            self._limiter = get_rate_limiter(self.name, getattr(self, "model", None))
+        return self._limiter
+    
+    def _estimate_tokens(self, prompt: str) -> int:
+        """Tokens que reserva una petición: el prompt estimado más la respuesta máxima."""
+        return estimate_tokens(prompt) + getattr(self, "max_tokens", 0)
+    
+    def _prompt_budget(self) -> Optional[int]:
+        """Tokens disponibles para el prompt: la ventana menos la respuesta y el system prompt.
+        
+        None si no se conoce la ventana del modelo: entonces no se recorta nada.
+        """
+        window = self.config.get("context_window") or context_window(getattr(self, "model", None))
+        if window is None:
+            return None
+        system_prompt = getattr(self, "system_prompt", "")
+        return (window - getattr(self, "max_tokens", 0)
+                - (estimate_tokens(system_prompt) if system_prompt else 0))
+    
+    def fit_prompt(self, prompt: str) -> str:
+        """Recorta o rechaza, antes de llamar a la red, un prompt que no cabe en la ventana.
+        
+        La política es ``prompt_overflow`` de la configuración o
+        settings.LLM_PROMPT_OVERFLOW (``trim``/``reject``).
+        """
+        policy = self.config.get("prompt_overflow", settings.LLM_PROMPT_OVERFLOW)
+        fitted = fit_prompt(prompt, self._prompt_budget(), policy)
+        if fitted is not prompt:
+            logger.warning(f"Prompt trimmed from ~{estimate_tokens(prompt)} to "
+                           f"~{estimate_tokens(fitted)} tokens to fit {self.name}")
+        return fitted
+    
+    async def _call(self, request: Callable[[str], Awaitable[LLMResult]],
+                    prompt: str) -> LLMResult:
+        """Llama al LLM con límites de uso, reintentos dentro del plazo y hedging opcional."""
+        tokens = self._estimate_tokens(prompt)
+        
+        async def attempt() -> LLMResult:
+            async with self.limiter.limit(tokens) as slot:
+                result = await request(prompt)
+                if isinstance(result, str):
+                    result = LLMResult(result)
+                slot.output_tokens = result.usage.output_tokens
+            self.usage.add(result.usage)
+            if result.usage.total_tokens:
+                # Se devuelve al bucket lo reservado de más (o se cobra lo que faltó)
+                await self.limiter.settle(tokens, result.usage.total_tokens)
+            return result
+        
+        if self.hedger is None:
+            return await self.retry.run(attempt)
+        return await self.retry.run(lambda: self.hedger.run(attempt))
+    
+    async def _call_stream(self, chunks: Callable[[str], AsyncIterator[str]],
+                           prompt: str) -> AsyncIterator[str]:
+        """Como _call() para streams, sin reintentos: lo ya emitido no se puede repetir."""
+        async with self.limiter.limit(self._estimate_tokens(prompt)) as slot:
+            async for chunk in chunks(prompt):
+                slot.mark()
+                yield chunk
+    
+    async def _single_flight(self, prompt: str,
+                             request: Callable[[str], Awaitable[LLMResult]]) -> LLMResult:
+        """Llama al LLM una sola vez por prompt aunque lleguen varios a la vez.
+        
+        Las llamadas concurrentes con la misma clave de caché esperan el
+        resultado de la primera. Con ``singleflight_lock_ms`` (o
+        settings.LLM_SINGLEFLIGHT_LOCK_MS) la coordinación se extiende a
+        otros procesos mediante un lock en Redis.
+        """
+        key = self._get_cache_key(prompt)
+        leader = False
+        
+        def fill() -> Awaitable[LLMResult]:
+            nonlocal leader
+            leader = True
+            return self._fill(prompt, key, request)
+        
+        result = await self.flights.do(key, fill)
+        # Solo la llamada que hizo la petición cuenta sus tokens
+        return result if leader else LLMResult(result.text, cached=True)
+    
+    async def _fill(self, prompt: str, key: str,
+                    request: Callable[[str], Awaitable[LLMResult]]) -> LLMResult:
+        lock_ms = self.config.get("singleflight_lock_ms", settings.LLM_SINGLEFLIGHT_LOCK_MS)
+        if not lock_ms:
+            result = await self._call(request, prompt)
+            self._cache_response(prompt, result.text)
+            return result
+        
+        redis, lock_key = self.cache.redis, f"{key}:lock"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + lock_ms / 1000
+        token = await acquire_lock(redis, lock_key, lock_ms, self.cache.timeout)
+        while token is None and loop.time() < deadline:
+            # Otro proceso hace la misma llamada: esperar a que llene la caché
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            cached = await self.cache.get_cache(key)
+            if cached:
+                return LLMResult(cached, cached=True)
+            token = await acquire_lock(redis, lock_key, lock_ms, self.cache.timeout)
+        try:
+            result = await self._call(request, prompt)
+            # Se escribe antes de soltar el lock para que los demás la encuentren
+            await self.cache.set_cache(key, result.text, 3600,
+                                       timeout=settings.CACHE_WRITE_TIMEOUT)
+            if self.semantic_cache is not None:
+                self.semantic_cache.add_later({prompt: result.text})
+            return result
+        finally:
+            if token is not None:
+                await release_lock(redis, lock_key, token, self.cache.timeout)
+    
+    async def _cached_stream(self, prompt: str,
+                             chunks: Callable[[str], AsyncIterator[str]],
+                             cache: bool = True) -> AsyncIterator[str]:
+        """Emite los fragmentos de ``chunks`` y cachea el texto completo al terminar.
+        
+        Una respuesta cacheada se emite en un solo fragmento. Si el stream se
+        interrumpe (error o cliente desconectado) no se cachea nada. Con
+        ``cache=False`` no se usa la caché, pero el prompt se sigue ajustando
+        a la ventana y la llamada pasa por los límites de uso.
+        """
+        prompt = self.fit_prompt(prompt)
+        cached = await self._get_cached_response(prompt) if cache else None
+        if cached:
+            yield cached
+            return
+        parts = []
+        async for chunk in self._call_stream(chunks, prompt):
+            parts.append(chunk)
+            yield chunk
+        if cache:
+            self._cache_response(prompt, "".join(parts))
+    
+    async def complete(self, prompt: str) -> LLMResult:
+        """Genera una respuesta con los tokens que consumió.
+        
+        El prompt se ajusta a la ventana de contexto antes de nada; una
+        respuesta cacheada se devuelve con ``cached=True`` y sin tokens.
+        """
+        prompt = self.fit_prompt(prompt)
+        cached_response = await self._get_cached_response(prompt)
+        if cached_response:
+            return LLMResult(cached_response, cached=True)
+        # Una sola petición por prompt en curso
+        return await self._single_flight(prompt, self._request)
     
-    @abstractmethod
     async def generate(self, prompt: str) -> str:
         """Genera una respuesta usando el LLM."""
+        try:
+            return (await self.complete(prompt)).text
+        except Exception as e:
+            logger.error(f"Error generando respuesta con {self.name}: {e}")
+            raise
+    
+    @abstractmethod
+    async def _request(self, prompt: str) -> LLMResult:
+        """Hace una petición al LLM, sin caché ni reintentos."""
+        pass
+    
+    @abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Genera una respuesta fragmento a fragmento, según la va produciendo el LLM."""
         pass 
\ No newline at end of file
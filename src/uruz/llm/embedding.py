@@ -0,0 +1,136 @@
+"""
+Micro-batched embeddings.
+
+Embedding requests are dominated by the round trip, not by the number of
+inputs, so ``EmbeddingBatcher`` gathers concurrent ``embed()`` calls into a
+single request. A batch is sent when ``max_batch_size`` texts are waiting or
+``max_wait`` seconds after the first one arrived, and each caller receives
+its own row of the result. ``embed_many`` embeds a large iterable in chunks
+while the next chunk is already in flight.
+
+Vectors are returned as contiguous float32 NumPy arrays.
+"""
+import asyncio
+import base64
+import itertools
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+BatchEmbedder = Callable[[List[str]], Awaitable[Any]]
+
+class EmbeddingBatcher:
+    """Agrupa llamadas concurrentes de embedding en una sola petición."""
+
+    def __init__(self, embed_batch: BatchEmbedder,
+                 max_batch_size: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        """Initialize the batcher.
+
+        Args:
+            embed_batch: Coroutine function that embeds a list of texts and
+                returns one vector per text, in order.
+            max_batch_size: Texts per request; defaults to
+                settings.LLM_EMBED_BATCH_SIZE.
+            max_wait: Seconds the first text of a batch may wait for more;
+                defaults to settings.LLM_EMBED_BATCH_WINDOW.
+        """
+        self.embed_batch = embed_batch
+        self.max_batch_size = max(1, max_batch_size or settings.LLM_EMBED_BATCH_SIZE)
+        self.max_wait = settings.LLM_EMBED_BATCH_WINDOW if max_wait is None else max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.texts = 0
+        self.calls = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embedding de un texto, enviado junto con los que lleguen a la vez."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.calls += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    async def embed_many(self, texts: Iterable[str]) -> AsyncIterator[np.ndarray]:
+        """Embeddings de un iterable, como una matriz (n, dim) por bloque.
+
+        El siguiente bloque se pide mientras el llamador procesa el actual.
+        """
+        iterator = iter(texts)
+        pending: Optional[asyncio.Task] = None
+        try:
+            while True:
+                chunk = list(itertools.islice(iterator, self.max_batch_size))
+                task = asyncio.ensure_future(self._embed_matrix(chunk)) if chunk else None
+                if pending is not None:
+                    yield await pending
+                pending = task
+                if task is None:
+                    return
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Los textos repetidos en el lote se piden una sola vez
+        rows: Dict[str, int] = {}
+        for text, _ in batch:
+            rows.setdefault(text, len(rows))
+        try:
+            vectors = await self._embed_matrix(list(rows))
+        except Exception as e:
+            logger.debug(f"Embedding batch of {len(rows)} texts failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[rows[text]])
+
+    async def _embed_matrix(self, texts: List[str]) -> np.ndarray:
+        self.requests += 1
+        self.texts += len(texts)
+        vectors = np.ascontiguousarray(await self.embed_batch(texts), dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got shape {vectors.shape}")
+        return vectors
+
+    async def close(self) -> None:
+        """Envía los textos pendientes y espera a que terminen las peticiones."""
+        self._flush()
+        if self._batches:
+            await asyncio.gather(*list(self._batches), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores del batcher."""
+        return {
+            "calls": self.calls,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.requests if self.requests else 0.0,
+            "pending": len(self._pending),
+        }
+
+def decode_base64_embeddings(embeddings: Sequence[str]) -> np.ndarray:
+    """Matriz float32 a partir de embeddings codificados en base64 (little-endian)."""
+    return np.vstack([np.frombuffer(base64.b64decode(data), dtype="<f4") for data in embeddings])
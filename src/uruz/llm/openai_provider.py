@@ -1,6 +1,10 @@
-from typing import Dict, Any, List, Optional, AsyncGenerator
-import openai
+from typing import AsyncIterator, Dict, Any, Iterable, List, Optional
+import numpy as np
 from .base import LLMProvider
+from .embedding import EmbeddingBatcher, decode_base64_embeddings
+from .tokens import LLMResult, Usage
+from ..clients import clients, get_openai, openai_key
+from ..config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,70 +12,104 @@ logger = logging.getLogger(__name__)
 class OpenAIProvider(LLMProvider):
     """Implementación del proveedor de OpenAI."""
     
+    name = "openai"
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
-        openai.api_key = config["api_key"]
+        self.api_key = config.get("api_key") or settings.OPENAI_API_KEY
+        self.client = get_openai(self.api_key)
         self.model = config.get("model", "gpt-4")
+        self.max_tokens = config.get("max_tokens", settings.LLM_CONFIG["max_tokens"])
+        self.temperature = config.get("temperature", settings.LLM_CONFIG["temperature"])
+        self.system_prompt = config.get("system_prompt", "")
+        self.embedding_model = config.get("embedding_model", settings.LLM_EMBEDDING_MODEL)
+        self.embeddings = EmbeddingBatcher(
+            self._embed_batch,
+            config.get("embed_batch_size"),
+            config.get("embed_batch_window")
+        )
+    
+    def close(self) -> None:
+        """Libera el cliente compartido de OpenAI."""
+        super().close()
+        if self.client is not None:
+            self.client = None
+            clients.release("openai", openai_key(self.api_key))
+    
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        messages = [{"role": "user", "content": prompt}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        return messages
         
-    async def generate(self, prompt: str) -> str:
-        """Genera una respuesta usando OpenAI."""
-        try:
-            # Intentar obtener respuesta cacheada
-            cached_response = self._get_cached_response(prompt)
-            if cached_response:
-                return cached_response
-                
-            # Generar nueva respuesta
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
-            
-            result = response.choices[0].message.content
-            
-            # Cachear la respuesta
-            self._cache_response(prompt, result)
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error generando respuesta con OpenAI: {e}")
-            raise
+    async def _request(self, prompt: str) -> LLMResult:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            timeout=self.timeout
+        )
+        return LLMResult(response.choices[0].message.content, Usage.from_openai(response.usage))
         
-    async def embed(self, text: str) -> List[float]:
-        response = await openai.Embedding.acreate(
-            model="text-embedding-ada-002",
-            input=text
+    async def embed(self, text: str) -> np.ndarray:
+        """Embedding float32 de un texto; las llamadas concurrentes van en una petición."""
+        return await self.embeddings.embed(text)
+    
+    def embed_many(self, texts: Iterable[str]) -> AsyncIterator[np.ndarray]:
+        """Embeddings de muchos textos, como una matriz float32 por bloque."""
+        return self.embeddings.embed_many(texts)
+    
+    async def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        # En base64 los vectores llegan como float32 sin pasar por listas de Python
+        response = await self.client.embeddings.create(
+            model=self.embedding_model,
+            input=texts,
+            encoding_format="base64",
+            timeout=self.timeout
         )
-        return response.data[0].embedding
+        data = sorted(response.data, key=lambda item: item.index)
+        return decode_base64_embeddings([item.embedding for item in data])
         
-    async def stream(
+    def stream(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Genera una respuesta con OpenAI emitiendo el texto según llega.
+        
+        Con parámetros distintos a los del proveedor la respuesta no
+        corresponde a su clave de caché, así que no se cachea.
+        """
+        if max_tokens is None and temperature is None and not kwargs:
+            return self._cached_stream(prompt, self._stream)
+        return self._cached_stream(
+            prompt, lambda fitted: self._stream(fitted, max_tokens, temperature, **kwargs),
+            cache=False
+        )
+    
+    async def _stream(
         self,
         prompt: str,
         max_tokens: Optional[int] = None,
-        temperature: float = 0.7,
+        temperature: Optional[float] = None,
         **kwargs
-    ) -> AsyncGenerator[str, None]:
-        response = await openai.ChatCompletion.acreate(
+    ) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=temperature,
+            messages=self._messages(prompt),
+            max_tokens=max_tokens or self.max_tokens,
+            temperature=self.temperature if temperature is None else temperature,
             stream=True,
-            **kwargs
+            timeout=self.timeout,
+            **{"stream_options": {"include_usage": True}, **kwargs}
         )
         
         async for chunk in response:
+            if chunk and chunk.usage:
+                # El último fragmento, sin texto, trae los tokens del stream
+                self.usage.add(Usage.from_openai(chunk.usage))
             if chunk and chunk.choices and chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content 
\ No newline at end of file
+                yield chunk.choices[0].delta.content
@@ -0,0 +1,364 @@
+"""
+Rate limits and adaptive concurrency for LLM providers.
+
+Each provider and model gets one ``RateLimiter``, shared by every agent in
+the process. It combines:
+
+* token buckets for requests and tokens per minute (``settings.LLM_RATE_LIMITS``),
+  kept in process or, with ``LLM_RATE_LIMIT_BACKEND="redis"``, in Redis so
+  that every process draws from the same budget;
+* an AIMD concurrency governor: the number of requests in flight grows by one
+  per window of successful calls and is halved on a 429 or when latency
+  rises well above its baseline. Latency is judged by a signal that does not
+  grow with the length of the answer: time to first token for streams,
+  latency per output token otherwise.
+
+Time spent waiting for a bucket or a concurrency slot is measured apart from
+the provider's own latency.
+"""
+import asyncio
+import collections
+import contextlib
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from ..clients import get_async_redis
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Respuestas del proveedor que indican que hay que bajar el ritmo
+THROTTLE_STATUS = (429, 529)
+
+# Tokens de salida mínimos al normalizar la latencia: en las respuestas
+# cortas casi todo el tiempo es el del primer token
+MIN_OUTPUT_TOKENS = 32
+
+def is_throttle(error: BaseException) -> bool:
+    """Indica si un error del SDK es un rechazo por límite de uso o sobrecarga."""
+    return getattr(error, "status_code", None) in THROTTLE_STATUS
+
+class TokenBucket:
+    """Token bucket en memoria con reserva: quien llega primero se sirve primero."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        if per_minute <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """Reserva ``amount`` tokens y devuelve los segundos a esperar para usarlos."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # Una petición mayor que el bucket no podría pasar nunca
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Espera hasta disponer de ``amount`` tokens; devuelve lo esperado."""
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def adjust(self, amount: float) -> None:
+        """Corrige una reserva ya hecha, sin esperar; negativo devuelve tokens."""
+        self.reserve(amount)
+
+# Mismo algoritmo que TokenBucket, con el reloj del servidor para que todos
+# los procesos lo compartan
+_RESERVE_SCRIPT = """
+local rate, capacity, amount = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+tokens = tokens - math.min(amount, capacity)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+if tokens >= 0 then return '0' end
+return tostring(-tokens / rate)
+"""
+
+class RedisTokenBucket(TokenBucket):
+    """Token bucket compartido entre procesos; si Redis falla, usa el bucket local."""
+
+    def __init__(self, redis: Any, key: str, per_minute: float,
+                 capacity: Optional[float] = None):
+        super().__init__(per_minute, capacity)
+        self.redis = redis
+        self.key = key
+        self.errors = 0
+
+    async def acquire(self, amount: float = 1) -> float:
+        try:
+            wait = float(await asyncio.wait_for(
+                self.redis.eval(_RESERVE_SCRIPT, 1, self.key, self.rate, self.capacity, amount),
+                settings.CACHE_WRITE_TIMEOUT
+            ))
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"Rate limit bucket {self.key} unavailable, limiting locally: {e}")
+            wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def adjust(self, amount: float) -> None:
+        try:
+            await asyncio.wait_for(
+                self.redis.eval(_RESERVE_SCRIPT, 1, self.key, self.rate, self.capacity, amount),
+                settings.CACHE_WRITE_TIMEOUT
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"Rate limit bucket {self.key} unavailable, adjusting locally: {e}")
+            self.reserve(amount)
+
+class ConcurrencyGovernor:
+    """Límite de peticiones en curso con aumento aditivo y reducción multiplicativa."""
+
+    def __init__(self, initial: int = 16, minimum: int = 1, maximum: int = 100,
+                 latency_tolerance: float = 2.0, backoff: float = 0.5):
+        """Initialize the governor.
+
+        Args:
+            initial: Concurrency limit to start with.
+            minimum: The limit never drops below this.
+            maximum: The limit never grows above this.
+            latency_tolerance: A call whose latency signal exceeds this
+                multiple of its baseline counts as congestion.
+            backoff: Factor applied to the limit on congestion.
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        # Referencia de cada señal de latencia: ttft, per_token o latency
+        self.baselines: Dict[str, float] = {}
+        # Media móvil de la latencia completa, en segundos
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = float("-inf")
+        self._waiters: "collections.deque[asyncio.Future]" = collections.deque()
+
+    @property
+    def queued(self) -> int:
+        """Peticiones esperando un hueco."""
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Espera un hueco libre bajo el límite actual."""
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # El hueco ya era nuestro: se devuelve
+                self.release()
+            else:
+                self._waiters.remove(future)
+            raise
+
+    def release(self) -> None:
+        """Devuelve un hueco y despierta a quien esté esperando."""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def on_success(self, latency: float, output_tokens: int = 0,
+                   streamed: bool = False) -> None:
+        """Registra una llamada correcta.
+
+        En streams ``latency`` es el tiempo hasta el primer token; si no, se
+        divide por los tokens de salida para que una respuesta larga no pase
+        por congestión. Sin tokens conocidos se usa la latencia completa.
+        """
+        if streamed:
+            kind, signal = "ttft", latency
+        elif output_tokens:
+            kind, signal = "per_token", latency / max(output_tokens, MIN_OUTPUT_TOKENS)
+        else:
+            kind, signal = "latency", latency
+        self.latency = latency if self.latency is None else self.latency + 0.1 * (latency - self.latency)
+        baseline = self.baselines.get(kind, signal)
+        congested = signal > baseline * self.latency_tolerance
+        # Las muestras lentas mueven la referencia despacio, por si el cambio es permanente
+        alpha = 0.02 if congested else 0.1
+        self.baselines[kind] = baseline + alpha * (signal - baseline)
+        if congested:
+            self._decrease()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_throttle(self) -> None:
+        """Registra un rechazo del proveedor por límite de uso."""
+        self._decrease()
+
+    def _decrease(self) -> None:
+        # Una sola reducción por ráfaga: las llamadas concurrentes fallan juntas
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        self.decreases += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del governor."""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "latency": self.latency or 0.0,
+            "baselines": dict(self.baselines),
+            "decreases": self.decreases,
+        }
+
+class Slot:
+    """Petición admitida por un RateLimiter."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_byte: Optional[float] = None
+        # Tokens generados, si la petición los informa
+        self.output_tokens = 0
+
+    def mark(self) -> None:
+        """Marca la llegada del primer fragmento de un stream."""
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+
+class RateLimiter:
+    """Límites de un proveedor y modelo: buckets por minuto y concurrencia adaptativa."""
+
+    def __init__(self, name: str, governor: ConcurrencyGovernor,
+                 requests: Optional[TokenBucket] = None,
+                 tokens: Optional[TokenBucket] = None):
+        self.name = name
+        self.governor = governor
+        self.requests = requests
+        self.tokens = tokens
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.provider_latency = 0.0
+
+    @contextlib.asynccontextmanager
+    async def limit(self, tokens: int = 0) -> AsyncIterator[Slot]:
+        """Espera turno para una petición de ``tokens`` tokens y mide su latencia.
+
+        Para streams, ``Slot.mark()`` en el primer fragmento hace que la
+        latencia medida sea la del primer token; en las demás peticiones,
+        ``Slot.output_tokens`` permite normalizarla por tokens generados.
+        """
+        queued_at = time.monotonic()
+        await self.governor.acquire()
+        try:
+            if self.requests is not None:
+                await self.requests.acquire(1)
+            if self.tokens is not None and tokens:
+                await self.tokens.acquire(tokens)
+            slot = Slot()
+            waited = slot.started - queued_at
+            self.queue_wait += waited
+            self.max_queue_wait = max(self.max_queue_wait, waited)
+            try:
+                yield slot
+            except Exception as e:
+                self.failed += 1
+                if is_throttle(e):
+                    self.throttled += 1
+                    self.governor.on_throttle()
+                raise
+            latency = (slot.first_byte or time.monotonic()) - slot.started
+            self.completed += 1
+            self.provider_latency += latency
+            self.governor.on_success(latency, slot.output_tokens,
+                                     streamed=slot.first_byte is not None)
+        finally:
+            self.governor.release()
+
+    async def settle(self, reserved: int, used: int) -> None:
+        """Ajusta el bucket de tokens a los tokens que de verdad usó una petición."""
+        if self.tokens is not None and used != reserved:
+            await self.tokens.adjust(used - reserved)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores del limitador."""
+        admitted = self.completed + self.failed
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "avg_queue_wait": self.queue_wait / admitted if admitted else 0.0,
+            "max_queue_wait": self.max_queue_wait,
+            "avg_provider_latency": self.provider_latency / self.completed if self.completed else 0.0,
+            "concurrency": self.governor.get_stats(),
+        }
+
+# Limitadores del proceso por (proveedor, modelo)
+_limiters: Dict[Tuple[str, Optional[str]], RateLimiter] = {}
+
+def _limits_for(provider: str, model: Optional[str]) -> Dict[str, float]:
+    limits = settings.LLM_RATE_LIMITS
+    return limits.get(f"{provider}:{model}", limits.get(provider, {}))
+
+def _bucket(provider: str, model: Optional[str], kind: str,
+            per_minute: Optional[float]) -> Optional[TokenBucket]:
+    if not per_minute:
+        return None
+    if settings.LLM_RATE_LIMIT_BACKEND == "redis":
+        return RedisTokenBucket(get_async_redis(), f"uruz:ratelimit:{provider}:{model}:{kind}",
+                                per_minute)
+    return TokenBucket(per_minute)
+
+def get_rate_limiter(provider: str, model: Optional[str] = None) -> RateLimiter:
+    """Limitador compartido de un proveedor y modelo.
+
+    Los límites se leen de ``settings.LLM_RATE_LIMITS`` por ``proveedor:modelo``
+    o por ``proveedor``, con las claves ``rpm`` y ``tpm``.
+    """
+    key = (provider, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limits = _limits_for(provider, model)
+        governor = ConcurrencyGovernor(
+            initial=settings.LLM_CONCURRENCY_INITIAL,
+            minimum=settings.LLM_CONCURRENCY_MIN,
+            maximum=settings.LLM_MAX_CONNECTIONS,
+            latency_tolerance=settings.LLM_LATENCY_TOLERANCE,
+        )
+        limiter = RateLimiter(
+            f"{provider}:{model}" if model else provider,
+            governor,
+            requests=_bucket(provider, model, "rpm", limits.get("rpm")),
+            tokens=_bucket(provider, model, "tpm", limits.get("tpm")),
+        )
+        _limiters[key] = limiter
+    return limiter
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Contadores de todos los limitadores del proceso."""
+    return {limiter.name: limiter.get_stats() for limiter in _limiters.values()}
@@ -0,0 +1,190 @@
+"""
+Deadline-aware retries and hedged requests for LLM calls.
+
+``RetryPolicy`` retries throttling, server and connection errors with
+exponential backoff and full jitter, but never past the request's deadline:
+each attempt is bounded by the time left and no backoff sleep is started
+that would end after it. A ``Retry-After`` header from the provider is
+honoured when it fits.
+
+``Hedger`` tracks recent latencies and, when a call is still running at the
+observed percentile (p95 by default), starts a second identical call. The
+first response wins and the other call is cancelled. Hedges are capped at a
+fraction of all calls, so a slow provider cannot double the load on itself.
+"""
+import asyncio
+import collections
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from ..config import settings
+from .ratelimit import is_throttle
+
+logger = logging.getLogger(__name__)
+
+Call = Callable[[], Awaitable[Any]]
+
+def is_retryable(error: BaseException) -> bool:
+    """Errores transitorios: límites de uso, errores 5xx, timeouts y fallos de conexión."""
+    if isinstance(error, asyncio.TimeoutError) or is_throttle(error):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500 or status == 408
+    # APIConnectionError (y APITimeoutError) de los SDK de Anthropic y OpenAI
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Segundos indicados por el proveedor en la cabecera Retry-After, si los hay."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """Reintentos con backoff exponencial y jitter completo dentro de un plazo."""
+
+    def __init__(self, retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, deadline: Optional[float] = None):
+        """Initialize the policy.
+
+        Args:
+            retries: Attempts after the first one; defaults to settings.LLM_MAX_RETRIES.
+            base_delay: Backoff ceiling of the first retry, doubled on each one.
+            max_delay: Upper bound of any backoff sleep.
+            deadline: Seconds for the whole request, attempts and sleeps
+                included; defaults to settings.LLM_DEADLINE.
+        """
+        self.retries = settings.LLM_MAX_RETRIES if retries is None else retries
+        self.base_delay = settings.LLM_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = settings.LLM_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.deadline = settings.LLM_DEADLINE if deadline is None else deadline
+        self.attempts = 0
+        self.retried = 0
+        self.deadline_exceeded = 0
+
+    def backoff(self, retry: int) -> float:
+        """Espera antes del reintento ``retry`` (desde 0), con jitter completo."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    async def run(self, call: Call) -> Any:
+        """Ejecuta ``call`` reintentando los errores transitorios dentro del plazo."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        retry = 0
+        while True:
+            remaining = deadline - loop.time()
+            self.attempts += 1
+            try:
+                return await asyncio.wait_for(call(), remaining)
+            except Exception as e:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.deadline_exceeded += 1
+                if retry >= self.retries or remaining <= 0 or not is_retryable(e):
+                    raise
+                delay = max(self.backoff(retry), _retry_after(e) or 0.0)
+                if delay >= remaining:
+                    # El reintento ya no terminaría a tiempo
+                    self.deadline_exceeded += 1
+                    raise
+                logger.debug(f"Retrying LLM call in {delay:.2f}s after: {e}")
+                self.retried += 1
+                retry += 1
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de reintentos."""
+        return {
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+
+class Hedger:
+    """Lanza una segunda llamada cuando la primera supera el percentil de latencia."""
+
+    def __init__(self, percentile: Optional[float] = None, max_ratio: Optional[float] = None,
+                 min_samples: int = 20, window: int = 500):
+        """Initialize the hedger.
+
+        Args:
+            percentile: Latency percentile after which a hedge is sent;
+                defaults to settings.LLM_HEDGE_PERCENTILE.
+            max_ratio: Maximum share of calls that may be hedged; defaults
+                to settings.LLM_HEDGE_MAX_RATIO.
+            min_samples: Latencies needed before hedging starts.
+            window: Number of recent latencies kept.
+        """
+        self.percentile = settings.LLM_HEDGE_PERCENTILE if percentile is None else percentile
+        self.max_ratio = settings.LLM_HEDGE_MAX_RATIO if max_ratio is None else max_ratio
+        self.min_samples = min_samples
+        self._latencies: "collections.deque[float]" = collections.deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def threshold(self) -> Optional[float]:
+        """Latencia a partir de la cual se lanza la segunda llamada, o None."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    def _record(self, started: float) -> None:
+        self._latencies.append(time.monotonic() - started)
+
+    async def run(self, call: Call) -> Any:
+        """Ejecuta ``call``, con una segunda llamada si la primera se retrasa."""
+        self.calls += 1
+        started = time.monotonic()
+        threshold = self.threshold()
+        if threshold is None or self.hedged >= self.max_ratio * self.calls:
+            result = await call()
+            self._record(started)
+            return result
+
+        first = asyncio.ensure_future(call())
+        try:
+            done, _ = await asyncio.wait({first}, timeout=threshold)
+            if done:
+                result = first.result()
+                self._record(started)
+                return result
+            self.hedged += 1
+            second = asyncio.ensure_future(call())
+            return await self._first_success(first, second, started)
+        finally:
+            if not first.done():
+                first.cancel()
+
+    async def _first_success(self, first: asyncio.Future, second: asyncio.Future,
+                             started: float) -> Any:
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        self._record(started)
+                        return task.result()
+                if not pending:
+                    # Fallaron las dos: se propaga el error de la original
+                    return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de hedging."""
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "threshold": self.threshold(),
+        }
@@ -0,0 +1,250 @@
+"""
+Latency- and cost-aware routing across LLM providers.
+
+``RouterProvider`` wraps several backends, each a regular provider from
+``PROVIDERS`` with its own model, and keeps moving statistics for each one:
+p50/p95 latency over a window of recent calls, error rate and estimated
+spend. Every request goes to the best backend under the agent's policy and
+fails over to the next one on a transient error; errors caused by the
+request itself (400, 401, 422...) are raised right away. A backend whose error rate reaches
+``max_error_rate`` is taken out of rotation for ``cooldown`` seconds and then
+tried again.
+
+Example agent configuration::
+
+    provider: router
+    routing:
+      policy: balanced        # latency / cost / balanced
+      max_error_rate: 0.5
+      cooldown: 60
+    backends:
+      - provider: anthropic
+        model: claude-3-haiku-20240307
+        cost_per_1k_tokens: 0.00125
+      - provider: openai
+        model: gpt-4o-mini
+        cost_per_1k_tokens: 0.0006
+"""
+import collections
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from .base import LLMProvider
+from .retry import is_retryable
+from .tokens import LLMResult
+
+logger = logging.getLogger(__name__)
+
+LATENCY = "latency"
+COST = "cost"
+BALANCED = "balanced"
+ROUTING_POLICIES = (LATENCY, COST, BALANCED)
+
+# Claves de la configuración del agente que no se pasan a los backends
+_ROUTER_KEYS = ("provider", "backends", "routing")
+
+class Backend:
+    """Un proveedor del router y sus estadísticas móviles."""
+
+    def __init__(self, provider: LLMProvider, cost_per_1k_tokens: float = 0.0,
+                 window: int = 100):
+        self.provider = provider
+        self.name = f"{provider.name}:{getattr(provider, 'model', None)}"
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self._latencies: "collections.deque[float]" = collections.deque(maxlen=window)
+        self._outcomes: "collections.deque[bool]" = collections.deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.cost = 0.0
+        self.ejected_until = 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """Latencia del percentil dado; 0 sin muestras, para que se pruebe pronto."""
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def error_rate(self) -> float:
+        """Fracción de llamadas fallidas en la ventana."""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def record(self, latency: float, success: bool, tokens: int) -> None:
+        self.requests += 1
+        self._outcomes.append(success)
+        if success:
+            self._latencies.append(latency)
+            self.cost += tokens * self.cost_per_1k_tokens / 1000
+        else:
+            self.failures += 1
+
+    def eject(self, cooldown: float) -> None:
+        """Saca el backend de rotación; al volver empieza con la ventana limpia."""
+        self.ejected_until = time.monotonic() + cooldown
+        self._outcomes.clear()
+
+    def score(self, policy: str, cost_weight: float) -> float:
+        """Menor es mejor. Los errores encarecen el backend como reintentos esperados."""
+        if policy == LATENCY:
+            score = self.percentile(95)
+        elif policy == COST:
+            score = self.cost_per_1k_tokens + self.percentile(50) * 1e-6
+        else:
+            score = self.percentile(50) + cost_weight * self.cost_per_1k_tokens
+        return score / max(0.05, 1 - self.error_rate())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve las estadísticas del backend."""
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": self.error_rate(),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "cost": self.cost,
+            "available": time.monotonic() >= self.ejected_until,
+        }
+
+class RouterProvider(LLMProvider):
+    """Proveedor que reparte las peticiones entre varios backends según su política."""
+
+    name = "router"
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        from . import get_provider
+
+        routing = config.get("routing", {})
+        self.policy = routing.get("policy", BALANCED)
+        if self.policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy: {self.policy}")
+        self.max_error_rate = routing.get("max_error_rate", 0.5)
+        self.min_samples = routing.get("min_samples", 5)
+        self.cooldown = routing.get("cooldown", 60.0)
+        # Segundos de latencia que equivalen a 1 de coste por 1K tokens (política balanced)
+        self.cost_weight = routing.get("cost_weight", 100.0)
+        # Probabilidad de probar un backend al azar para refrescar sus estadísticas
+        self.explore = routing.get("explore", 0.05)
+
+        shared = {key: value for key, value in config.items() if key not in _ROUTER_KEYS}
+        self.backends: List[Backend] = []
+        for backend_config in config.get("backends", []):
+            backend_config = dict(backend_config)
+            provider_class = get_provider(backend_config.pop("provider", None))
+            if not provider_class:
+                raise ValueError(f"Provider for backend {backend_config} not found")
+            cost = backend_config.pop("cost_per_1k_tokens", 0.0)
+            # El failover sustituye a los reintentos; la caché es la del router
+            options = {**shared, "max_retries": 0, "semantic_cache": False, **backend_config}
+            self.backends.append(Backend(provider_class(options), cost))
+        if not self.backends:
+            raise ValueError("A router provider needs at least one backend")
+        # Los backends identifican al router en la clave de caché
+        self.model = ",".join(backend.name for backend in self.backends)
+
+    def close(self) -> None:
+        """Libera los clientes del router y de sus backends."""
+        super().close()
+        for backend in self.backends:
+            backend.provider.close()
+
+    def candidates(self) -> List[Backend]:
+        """Backends en el orden en que se intentarán."""
+        now = time.monotonic()
+        available = [backend for backend in self.backends if now >= backend.ejected_until]
+        if not available:
+            # Todos fuera de rotación: se intenta igualmente, el que menos falla primero
+            return sorted(self.backends, key=lambda backend: backend.error_rate())
+        ordered = sorted(available, key=lambda backend: backend.score(self.policy, self.cost_weight))
+        if len(ordered) > 1 and random.random() < self.explore:
+            ordered.insert(0, ordered.pop(random.randrange(1, len(ordered))))
+        return ordered
+
+    def _record(self, backend: Backend, started: float, success: bool, prompt: str,
+                tokens: int = 0) -> None:
+        # Sin tokens reales (streams), se usa la estimación para el coste
+        backend.record(time.monotonic() - started, success,
+                       tokens or backend.provider._estimate_tokens(prompt))
+        if (not success and len(backend._outcomes) >= self.min_samples
+                and backend.error_rate() >= self.max_error_rate):
+            logger.warning(f"Router backend {backend.name} ejected for {self.cooldown}s "
+                           f"(error rate {backend.error_rate():.0%})")
+            backend.eject(self.cooldown)
+
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Emite la respuesta del mejor backend disponible según se genera."""
+        return self._cached_stream(prompt, self._route_stream)
+
+    def _prompt_budget(self) -> Optional[int]:
+        # El prompt tiene que caber en cualquiera de los backends de ventana conocida
+        budgets = [budget for budget in (backend.provider._prompt_budget()
+                                         for backend in self.backends) if budget is not None]
+        return min(budgets) if budgets else None
+
+    async def _request(self, prompt: str) -> LLMResult:
+        return await self._route(prompt)
+
+    async def _call(self, request: Callable[[str], Awaitable[LLMResult]],
+                    prompt: str) -> LLMResult:
+        # Límites, reintentos y hedging se aplican en cada backend
+        result = await request(prompt)
+        self.usage.add(result.usage)
+        return result
+
+    async def _call_stream(self, chunks: Callable[[str], AsyncIterator[str]],
+                           prompt: str) -> AsyncIterator[str]:
+        async for chunk in chunks(prompt):
+            yield chunk
+
+    async def _route(self, prompt: str) -> LLMResult:
+        error: Optional[Exception] = None
+        for backend in self.candidates():
+            provider = backend.provider
+            started = time.monotonic()
+            try:
+                result = await provider._call(provider._request, prompt)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Otro backend rechazaría igual la misma petición
+                    raise
+                self._record(backend, started, False, prompt)
+                logger.warning(f"Router backend {backend.name} failed, trying the next one: {e}")
+                error = e
+                continue
+            self._record(backend, started, True, prompt, result.usage.total_tokens)
+            return result
+        raise error
+
+    async def _route_stream(self, prompt: str) -> AsyncIterator[str]:
+        error: Optional[Exception] = None
+        for backend in self.candidates():
+            provider = backend.provider
+            started = time.monotonic()
+            emitted = False
+            try:
+                async for chunk in provider._call_stream(provider._stream, prompt):
+                    if not emitted:
+                        # Para streams cuenta el tiempo hasta el primer fragmento
+                        self._record(backend, started, True, prompt)
+                        emitted = True
+                    yield chunk
+                return
+            except Exception as e:
+                if emitted or not is_retryable(e):
+                    # Lo ya emitido no se puede repetir con otro backend, y
+                    # una petición inválida fallaría igual en todos
+                    raise
+                self._record(backend, started, False, prompt)
+                logger.warning(f"Router backend {backend.name} failed, trying the next one: {e}")
+                error = e
+        raise error
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de cada backend."""
+        return {
+            "policy": self.policy,
+            "backends": {backend.name: backend.get_stats() for backend in self.backends},
+        }
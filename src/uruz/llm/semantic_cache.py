@@ -0,0 +1,228 @@
+"""
+Semantic response cache.
+
+The exact cache only answers a prompt seen before byte for byte. This layer
+embeds each answered prompt and keeps the vectors in a fixed-size NumPy
+matrix, so a paraphrased prompt whose cosine similarity to a stored one
+reaches ``threshold`` is answered from memory. The index is bounded: once
+``capacity`` entries are stored, the least recently used one is replaced.
+
+Embeddings come from any ``async (text) -> vector`` callable backed by a real
+embedding model, such as ``OpenAIProvider.embed``. ``HashingEmbedder`` is a
+deterministic local embedder for tests only: it measures word overlap, so a
+prompt and its negation score above the threshold.
+"""
+import asyncio
+import collections
+import hashlib
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[str], Awaitable[Sequence[float]]]
+
+_WORDS = re.compile(r"\w+")
+
+class HashingEmbedder:
+    """Embedder local y determinista para tests: palabras y trigramas con hashing a ``dim`` cubetas.
+
+    Solo mide coincidencia léxica, no significado; no debe usarse en producción.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORDS.findall(text.lower())
+        # Los trigramas de caracteres toleran plurales y pequeñas variaciones
+        grams = [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+        return words + grams
+
+    async def __call__(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+class SemanticCache:
+    """Índice vectorial acotado de respuestas con búsqueda por similitud coseno."""
+
+    def __init__(self, embedder: Embedder, threshold: float = 0.95,
+                 capacity: int = 1000, embedding_cache_size: int = 256):
+        """Initialize the cache.
+
+        Args:
+            embedder: Coroutine function returning the embedding of a text.
+            threshold: Minimum cosine similarity to serve a cached answer.
+            capacity: Maximum number of stored answers.
+            embedding_cache_size: Recent prompt embeddings kept so that a
+                lookup followed by an add embeds the prompt only once.
+        """
+        if capacity < 1:
+            raise ValueError("Semantic cache capacity must be positive")
+        self.embedder = embedder
+        self.threshold = threshold
+        self.capacity = capacity
+        self.embedding_cache_size = embedding_cache_size
+        # La matriz se reserva con la dimensión del primer embedding
+        self._vectors: Optional[np.ndarray] = None
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._prompts: List[Optional[str]] = [None] * capacity
+        self._responses: List[Optional[str]] = [None] * capacity
+        self._slots: Dict[str, int] = {}
+        self._size = 0
+        self._clock = 0
+        self._embeddings: "collections.OrderedDict[str, np.ndarray]" = collections.OrderedDict()
+        self._writes: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.false_hits = 0
+        self.evictions = 0
+        self.hit_similarity = 0.0
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def _embed(self, text: str) -> np.ndarray:
+        vector = self._embeddings.get(text)
+        if vector is not None:
+            self._embeddings.move_to_end(text)
+            return vector
+        vector = np.asarray(await self.embedder(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        self._embeddings[text] = vector
+        if len(self._embeddings) > self.embedding_cache_size:
+            self._embeddings.popitem(last=False)
+        return vector
+
+    def _search(self, vector: np.ndarray) -> Tuple[int, float]:
+        """Devuelve la entrada más parecida y su similitud, o (-1, 0.0)."""
+        if not self._size or vector.shape[0] != self._vectors.shape[1]:
+            return -1, 0.0
+        scores = self._vectors[:self._size] @ vector
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def _touch(self, slot: int) -> None:
+        self._clock += 1
+        self._last_used[slot] = self._clock
+
+    async def lookup(self, prompt: str) -> Optional[str]:
+        """Respuesta de un prompt equivalente, si alguno supera el umbral."""
+        try:
+            vector = await self._embed(prompt)
+        except Exception as e:
+            logger.debug(f"Could not embed prompt for semantic lookup: {e}")
+            self.misses += 1
+            return None
+        slot, similarity = self._search(vector)
+        if slot < 0 or similarity < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.hit_similarity += similarity
+        self._touch(slot)
+        return self._responses[slot]
+
+    async def add(self, prompt: str, response: str) -> None:
+        """Guarda la respuesta de un prompt, desalojando la menos usada si está lleno."""
+        try:
+            vector = await self._embed(prompt)
+        except Exception as e:
+            logger.debug(f"Could not embed prompt for semantic cache: {e}")
+            return
+        slot = self._slots.get(prompt)
+        if slot is None:
+            slot = self._allocate(vector.shape[0])
+        self._vectors[slot] = vector
+        self._prompts[slot] = prompt
+        self._responses[slot] = response
+        self._slots[prompt] = slot
+        self._touch(slot)
+
+    def _allocate(self, dim: int) -> int:
+        if self._vectors is None:
+            self._vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+        elif dim != self._vectors.shape[1]:
+            raise ValueError(f"Embedding dimension changed from {self._vectors.shape[1]} to {dim}")
+        if self._size < self.capacity:
+            self._size += 1
+            return self._size - 1
+        slot = int(np.argmin(self._last_used[:self._size]))
+        del self._slots[self._prompts[slot]]
+        self.evictions += 1
+        return slot
+
+    def add_later(self, responses: Dict[str, str]) -> None:
+        """Programa el cálculo de embeddings y la inserción en segundo plano."""
+        if not responses:
+            return
+        task = asyncio.ensure_future(self._add_many(responses))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _add_many(self, responses: Dict[str, str]) -> None:
+        # A la vez, para que un embedder con batching los pida juntos
+        await asyncio.gather(*(self.add(prompt, response)
+                               for prompt, response in responses.items()))
+
+    async def flush_writes(self) -> None:
+        """Espera a que terminen las inserciones en segundo plano."""
+        if self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+
+    async def report_false_hit(self, prompt: str) -> bool:
+        """Marca como incorrecta la respuesta servida a ``prompt`` y la elimina.
+
+        Returns:
+            True si había una entrada que se habría servido para el prompt.
+        """
+        slot, similarity = self._search(await self._embed(prompt))
+        if slot < 0 or similarity < self.threshold:
+            return False
+        self.false_hits += 1
+        self._remove(slot)
+        return True
+
+    def _remove(self, slot: int) -> None:
+        # La última entrada ocupa el hueco para mantener el índice compacto
+        last = self._size - 1
+        del self._slots[self._prompts[slot]]
+        if slot != last:
+            self._vectors[slot] = self._vectors[last]
+            self._last_used[slot] = self._last_used[last]
+            self._prompts[slot] = self._prompts[last]
+            self._responses[slot] = self._responses[last]
+            self._slots[self._prompts[slot]] = slot
+        self._prompts[last] = self._responses[last] = None
+        self._size = last
+
+    def clear(self) -> None:
+        """Vacía el índice."""
+        self._slots.clear()
+        self._prompts = [None] * self.capacity
+        self._responses = [None] * self.capacity
+        self._size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de la caché semántica."""
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "false_hits": self.false_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_hit_similarity": self.hit_similarity / self.hits if self.hits else 0.0,
+            "memory_bytes": self._vectors.nbytes if self._vectors is not None else 0,
+        }
@@ -0,0 +1,87 @@
+"""
+Single-flight coalescing of identical LLM calls.
+
+When several callers ask for the same key at once, only the first one runs
+the call; the rest await its result. Within a process this is a map of
+in-flight tasks. Across processes, a short Redis lock (``SET NX PX``) marks
+the key as being computed so other processes wait for the cache to be
+filled instead of making the same call.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        """Número de claves con una llamada en curso."""
+        return len(self._calls)
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta ``call`` salvo que ya haya una llamada en curso para ``key``.
+
+        La llamada corre en su propia tarea: si el primer llamador se
+        cancela, los demás siguen esperando el resultado.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Evita avisos de excepción no recuperada si nadie quedó esperando
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Devuelve los contadores de llamadas."""
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": self.in_flight()}
+
+async def acquire_lock(redis: Any, key: str, ttl_ms: int,
+                       timeout: float) -> Optional[str]:
+    """Intenta tomar el lock ``key`` durante ``ttl_ms``.
+
+    Returns:
+        El token del lock, o None si lo tiene otro proceso. Si Redis no
+        responde dentro de ``timeout`` se devuelve un token igualmente, para
+        no bloquear la llamada por un fallo de la caché.
+    """
+    token = uuid.uuid4().hex
+    try:
+        acquired = await asyncio.wait_for(redis.set(key, token, nx=True, px=ttl_ms), timeout)
+    except Exception as e:
+        logger.debug(f"Could not take lock {key}: {e}")
+        return token
+    return token if acquired else None
+
+# Comparar y borrar en un solo paso: entre un GET y un DEL separados el lock
+# puede expirar y pasar a otro proceso, y se borraría el suyo
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+async def release_lock(redis: Any, key: str, token: str, timeout: float) -> None:
+    """Libera el lock si sigue siendo nuestro; si no, expira solo."""
+    try:
+        await asyncio.wait_for(redis.eval(_RELEASE_SCRIPT, 1, key, token), timeout)
+    except Exception as e:
+        logger.debug(f"Could not release lock {key}: {e}")
@@ -0,0 +1,161 @@
+"""
+Token accounting and pre-flight prompt budgeting.
+
+``Usage`` holds the token counts reported by a provider and ``LLMResult``
+pairs them with the generated text. ``estimate_tokens`` is a fast local
+estimate, deliberately on the high side, used before any network call:
+``fit_prompt`` trims a prompt that would not fit in the model's context
+window, or rejects it with ``PromptTooLongError``, instead of paying for a
+request the provider would refuse. Prompts for models whose window is not
+known are sent as they are.
+"""
+import re
+from typing import Any, Dict, Optional
+from ..config import settings
+
+TRIM = "trim"
+REJECT = "reject"
+OVERFLOW_POLICIES = (TRIM, REJECT)
+
+TRIM_MARKER = "\n[...]\n"
+
+# Ventana de contexto por prefijo de modelo; gana el prefijo más largo
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "claude": 200000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+}
+
+# Palabras, números y cada signo suelto; los tokenizadores BPE parten las
+# palabras largas, de ahí el tope de caracteres por pieza
+_PIECES = re.compile(r"\w{1,6}|[^\w\s]")
+
+class PromptTooLongError(ValueError):
+    """Se lanza cuando un prompt no cabe en la ventana de contexto del modelo."""
+
+class Usage:
+    """Tokens de una o varias llamadas al LLM."""
+
+    __slots__ = ("input_tokens", "output_tokens", "cached_tokens")
+
+    def __init__(self, input_tokens: int = 0, output_tokens: int = 0, cached_tokens: int = 0):
+        # input_tokens incluye los tokens servidos desde la caché del proveedor
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cached_tokens = cached_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other: "Usage") -> None:
+        """Suma los tokens de otra llamada."""
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cached_tokens += other.cached_tokens
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Usage) and self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return (f"Usage(input_tokens={self.input_tokens}, output_tokens={self.output_tokens}, "
+                f"cached_tokens={self.cached_tokens})")
+
+    @classmethod
+    def from_anthropic(cls, usage: Any) -> "Usage":
+        """Convierte el ``usage`` de la API de Anthropic."""
+        if usage is None:
+            return cls()
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        return cls(usage.input_tokens + cache_read + cache_write, usage.output_tokens, cache_read)
+
+    @classmethod
+    def from_openai(cls, usage: Any) -> "Usage":
+        """Convierte el ``usage`` de la API de OpenAI."""
+        if usage is None:
+            return cls()
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        return cls(usage.prompt_tokens, usage.completion_tokens, cached)
+
+class LLMResult:
+    """Texto generado por el LLM y los tokens que costó."""
+
+    __slots__ = ("text", "usage", "cached")
+
+    def __init__(self, text: str, usage: Optional[Usage] = None, cached: bool = False):
+        self.text = text
+        self.usage = usage or Usage()
+        # True si vino de la caché de respuestas y no se llamó al LLM
+        self.cached = cached
+
+    def __repr__(self) -> str:
+        return f"LLMResult(text={self.text!r}, usage={self.usage!r}, cached={self.cached})"
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida y por exceso de los tokens de un texto."""
+    return max(len(_PIECES.findall(text)), (len(text) + 3) // 4)
+
+def context_window(model: Optional[str]) -> Optional[int]:
+    """Ventana de contexto conocida de un modelo, o settings.LLM_CONTEXT_WINDOW (None si no hay)."""
+    if model:
+        prefixes = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+        if prefixes:
+            return CONTEXT_WINDOWS[max(prefixes, key=len)]
+    return settings.LLM_CONTEXT_WINDOW
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta el centro de un texto hasta que su estimación quepa en ``max_tokens``.
+
+    Se conservan el principio (instrucciones) y, con más peso, el final,
+    donde suele estar la petición concreta.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - estimate_tokens(TRIM_MARKER))
+    # La estimación no es lineal: se ajusta por aproximaciones sucesivas
+    chars = len(text) * keep // max(1, estimate_tokens(text))
+    while True:
+        head = chars // 4
+        trimmed = text[:head] + TRIM_MARKER + text[len(text) - (chars - head):] if chars else ""
+        if chars == 0 or estimate_tokens(trimmed) <= max_tokens:
+            return trimmed
+        chars = chars * 9 // 10
+
+def fit_prompt(prompt: str, budget: Optional[int], policy: str = TRIM) -> str:
+    """Devuelve un prompt que quepa en ``budget`` tokens según la política.
+
+    Sin presupuesto conocido (``None``) el prompt se devuelve tal cual.
+
+    Raises:
+        PromptTooLongError: Con la política ``reject``, o si no queda
+            presupuesto para ningún token del prompt.
+    """
+    if policy not in OVERFLOW_POLICIES:
+        raise ValueError(f"Unknown prompt overflow policy: {policy}")
+    if budget is None:
+        return prompt
+    estimated = estimate_tokens(prompt)
+    if estimated <= budget:
+        return prompt
+    if policy == REJECT or budget <= estimate_tokens(TRIM_MARKER):
+        raise PromptTooLongError(
+            f"Prompt of ~{estimated} tokens exceeds the budget of {budget} tokens"
+        )
+    return trim_to_tokens(prompt, budget)
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Optional
-from sqlalchemy import create_engine
+from ..clients import clients, get_engine
 from sqlalchemy.orm import sessionmaker, Session
 
 class DatabaseProvider(ABC):
@@ -25,12 +25,15 @@ class SQLAlchemyProvider(DatabaseProvider):
         self.SessionLocal = None
     
     def connect(self) -> None:
-        self.engine = create_engine(self.connection_string)
+        # El engine (y su pool) se comparte entre todos los proveedores del proceso
+        self.engine = get_engine(self.connection_string)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
     
     def disconnect(self) -> None:
         if self.engine:
-            self.engine.dispose()
+            self.engine = None
+            self.SessionLocal = None
+            clients.release("sqlalchemy", self.connection_string)
     
     def get_session(self) -> Session:
         """Obtiene una sesión de base de datos."""
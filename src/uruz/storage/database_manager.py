@@ -1,20 +1,39 @@
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 from .database import SQLAlchemyProvider
 from .models import Base, CommandHistory, AgentMetrics, StoredCredential
 
+# URLs cuyas tablas ya se crearon en este proceso
+_initialized_schemas = set()
+
 class DatabaseManager:
     """Manejador de operaciones de base de datos."""
     
     def __init__(self, connection_string: str):
         self.db = SQLAlchemyProvider(connection_string)
         self.db.connect()
-        # Crear tablas si no existen
-        Base.metadata.create_all(self.db.engine)
+        # Crear tablas si no existen (una vez por proceso y URL)
+        if connection_string not in _initialized_schemas:
+            Base.metadata.create_all(self.db.engine)
+            self._add_missing_columns()
+            _initialized_schemas.add(connection_string)
         self.AgentMetrics = AgentMetrics
     
+    def _add_missing_columns(self) -> None:
+        """Añade a las tablas existentes las columnas nuevas de los modelos."""
+        inspector = inspect(self.db.engine)
+        with self.db.engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(dialect=self.db.engine.dialect)
+                        connection.execute(text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                        ))
+    
     def log_command(self, server_name: str, command: str, executed_by: str,
                    status: str, output: Optional[str] = None, error: Optional[str] = None) -> None:
         """Registra un comando ejecutado."""
@@ -33,7 +52,9 @@ class DatabaseManager:
     def log_agent_metrics(self, agent_id: str, request_type: str,
                          processing_time: float, tokens_used: int,
                          success: bool = True, error_message: Optional[str] = None,
-                         metadata: Optional[Dict[str, Any]] = None) -> None:
+                         metadata: Optional[Dict[str, Any]] = None,
+                         input_tokens: int = 0, output_tokens: int = 0,
+                         cached_tokens: int = 0) -> None:
         """Registra métricas de uso de un agente."""
         with self.db.get_session() as session:
             metrics = AgentMetrics(
@@ -41,6 +62,9 @@ class DatabaseManager:
                 request_type=request_type,
                 processing_time=processing_time,
                 tokens_used=tokens_used,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_tokens=cached_tokens,
                 success=success,
                 error_message=error_message,
                 extra_data=metadata or {}
@@ -28,7 +28,10 @@ class AgentMetrics(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     request_type = Column(String, nullable=False)  # message/action
     processing_time = Column(Float)  # tiempo en segundos
-    tokens_used = Column(Integer)
+    tokens_used = Column(Integer)  # entrada + salida
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)  # servidos desde la caché del proveedor
     success = Column(Boolean, default=True)
     error_message = Column(String)
     extra_data = Column(JSON)  # datos adicionales en formato JSON
@@ -118,8 +118,8 @@ class DeploymentManager:
                         "cryptography>=3.4.7",
                         "redis>=4.0.0",
                         "sqlalchemy>=1.4.23",
-                        "openai>=0.27.0",
-                        "anthropic>=0.3.0",
+                        "openai>=1.17.0",
+                        "anthropic>=0.25.0",
                         "click>=8.0.0",
                         "paramiko>=3.4.0"
                     ]
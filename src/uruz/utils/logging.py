@@ -80,4 +80,6 @@ def setup_logging():
     
     return logging.getLogger('uruz')
 
-logger = setup_logging() 
\ No newline at end of file
+# Los handlers de fichero los instala el CLI con setup_logging(); importar
+# uruz no debe escribir en data/logs del directorio actual
+logger = logging.getLogger('uruz')
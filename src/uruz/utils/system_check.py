@@ -28,8 +28,8 @@ def check_system() -> List[str]:
         'uvicorn': '0.22.0',
         'redis': '4.5.0',
         'pydantic': '2.0.0',
-        'anthropic': '0.3.0',
-        'openai': '1.0.0'
+        'anthropic': '0.25.0',
+        'openai': '1.17.0'
     }
     
     for package, min_version in required_packages.items():
@@ -0,0 +1,7 @@
+import pytest
+
+@pytest.fixture(autouse=True)
+def uruz_dirs(tmp_path, monkeypatch):
+    """Los Environment de los tests escriben en tmp_path y no en el directorio actual."""
+    for name in ("agents", "data", "config"):
+        monkeypatch.setenv(f"URUZ_{name.upper()}_DIR", str(tmp_path / name))
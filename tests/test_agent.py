@@ -1,3 +1,6 @@
+import json
+import re
+import fakeredis
 import pytest
 from uruz.core.agent import Agent
 from uruz.security.vault import Vault
@@ -21,4 +24,83 @@ async def test_agent_act():
     agent = TestAgent("test-agent", {})
     actions = await agent.act()
     assert len(actions) == 1
-    assert actions[0]["action"] == "test" 
\ No newline at end of file
+    assert actions[0]["action"] == "test"
+
+
+@pytest.mark.asyncio
+async def test_agent_process_messages_defaults_to_one_by_one():
+    agent = TestAgent("test-agent", {})
+    responses = await agent.process_messages([{"content": "a"}, {"content": "b"}])
+    assert responses == [{"echo": {"content": "a"}}, {"echo": {"content": "b"}}]
+
+@pytest.mark.asyncio
+async def test_llm_agent_answers_batch_in_one_call():
+    from uruz.core.llm_agent import LLMAgent
+    
+    agent = LLMAgent("llm-agent", {})
+    agent.llm.cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    agent.llm.cache.timeout = 1
+    prompts = []
+    
+    async def fake_generate(prompt):
+        prompts.append(prompt)
+        return 'Aquí tienes:\n```json\n["uno", "dos"]\n```'
+    
+    agent.llm.generate = fake_generate
+    responses = await agent.process_messages([{"content": "1"}, {"content": "2"}])
+    assert responses == [{"response": "uno"}, {"response": "dos"}]
+    assert len(prompts) == 1
+    
+    # Las respuestas de un lote no se sirven desde la caché a otros remitentes
+    await agent.llm.cache.flush_writes()
+    assert await agent.llm.cached_responses(["1", "2"]) == [None, None]
+    agent.llm.close()
+
+@pytest.mark.asyncio
+async def test_llm_agent_splits_batches_that_do_not_fit_instead_of_trimming():
+    from uruz.core.llm_agent import LLMAgent
+    from uruz.llm.tokens import estimate_tokens
+    
+    agent = LLMAgent("llm-agent", {"context_window": 300, "max_tokens": 100})
+    agent.llm.cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    agent.llm.cache.timeout = 1
+    prompts = []
+    
+    async def fake_generate(prompt):
+        prompts.append(prompt)
+        requests = re.findall(r"^\d+\. (.*)$", prompt, re.M)
+        return json.dumps([f"re: {request}" for request in requests])
+    
+    agent.llm.generate = fake_generate
+    batch = [{"content": f"pregunta {i} " + "dato " * 20} for i in range(10)]
+    responses = await agent.process_messages(batch)
+    assert responses == [{"response": f"re: {message['content']}"} for message in batch]
+    assert len(prompts) > 1
+    assert all(estimate_tokens(prompt) <= agent.llm._prompt_budget() for prompt in prompts)
+    agent.llm.close()
+
+@pytest.mark.asyncio
+async def test_llm_agent_streams_and_caches_full_response():
+    from uruz.core.llm_agent import LLMAgent
+    
+    agent = LLMAgent("llm-agent", {})
+    agent.llm.cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    agent.llm.cache.timeout = 1
+    calls = []
+    
+    async def fake_stream(prompt):
+        calls.append(prompt)
+        for chunk in ["Ho", "la", "!"]:
+            yield chunk
+    
+    agent.llm._stream = fake_stream
+    chunks = [chunk async for chunk in agent.process_message_stream({"content": "saluda"})]
+    assert chunks == ["Ho", "la", "!"]
+    
+    # El texto completo queda cacheado y se sirve en un solo fragmento
+    await agent.llm.cache.flush_writes()
+    chunks = [chunk async for chunk in agent.process_message_stream({"content": "saluda"})]
+    assert chunks == ["Hola!"]
+    assert await agent.llm.generate("saluda") == "Hola!"
+    assert calls == ["saluda"]
+    agent.llm.close()
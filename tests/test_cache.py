@@ -0,0 +1,35 @@
+import asyncio
+import time
+import fakeredis
+import pytest
+from uruz.cache.async_redis_provider import AsyncRedisProvider
+
+def make_cache(**kwargs):
+    cache = AsyncRedisProvider(**kwargs)
+    cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return cache
+
+@pytest.mark.asyncio
+async def test_async_cache_round_trips_and_pipelines():
+    cache = make_cache()
+    assert await cache.set_cache("a", {"n": 1}, expire=60, timeout=1)
+    assert await cache.get_cache("a") == {"n": 1}
+    
+    cache.set_many_later({"b": "dos", "c": [3]}, expire=60)
+    await cache.flush_writes()
+    assert await cache.get_many(["a", "b", "c", "missing"]) == [{"n": 1}, "dos", [3], None]
+    assert cache.get_stats()["hits"] == 4
+    assert cache.get_stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_slow_cache_stays_within_its_budget():
+    class SlowRedis:
+        async def get(self, key):
+            await asyncio.sleep(1)
+    
+    cache = AsyncRedisProvider(timeout=0.01)
+    cache.redis = SlowRedis()
+    start = time.monotonic()
+    assert await cache.get_cache("key") is None
+    assert time.monotonic() - start < 0.5
+    assert cache.get_stats()["timeouts"] == 1
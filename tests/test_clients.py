@@ -0,0 +1,62 @@
+import anthropic
+import openai
+import pytest
+from uruz.cache.redis_provider import RedisProvider
+from uruz.clients import ClientRegistry, anthropic_key, clients, openai_key
+from uruz.config import settings
+from uruz.llm.anthropic_provider import AnthropicProvider
+from uruz.llm.openai_provider import OpenAIProvider
+from uruz.storage.database import SQLAlchemyProvider
+
+def test_registry_shares_and_refcounts_clients():
+    registry = ClientRegistry()
+    closed = []
+    
+    first = registry.acquire("thing", "a", object, closed.append)
+    second = registry.acquire("thing", "a", object, closed.append)
+    other = registry.acquire("thing", "b", object, closed.append)
+    assert first is second
+    assert other is not first
+    
+    registry.release("thing", "a")
+    assert closed == []
+    registry.release("thing", "a")
+    assert closed == [first]
+    
+    registry.close_all()
+    assert closed == [first, other]
+    assert registry.get_stats() == {}
+
+def test_providers_share_redis_and_engine_clients():
+    providers = [RedisProvider(host="cache.invalid", port=6380) for _ in range(3)]
+    assert len({id(p.redis) for p in providers}) == 1
+    key = ("cache.invalid", 6380, 0)
+    assert clients.refcount("redis", key) == 3
+    for provider in providers:
+        provider.close()
+    assert clients.refcount("redis", key) == 0
+    
+    url = "sqlite:///:memory:"
+    dbs = [SQLAlchemyProvider(url) for _ in range(2)]
+    for db in dbs:
+        db.connect()
+    assert dbs[0].engine is dbs[1].engine
+    for db in dbs:
+        db.disconnect()
+    assert clients.refcount("sqlalchemy", url) == 0
+
+@pytest.mark.asyncio
+async def test_llm_providers_share_async_sdk_clients():
+    providers = [AnthropicProvider({"llm_timeout": 5, "timeout": 1}) for _ in range(2)]
+    assert providers[0].client is providers[1].client
+    assert isinstance(providers[0].client, anthropic.AsyncAnthropic)
+    assert providers[0].timeout == 5
+    
+    openai_provider = OpenAIProvider({"api_key": "sk-test", "system_prompt": "Eres útil"})
+    assert isinstance(openai_provider.client, openai.AsyncOpenAI)
+    assert openai_provider._messages("hola")[0] == {"role": "system", "content": "Eres útil"}
+    
+    for provider in providers + [openai_provider]:
+        provider.close()
+    assert clients.refcount("anthropic", anthropic_key(settings.ANTHROPIC_API_KEY)) == 0
+    assert clients.refcount("openai", openai_key("sk-test")) == 0
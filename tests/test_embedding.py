@@ -0,0 +1,51 @@
+import asyncio
+import base64
+import numpy as np
+import pytest
+from uruz.llm.embedding import EmbeddingBatcher, decode_base64_embeddings
+
+def make_batcher(requests, **kwargs):
+    async def embed_batch(texts):
+        requests.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+    return EmbeddingBatcher(embed_batch, **kwargs)
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    requests = []
+    batcher = make_batcher(requests, max_batch_size=10, max_wait=0.01)
+    
+    vectors = await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "a", "ccc"]))
+    assert requests == [["a", "bb", "ccc"]]
+    assert [vector[0] for vector in vectors] == [1.0, 2.0, 1.0, 3.0]
+    assert all(vector.dtype == np.float32 and vector.flags["C_CONTIGUOUS"] for vector in vectors)
+    
+    # Un lote lleno se envía sin esperar la ventana
+    batcher = make_batcher(requests, max_batch_size=2, max_wait=10)
+    await asyncio.wait_for(asyncio.gather(batcher.embed("x"), batcher.embed("yy")), 1)
+    assert requests[-1] == ["x", "yy"]
+
+@pytest.mark.asyncio
+async def test_embed_many_streams_float32_chunks():
+    requests = []
+    batcher = make_batcher(requests, max_batch_size=2)
+    
+    chunks = [chunk async for chunk in batcher.embed_many(f"t{'x' * i}" for i in range(5))]
+    assert [chunk.shape for chunk in chunks] == [(2, 2), (2, 2), (1, 2)]
+    assert all(chunk.dtype == np.float32 for chunk in chunks)
+    assert batcher.get_stats()["requests"] == 3
+
+@pytest.mark.asyncio
+async def test_batch_errors_reach_every_caller():
+    async def failing(texts):
+        raise RuntimeError("rate limited")
+    
+    batcher = EmbeddingBatcher(failing, max_wait=0.001)
+    results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_base64_embeddings_decode_to_float32_matrix():
+    rows = [np.array([0.5, -1.0], dtype="<f4"), np.array([2.0, 0.25], dtype="<f4")]
+    matrix = decode_base64_embeddings([base64.b64encode(row.tobytes()).decode() for row in rows])
+    assert matrix.dtype == np.float32
+    assert matrix.tolist() == [[0.5, -1.0], [2.0, 0.25]]
@@ -1,3 +1,5 @@
+import asyncio
+import time
 import pytest
 from uruz.core.environment import Environment
 from uruz.core.agent import Agent
@@ -32,6 +34,7 @@ async def test_environment_agent_communication():
         content={"text": "hello"}
     )
     await env.message_broker.publish(message)
+    await env.message_broker.join()
     
     assert len(agent2.received_messages) == 1
     assert agent2.received_messages[0].content["text"] == "hello"
@@ -44,4 +47,191 @@ async def test_environment_step():
     
     results = await env.step()
     assert len(results) == 1
-    assert results[0]["action"] == "mock_action" 
\ No newline at end of file
+    assert results[0]["action"] == "mock_action"
+
+
+class SlowAgent(MockAgent):
+    async def act(self):
+        await asyncio.sleep(0.2)
+        return [{"action": "slow_action", "agent": self.agent_id}]
+
+class FailingAgent(MockAgent):
+    async def act(self):
+        raise RuntimeError("boom")
+
+@pytest.mark.asyncio
+async def test_environment_step_runs_agents_concurrently():
+    env = Environment()
+    for i in range(5):
+        env.add_agent(SlowAgent(f"slow{i}", {}))
+    
+    start = time.monotonic()
+    results = await env.step()
+    assert time.monotonic() - start < 0.5
+    assert len(results) == 5
+
+@pytest.mark.asyncio
+async def test_environment_step_collects_failures_and_timeouts():
+    env = Environment(agent_timeout=0.05)
+    env.add_agent(MockAgent("ok", {}))
+    env.add_agent(FailingAgent("failing", {}))
+    env.add_agent(SlowAgent("slow", {}))
+    
+    results = await env.step()
+    errors = {r["agent_id"] for r in results if r.get("type") == "error"}
+    assert errors == {"failing", "slow"}
+    assert {"action": "mock_action"} in results
+
+@pytest.mark.asyncio
+async def test_environment_replacing_an_agent_drops_the_old_handler():
+    env = Environment()
+    old, new = MockAgent("agent", {}), MockAgent("agent", {})
+    env.add_agent(old)
+    env.add_agent(new)
+    env.add_agent(new)
+    
+    await env.message_broker.publish(Message.create(
+        sender_id="tester", receiver_id="agent", content={"text": "hola"}
+    ))
+    await env.message_broker.join()
+    assert old.received_messages == []
+    assert len(new.received_messages) == 1
+    env.message_broker.close()
+
+class TopicAgent(MockAgent):
+    async def act(self):
+        return [{"topic": "alerts", "level": i} for i in range(3)]
+
+class StuckAgent(MockAgent):
+    async def process_message(self, message):
+        await asyncio.sleep(10)
+
+@pytest.mark.asyncio
+async def test_environment_step_bounds_topic_fan_out_by_the_agent_timeout():
+    env = Environment(agent_timeout=0.1)
+    env.message_broker.capacity = 1
+    env.add_agent(TopicAgent("publisher", {}))
+    env.add_agent(StuckAgent("subscriber", {"topics": ["alerts"]}))
+    
+    # Con la política "block" el buzón lleno del suscriptor no retiene el step
+    start = time.monotonic()
+    results = await asyncio.wait_for(env.step(), 1)
+    assert time.monotonic() - start < 0.5
+    assert {"topic": "alerts", "level": 0} in results
+    env.message_broker.close()
+
+class CountedAgent(MockAgent):
+    instances = 0
+    
+    def __init__(self, agent_id: str, config: dict):
+        super().__init__(agent_id, config)
+        CountedAgent.instances += 1
+        self.closed = False
+    
+    def close(self):
+        self.closed = True
+
+def write_manifest(agents_dir, agent_id):
+    (agents_dir / f"{agent_id}.yaml").write_text(
+        "type: custom\n"
+        "config:\n"
+        "  agent_class: test_environment.CountedAgent\n"
+    )
+
+@pytest.mark.asyncio
+async def test_environment_builds_agents_lazily(tmp_path, monkeypatch):
+    monkeypatch.setenv("URUZ_AGENTS_DIR", str(tmp_path))
+    for agent_id in ("a", "b", "c"):
+        write_manifest(tmp_path, agent_id)
+    CountedAgent.instances = 0
+    
+    env = Environment()
+    assert sorted(env.list_agents()) == ["a", "b", "c"]
+    assert CountedAgent.instances == 0
+    
+    agent = env.get_agent("a")
+    assert agent is env.get_agent("a")
+    assert CountedAgent.instances == 1
+    
+    assert await env.warm_up(["b", "missing"]) == ["b"]
+    assert CountedAgent.instances == 2
+
+@pytest.mark.asyncio
+async def test_environment_reload_only_touches_changed_agents(tmp_path, monkeypatch):
+    agents_dir = tmp_path / "agents"
+    agents_dir.mkdir()
+    monkeypatch.setenv("URUZ_AGENTS_DIR", str(agents_dir))
+    monkeypatch.setenv("URUZ_DATA_DIR", str(tmp_path / "data"))
+    for agent_id in ("a", "b"):
+        write_manifest(agents_dir, agent_id)
+    
+    env = Environment()
+    agent_a, agent_b = env.get_agent("a"), env.get_agent("b")
+    assert (tmp_path / "data" / "manifests.idx").exists()
+    assert env.reload() == []
+    
+    (agents_dir / "a.yaml").write_text(
+        "type: custom\n"
+        "config:\n"
+        "  agent_class: test_environment.CountedAgent\n"
+        "  timeout: 5\n"
+    )
+    (agents_dir / "b.yaml").unlink()
+    write_manifest(agents_dir, "c")
+    
+    assert sorted(env.reload()) == ["a", "b", "c"]
+    assert env.get_agent("a") is not agent_a
+    # Los agentes retirados liberan sus clientes compartidos
+    assert agent_a.closed and agent_b.closed
+    assert env.get_agent("a").config["timeout"] == 5
+    assert env.get_agent("b") is None
+    assert sorted(env.list_agents()) == ["a", "c"]
+    
+    # Un nuevo Environment reutiliza el índice compilado
+    assert sorted(Environment().list_agents()) == ["a", "c"]
+    
+    # Un manifiesto a medio escribir no desmonta el agente
+    agent_c = env.get_agent("c")
+    (agents_dir / "c.yaml").write_text("type: custom\nconfig: [unclosed\n")
+    assert env.reload() == []
+    assert env.get_agent("c") is agent_c
+
+class StatefulAgent(MockAgent):
+    def __init__(self, agent_id: str, config: dict):
+        super().__init__(agent_id, config)
+        self.counter = 0
+    
+    async def act(self):
+        self.counter += 1
+        return [{"counter": self.counter}]
+    
+    def get_state(self):
+        return {"counter": self.counter}
+    
+    def set_state(self, state):
+        self.counter = state["counter"]
+
+@pytest.mark.asyncio
+async def test_environment_snapshot_restores_state_and_hot_agents(tmp_path, monkeypatch):
+    agents_dir = tmp_path / "agents"
+    agents_dir.mkdir()
+    monkeypatch.setenv("URUZ_AGENTS_DIR", str(agents_dir))
+    monkeypatch.setenv("URUZ_DATA_DIR", str(tmp_path / "data"))
+    for agent_id in ("hot", "cold"):
+        (agents_dir / f"{agent_id}.yaml").write_text(
+            "config:\n"
+            "  agent_class: test_environment.StatefulAgent\n"
+        )
+    
+    env = Environment()
+    env.get_agent("hot")
+    await env.step()
+    await env.step()
+    env.save_snapshot()
+    
+    restarted = Environment()
+    hot_agents = restarted.restore_snapshot()
+    assert hot_agents == ["hot"]
+    await restarted.warm_up(hot_agents)
+    assert list(restarted.agents) == ["hot"]
+    assert await restarted.step() == [{"counter": 3}]
@@ -0,0 +1,214 @@
+import asyncio
+import pickle
+import msgpack
+import pytest
+from uruz.core import codec
+from uruz.core.mailbox import MailboxFullError
+from uruz.core.message import PRIORITY_HIGH, Message, MessageBroker, RequestError
+
+def make_message(receiver_id: str, n: int) -> Message:
+    return Message.create(sender_id="sender", receiver_id=receiver_id, content={"n": n})
+
+@pytest.mark.asyncio
+async def test_publish_does_not_wait_for_slow_receiver():
+    broker = MessageBroker()
+    release = asyncio.Event()
+    received = []
+    
+    async def slow_handler(message):
+        await release.wait()
+        received.append(message.content["n"])
+    
+    broker.subscribe("slow", slow_handler)
+    await asyncio.wait_for(broker.publish(make_message("slow", 1)), 0.1)
+    assert received == []
+    
+    release.set()
+    await broker.join()
+    assert received == [1]
+
+@pytest.mark.asyncio
+async def test_mailbox_overflow_policies():
+    broker = MessageBroker()
+    release = asyncio.Event()
+    received = []
+    
+    async def handler(message):
+        await release.wait()
+        received.append(message.content["n"])
+    
+    broker.subscribe("dropper", handler, capacity=2, overflow_policy="drop_oldest")
+    broker.subscribe("rejecter", handler, capacity=1, overflow_policy="reject")
+    
+    for n in range(5):
+        await broker.publish(make_message("dropper", n))
+        await asyncio.sleep(0)
+    
+    await broker.publish(make_message("rejecter", 10))
+    await asyncio.sleep(0)
+    await broker.publish(make_message("rejecter", 11))
+    with pytest.raises(MailboxFullError):
+        await broker.publish(make_message("rejecter", 12))
+    assert broker.queue_depths() == {"dropper": 2, "rejecter": 1}
+    
+    release.set()
+    await broker.join()
+    # El primer mensaje ya estaba en proceso; se descartaron 1 y 2
+    assert sorted(received) == [0, 3, 4, 10, 11]
+    assert broker.get_stats()["dropper"]["dropped"] == 2
+    assert broker.get_stats()["rejecter"]["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_multiple_callbacks_per_agent():
+    broker = MessageBroker()
+    calls = []
+    
+    async def first(message):
+        calls.append("first")
+    
+    async def second(message):
+        calls.append("second")
+    
+    broker.subscribe("agent", first)
+    broker.subscribe("agent", second)
+    await broker.publish(make_message("agent", 1))
+    await broker.join()
+    assert calls == ["first", "second"]
+    
+    broker.unsubscribe("agent", first)
+    await broker.publish(make_message("agent", 2))
+    await broker.join()
+    assert calls == ["first", "second", "second"]
+
+@pytest.mark.asyncio
+async def test_publish_many_delivers_micro_batches():
+    broker = MessageBroker()
+    batches = []
+    singles = []
+    
+    async def batch_handler(batch):
+        batches.append([m.content["n"] for m in batch])
+    
+    async def single_handler(message):
+        singles.append(message.content["n"])
+    
+    broker.subscribe("batched", batch_handler, batch_size=3, batch_window=0.05)
+    broker.subscribe("single", single_handler)
+    
+    await broker.publish_many(
+        [make_message("batched", n) for n in range(5)]
+        + [make_message("single", n) for n in range(2)]
+    )
+    await broker.join()
+    assert batches == [[0, 1, 2], [3, 4]]
+    assert singles == [0, 1]
+
+def test_message_codec_round_trip():
+    message = Message.create("a", "b", {"text": "hola", "values": [1, 2.5, None]})
+    message.metadata = {"trace": "x"}
+    message.topic = "ops.alerts"
+    
+    decoded = codec.decode(codec.encode(message))
+    assert decoded == message
+    assert decoded.timestamp == message.timestamp
+    assert pickle.loads(pickle.dumps(message)) == message
+    
+    later = Message.create("a", "b", {})
+    assert later.id > message.id
+
+def test_message_codec_rejects_unknown_versions():
+    payload = msgpack.packb([codec.CODEC_VERSION + 1, 1, "a", "b", {}, 0.0, "text", None, None])
+    with pytest.raises(codec.CodecError):
+        codec.decode(payload)
+    with pytest.raises(codec.CodecError):
+        codec.decode(b"\xc1")
+
+@pytest.mark.asyncio
+async def test_request_returns_the_receiver_reply():
+    broker = MessageBroker()
+    
+    async def doubler(message):
+        if message.content["n"] < 0:
+            raise ValueError("negative")
+        return {"n": message.content["n"] * 2}
+    
+    broker.subscribe("doubler", doubler)
+    reply = await broker.request(make_message("doubler", 21), timeout=1)
+    assert reply.content == {"n": 42}
+    assert reply.sender_id == "doubler"
+    
+    with pytest.raises(RequestError, match="negative"):
+        await broker.request(make_message("doubler", -1), timeout=1)
+    assert broker.pending_requests() == 0
+
+@pytest.mark.asyncio
+async def test_expired_and_cancelled_requests_release_their_waiters():
+    broker = MessageBroker()
+    release = asyncio.Event()
+    
+    async def slow(message):
+        await release.wait()
+        return {"late": True}
+    
+    broker.subscribe("slow", slow)
+    with pytest.raises(asyncio.TimeoutError):
+        await broker.request(make_message("slow", 1), timeout=0.05)
+    assert broker.pending_requests() == 0
+    
+    task = asyncio.ensure_future(broker.request(make_message("slow", 2), timeout=5))
+    await asyncio.sleep(0.01)
+    assert broker.pending_requests() == 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert broker.pending_requests() == 0
+    
+    # Sin request esperando, las respuestas tardías son mensajes normales (aquí sin receptor)
+    release.set()
+    await broker.join()
+
+@pytest.mark.asyncio
+async def test_reply_types_without_a_waiting_request_are_delivered():
+    broker = MessageBroker()
+    received = []
+    
+    async def handler(message):
+        received.append(message.type)
+    
+    broker.subscribe("agent", handler)
+    await broker.publish(Message.create("sender", "agent", {"text": "hi"}, type="reply"))
+    await broker.publish_many([Message.create("sender", "agent", {}, type="reply_error")])
+    await broker.join()
+    assert received == ["reply", "reply_error"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scheduling, expected", [
+    ("strict", ["h0", "h1", "n0", "n1", "n2", "n3"]),
+    ("weighted", ["h0", "n0", "h1", "n1", "n2", "n3"]),
+])
+async def test_priority_lanes_serve_urgent_messages_first(scheduling, expected):
+    broker = MessageBroker(lane_weights=[2, 1], scheduling=scheduling)
+    release = asyncio.Event()
+    received = []
+    
+    async def handler(message):
+        if message.content["n"] == "blocker":
+            await release.wait()
+        else:
+            received.append(message.content["n"])
+    
+    broker.subscribe("agent", handler)
+    await broker.publish(Message.create("s", "agent", {"n": "blocker"}))
+    await asyncio.sleep(0)
+    for n in range(4):
+        await broker.publish(Message.create("s", "agent", {"n": f"n{n}"}))
+    for n in range(2):
+        await broker.publish(Message.create("s", "agent", {"n": f"h{n}"},
+                                            priority=PRIORITY_HIGH))
+    release.set()
+    await broker.join()
+    assert received == expected
+    
+    lanes = broker.get_stats()["agent"]["lanes"]
+    assert [lane["dequeued"] for lane in lanes] == [2, 5]
+    assert lanes[1]["max_wait"] > 0
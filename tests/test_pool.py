@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from uruz.core.agent import Agent
+from uruz.core.environment import Environment
+from uruz.core.message import Message
+from uruz.core.pool import AgentPool
+
+class BusyAgent(Agent):
+    closed = 0
+    
+    def close(self):
+        BusyAgent.closed += 1
+    
+    async def process_message(self, message):
+        if isinstance(message, Message):
+            message = message.content
+        await asyncio.sleep(message.get("delay", 0))
+        return {"response": id(self)}
+    
+    async def act(self):
+        return [{"agent": self.agent_id}]
+
+@pytest.mark.asyncio
+async def test_pool_dispatches_to_least_loaded_replica():
+    pool = AgentPool("busy", lambda: BusyAgent("busy", {}), min_replicas=3)
+    responses = await asyncio.gather(
+        *(pool.process_message({"delay": 0.05}) for _ in range(3))
+    )
+    assert len({r["response"] for r in responses}) == 3
+    assert [r["handled"] for r in pool.get_stats()["per_replica"]] == [1, 1, 1]
+
+@pytest.mark.asyncio
+async def test_pool_scales_up_and_down():
+    BusyAgent.closed = 0
+    pool = AgentPool("busy", lambda: BusyAgent("busy", {}),
+                     min_replicas=1, max_replicas=3,
+                     scale_up_threshold=1, idle_timeout=0.0)
+    blockers = [asyncio.ensure_future(pool.process_message({"delay": 0.1}))
+                for _ in range(4)]
+    await asyncio.sleep(0.05)
+    assert len(pool.replicas) > 1
+    await asyncio.gather(*blockers)
+    
+    await pool.process_message({})
+    assert len(pool.replicas) == 1
+    # Las réplicas retiradas se cierran
+    assert BusyAgent.closed >= 1
+
+@pytest.mark.asyncio
+async def test_environment_builds_pool_from_manifest(tmp_path, monkeypatch):
+    monkeypatch.setenv("URUZ_AGENTS_DIR", str(tmp_path))
+    (tmp_path / "busy.yaml").write_text(
+        "replicas: 2\n"
+        "config:\n"
+        "  agent_class: test_pool.BusyAgent\n"
+    )
+    env = Environment()
+    pool = env.get_agent("busy")
+    assert isinstance(pool, AgentPool)
+    assert pool.get_stats()["replicas"] == 2
+    assert await env.step() == [{"agent": "busy"}]
+
+@pytest.mark.asyncio
+async def test_pool_scales_on_mailbox_backlog_and_shrinks_when_idle():
+    env = Environment()
+    pool = AgentPool("busy", lambda: BusyAgent("busy", {}),
+                     min_replicas=1, max_replicas=3, scale_up_threshold=1,
+                     idle_timeout=0.1, scale_interval=0.01)
+    env.add_agent(pool)
+    for _ in range(8):
+        await env.message_broker.publish(Message.create("x", "busy", {"delay": 0.05}))
+    await env.message_broker.join()
+    # Los mensajes del broker se repartieron entre las réplicas añadidas
+    handled = [r["handled"] for r in pool.get_stats()["per_replica"]]
+    assert len(handled) > 1 and sum(1 for count in handled if count) > 1
+    
+    # Sin nuevas peticiones, la revisión periódica retira las réplicas ociosas
+    await asyncio.sleep(0.3)
+    assert len(pool.replicas) == 1
+    assert env.message_broker.subscribers["busy"].concurrency == 1
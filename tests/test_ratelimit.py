@@ -0,0 +1,77 @@
+import asyncio
+import fakeredis
+import pytest
+from uruz.llm.ratelimit import ConcurrencyGovernor, RateLimiter, RedisTokenBucket, TokenBucket
+
+class ThrottledError(Exception):
+    status_code = 429
+
+def test_token_bucket_reserves_in_arrival_order():
+    bucket = TokenBucket(600, capacity=2)
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    # 10 tokens por segundo: el siguiente espera ~0.1 s, el otro ~0.2 s
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve(1) == pytest.approx(0.2, abs=0.01)
+
+@pytest.mark.asyncio
+async def test_redis_bucket_is_shared_between_processes():
+    server = fakeredis.FakeServer()
+    buckets = [
+        RedisTokenBucket(fakeredis.FakeAsyncRedis(server=server), "uruz:ratelimit:test", 600, 2)
+        for _ in range(2)
+    ]
+    assert await buckets[0].acquire() == 0
+    assert await buckets[1].acquire() == 0
+    assert await buckets[0].acquire() > 0
+    assert buckets[0].errors == 0
+
+@pytest.mark.asyncio
+async def test_governor_backs_off_on_throttle_and_grows_on_success():
+    governor = ConcurrencyGovernor(initial=2, maximum=4)
+    await governor.acquire()
+    await governor.acquire()
+    waiter = asyncio.ensure_future(governor.acquire())
+    await asyncio.sleep(0)
+    assert governor.queued == 1
+    
+    governor.on_throttle()
+    assert governor.get_stats()["limit"] == 1
+    governor.release()
+    await asyncio.sleep(0)
+    # Con límite 1 y una petición en curso, la espera continúa
+    assert not waiter.done()
+    
+    for _ in range(3):
+        governor.on_success(0.01)
+    assert governor.get_stats()["limit"] == 2
+    await asyncio.wait_for(waiter, 1)
+    assert governor.in_flight == 2
+
+def test_governor_judges_latency_per_output_token():
+    governor = ConcurrencyGovernor(initial=4, maximum=4)
+    governor.on_success(1.0, output_tokens=100)
+    # Una respuesta diez veces más larga tarda diez veces más sin congestión
+    governor.on_success(10.0, output_tokens=1000)
+    assert governor.decreases == 0
+    governor.on_success(50.0, output_tokens=1000)
+    assert governor.decreases == 1
+
+@pytest.mark.asyncio
+async def test_rate_limiter_reports_queue_wait_apart_from_latency():
+    limiter = RateLimiter("test", ConcurrencyGovernor(initial=1), requests=TokenBucket(600, 1))
+    
+    async def call(delay):
+        async with limiter.limit():
+            await asyncio.sleep(delay)
+    
+    await asyncio.gather(call(0.02), call(0.02))
+    with pytest.raises(ThrottledError):
+        async with limiter.limit():
+            raise ThrottledError()
+    
+    stats = limiter.get_stats()
+    assert (stats["completed"], stats["failed"], stats["throttled"]) == (2, 1, 1)
+    assert stats["max_queue_wait"] >= 0.02
+    assert stats["avg_provider_latency"] == pytest.approx(0.02, abs=0.015)
+    assert stats["concurrency"]["in_flight"] == 0
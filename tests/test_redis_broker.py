@@ -0,0 +1,150 @@
+import asyncio
+import pytest
+import fakeredis
+from uruz.core.message import Message
+from uruz.core.redis_broker import RedisStreamBroker
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+def make_broker(server, consumer, **kwargs):
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=False)
+    return RedisStreamBroker(redis_client=client, consumer=consumer, block_ms=20, **kwargs)
+
+@pytest.mark.asyncio
+async def test_messages_cross_processes_through_streams():
+    server = fakeredis.FakeServer()
+    broker_a = make_broker(server, "a")
+    broker_b = make_broker(server, "b")
+    received_a, received_b = [], []
+    
+    async def handler_a(message):
+        received_a.append(message.content["text"])
+    
+    async def handler_b(message):
+        received_b.append(message.content["text"])
+    
+    broker_a.subscribe("agent_a", handler_a)
+    broker_b.subscribe("agent_b", handler_b)
+    
+    await broker_a.publish(Message.create("agent_a", "agent_a", {"text": "local"}))
+    await broker_a.publish(Message.create("agent_a", "agent_b", {"text": "remote"}))
+    await wait_for(lambda: received_b == ["remote"])
+    await broker_a.join()
+    
+    assert received_a == ["local"]
+    assert broker_a.local_deliveries == 1
+    assert broker_a.remote_deliveries == 1
+    # El mensaje local nunca pasó por Redis
+    assert await broker_a.redis.xlen("uruz:agent:agent_a") == 0
+    await wait_for(lambda: not broker_b._in_flight)
+    pending = await broker_b.redis.xpending("uruz:agent:agent_b", "uruz")
+    assert pending["pending"] == 0
+    
+    await broker_a.stop()
+    await broker_b.stop()
+
+@pytest.mark.asyncio
+async def test_pending_entries_of_dead_consumers_are_reclaimed():
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=False)
+    stream = "uruz:agent:worker"
+    await redis.xgroup_create(stream, "uruz", id="0", mkstream=True)
+    await redis.xadd(stream, RedisStreamBroker.encode(
+        Message.create("x", "worker", {"text": "orphan"})))
+    # Un consumidor lee la entrada y muere sin confirmarla
+    await redis.xreadgroup("uruz", "dead", {stream: ">"}, count=10)
+    
+    broker = make_broker(server, "alive", claim_idle_ms=0)
+    received = []
+    
+    async def handler(message):
+        received.append(message.content["text"])
+    
+    broker.subscribe("worker", handler)
+    await wait_for(lambda: received == ["orphan"])
+    await broker.stop()
+
+@pytest.mark.asyncio
+async def test_request_reply_across_processes():
+    server = fakeredis.FakeServer()
+    caller = make_broker(server, "caller")
+    worker = make_broker(server, "worker")
+    
+    async def echo(message):
+        return {"echo": message.content["text"]}
+    
+    worker.subscribe("echo", echo)
+    reply = await caller.request(Message.create("client", "echo", {"text": "hola"}), timeout=2)
+    assert reply.content == {"echo": "hola"}
+    assert caller.pending_requests() == 0
+    
+    await caller.stop()
+    await worker.stop()
+
+@pytest.mark.asyncio
+async def test_failed_entries_stay_pending_and_are_redelivered():
+    server = fakeredis.FakeServer()
+    sender = make_broker(server, "sender")
+    broker = make_broker(server, "worker", claim_idle_ms=0)
+    attempts = []
+    
+    async def flaky(message):
+        attempts.append(message.content["text"])
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+    
+    broker.subscribe("flaky", flaky)
+    await sender.publish(Message.create("x", "flaky", {"text": "retry me"}))
+    await wait_for(lambda: len(attempts) == 2)
+    await wait_for(lambda: not broker._in_flight)
+    pending = await broker.redis.xpending("uruz:agent:flaky", "uruz")
+    assert pending["pending"] == 0
+    
+    await broker.stop()
+
+@pytest.mark.asyncio
+async def test_entries_refused_by_a_full_mailbox_are_redelivered():
+    server = fakeredis.FakeServer()
+    sender = make_broker(server, "sender")
+    # Con claim_idle_ms=0 se reclama en cada lectura: sin límite práctico de entregas
+    broker = make_broker(server, "worker", claim_idle_ms=0, max_deliveries=1000)
+    received = []
+    
+    async def slow(message):
+        await asyncio.sleep(0.01)
+        received.append(message.content["n"])
+    
+    broker.subscribe("worker", slow, capacity=1, overflow_policy="reject")
+    await sender.publish_many([Message.create("x", "worker", {"n": n}) for n in range(4)])
+    await wait_for(lambda: sorted(received) == [0, 1, 2, 3])
+    await wait_for(lambda: not broker._in_flight)
+    pending = await broker.redis.xpending("uruz:agent:worker", "uruz")
+    assert pending["pending"] == 0
+    
+    await broker.stop()
+
+@pytest.mark.asyncio
+async def test_entries_that_always_fail_go_to_the_dead_letter_stream():
+    server = fakeredis.FakeServer()
+    sender = make_broker(server, "sender")
+    broker = make_broker(server, "worker", claim_idle_ms=0, max_deliveries=3)
+    attempts = []
+    
+    async def failing(message):
+        attempts.append(message.id)
+        raise RuntimeError("boom")
+    
+    broker.subscribe("poison", failing)
+    await sender.publish(Message.create("x", "poison", {"text": "never works"}))
+    await wait_for(lambda: broker.dead_letters == 1)
+    assert len(attempts) == 3
+    pending = await broker.redis.xpending("uruz:agent:poison", "uruz")
+    assert pending["pending"] == 0
+    dead = await broker.redis.xrange("uruz:agent:poison:dead")
+    assert RedisStreamBroker.decode(dead[0][1]).content == {"text": "never works"}
+    
+    await broker.stop()
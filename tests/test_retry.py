@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from uruz.llm.retry import Hedger, RetryPolicy
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_within_the_deadline():
+    policy = RetryPolicy(retries=3, base_delay=0.001, deadline=1)
+    attempts = []
+    
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise APIError(503)
+        return "ok"
+    
+    assert await policy.run(flaky) == "ok"
+    assert policy.get_stats()["retried"] == 2
+    
+    async def bad_request():
+        attempts.append(1)
+        raise APIError(400)
+    
+    attempts.clear()
+    with pytest.raises(APIError):
+        await policy.run(bad_request)
+    assert len(attempts) == 1
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_the_whole_request():
+    policy = RetryPolicy(retries=5, base_delay=0.001, deadline=0.05)
+    
+    async def hangs():
+        await asyncio.sleep(10)
+    
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    with pytest.raises(asyncio.TimeoutError):
+        await policy.run(hangs)
+    assert loop.time() - start < 0.5
+    assert policy.get_stats()["deadline_exceeded"] == 1
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_the_loser_cancelled():
+    hedger = Hedger(percentile=95, max_ratio=1.0, min_samples=5)
+    hedger._latencies.extend([0.01] * 5)
+    calls, cancelled = [], []
+    
+    async def call():
+        calls.append(1)
+        try:
+            # La primera llamada se queda colgada; la segunda responde enseguida
+            await asyncio.sleep(10 if len(calls) == 1 else 0.001)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return len(calls)
+    
+    assert await asyncio.wait_for(hedger.run(call), 1) == 2
+    await asyncio.sleep(0)
+    assert cancelled == [1]
+    assert hedger.get_stats()["hedge_wins"] == 1
@@ -0,0 +1,94 @@
+import asyncio
+import fakeredis
+import pytest
+from uruz.llm import PROVIDERS
+from uruz.llm.base import LLMProvider
+from uruz.llm.router import RouterProvider
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+class FakeBackend(LLMProvider):
+    name = "fake"
+    
+    def __init__(self, config):
+        super().__init__(config)
+        self.model = config["model"]
+        # Código HTTP con el que falla cada llamada, si lo hay
+        self.failing = config.get("failing")
+        self.calls = 0
+    
+    async def _request(self, prompt):
+        self.calls += 1
+        if self.failing:
+            raise StatusError(self.failing)
+        return f"{self.model}: {prompt}"
+    
+    async def _stream(self, prompt):
+        yield await self._request(prompt)
+    
+    def stream(self, prompt):
+        return self._stream(prompt)
+
+@pytest.fixture
+def make_router(monkeypatch):
+    monkeypatch.setitem(PROVIDERS, "fake", FakeBackend)
+    routers = []
+    
+    def make(backends, **routing):
+        router = RouterProvider({
+            "provider": "router",
+            "routing": {"explore": 0, **routing},
+            "backends": [{"provider": "fake", **backend} for backend in backends],
+        })
+        router.cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        router.cache.timeout = 1
+        routers.append(router)
+        return router
+    
+    yield make
+    for router in routers:
+        router.close()
+
+@pytest.mark.asyncio
+async def test_policy_picks_fastest_or_cheapest_backend(make_router):
+    router = make_router([{"model": "fast", "cost_per_1k_tokens": 0.01},
+                          {"model": "cheap", "cost_per_1k_tokens": 0.001}], policy="latency")
+    fast, cheap = router.backends
+    for _ in range(10):
+        fast.record(0.2, True, 0)
+        cheap.record(1.5, True, 0)
+    
+    assert await router.generate("hola") == "fast: hola"
+    router.policy = "cost"
+    assert await router.generate("adiós") == "cheap: adiós"
+    assert router.get_stats()["backends"]["fake:cheap"]["cost"] > 0
+
+@pytest.mark.asyncio
+async def test_failing_backend_fails_over_and_is_ejected(make_router):
+    router = make_router([{"model": "primary", "failing": 503}, {"model": "backup"}],
+                         min_samples=3, cooldown=60)
+    primary, backup = router.backends
+    
+    answers = [await router.generate(f"q{i}") for i in range(5)]
+    assert answers == [f"backup: q{i}" for i in range(5)]
+    # Tras tres fallos el primario sale de rotación y deja de recibir peticiones
+    assert primary.provider.calls == 3
+    assert not router.get_stats()["backends"]["fake:primary"]["available"]
+    
+    chunks = [chunk async for chunk in router.stream("stream")]
+    assert chunks == ["backup: stream"]
+
+@pytest.mark.asyncio
+async def test_invalid_requests_are_not_failed_over(make_router):
+    router = make_router([{"model": "primary", "failing": 400}, {"model": "backup"}])
+    primary, backup = router.backends
+    
+    with pytest.raises(StatusError):
+        await router.generate("bad request")
+    with pytest.raises(StatusError):
+        [chunk async for chunk in router.stream("bad stream")]
+    assert backup.provider.calls == 0
+    assert primary.error_rate() == 0
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+import pytest
+from uruz.core.agent import Agent
+from uruz.core.environment import Environment
+from uruz.core.scheduler import CronSchedule, Scheduler, IntervalSchedule
+
+class CountingAgent(Agent):
+    def __init__(self, agent_id: str, config: dict):
+        super().__init__(agent_id, config)
+        self.calls = 0
+    
+    async def process_message(self, message):
+        return {}
+    
+    async def act(self):
+        self.calls += 1
+        return [{"agent": self.agent_id}]
+
+def test_cron_schedule_next_after():
+    cron = CronSchedule("*/15 9-17 * * 1-5")
+    # Viernes 17:50 -> lunes 09:00
+    assert cron.next_after(datetime(2024, 5, 3, 17, 50)) == datetime(2024, 5, 6, 9, 0)
+    assert cron.next_after(datetime(2024, 5, 6, 9, 0)) == datetime(2024, 5, 6, 9, 15)
+    assert CronSchedule("@daily").next_after(datetime(2024, 12, 31, 1, 0)) == datetime(2025, 1, 1)
+
+def test_scheduler_pops_only_due_agents():
+    scheduler = Scheduler()
+    scheduler.add("soon", IntervalSchedule(10))
+    scheduler.add("later", IntervalSchedule(10), delay=60)
+    assert scheduler.pop_due() == ["soon"]
+    assert scheduler.pop_due() == []
+    
+    scheduler.remove("later")
+    assert scheduler.next_deadline() is None
+
+@pytest.mark.asyncio
+async def test_environment_step_skips_agents_not_due():
+    env = Environment()
+    scheduled = CountingAgent("scheduled", {"interval": 3600})
+    unscheduled = CountingAgent("unscheduled", {})
+    env.add_agent(scheduled)
+    env.add_agent(unscheduled)
+    
+    await env.step()
+    await env.step()
+    assert scheduled.calls == 1
+    assert unscheduled.calls == 2
+
+@pytest.mark.asyncio
+async def test_environment_run_wakes_on_deadlines():
+    env = Environment()
+    agent = CountingAgent("fast", {"interval": 0.05})
+    env.add_agent(agent)
+    
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(env.run(stop_event=stop))
+    await asyncio.sleep(0.22)
+    stop.set()
+    await task
+    assert 3 <= agent.calls <= 6
+
+class FlakyAgent(CountingAgent):
+    builds = 0
+    
+    def __init__(self, agent_id: str, config: dict):
+        FlakyAgent.builds += 1
+        if FlakyAgent.builds == 1:
+            raise RuntimeError("dependencia no disponible")
+        super().__init__(agent_id, config)
+
+@pytest.mark.asyncio
+async def test_environment_reschedules_agents_that_fail_to_build(tmp_path, monkeypatch):
+    agents_dir = tmp_path / "agents"
+    agents_dir.mkdir()
+    monkeypatch.setenv("URUZ_AGENTS_DIR", str(agents_dir))
+    (agents_dir / "flaky.yaml").write_text(
+        "config:\n"
+        "  agent_class: test_scheduler.FlakyAgent\n"
+        "  interval: 0.05\n"
+    )
+    
+    env = Environment()
+    assert await env.step() == []
+    assert env.scheduler.next_deadline() is not None
+    await asyncio.sleep(0.1)
+    assert await env.step() == [{"agent": "flaky"}]
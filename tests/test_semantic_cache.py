@@ -0,0 +1,64 @@
+import fakeredis
+import pytest
+from uruz.llm.semantic_cache import HashingEmbedder, SemanticCache
+
+@pytest.mark.asyncio
+async def test_equivalent_prompts_hit_above_threshold():
+    cache = SemanticCache(HashingEmbedder(), threshold=0.95)
+    await cache.add("What is the CPU usage of server web-1?", "42%")
+    
+    assert await cache.lookup("what is the cpu usage of server web-1") == "42%"
+    assert await cache.lookup("Restart the nginx service on db-3") is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+    
+    # Una respuesta incorrecta se cuenta y deja de servirse
+    assert await cache.report_false_hit("What is the CPU usage of server web-1")
+    assert await cache.lookup("what is the cpu usage of server web-1") is None
+    assert cache.get_stats()["false_hits"] == 1
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(HashingEmbedder(), capacity=2)
+    await cache.add("disk usage on web-1", "10%")
+    await cache.add("open tickets for team ops", "3")
+    assert await cache.lookup("disk usage on web-1") == "10%"
+    await cache.add("nginx status on db-3", "running")
+    
+    assert len(cache) == 2
+    assert cache.get_stats()["evictions"] == 1
+    assert await cache.lookup("open tickets for team ops") is None
+    assert await cache.lookup("disk usage on web-1") == "10%"
+
+@pytest.mark.asyncio
+async def test_agent_answers_paraphrase_from_semantic_cache():
+    from uruz.core.llm_agent import LLMAgent
+    
+    agent = LLMAgent("llm-agent", {"semantic_cache": {"embedder": HashingEmbedder()}})
+    agent.llm.cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    agent.llm.cache.timeout = 1
+    prompts = []
+    
+    async def fake_request(prompt):
+        prompts.append(prompt)
+        return "web-1 is healthy"
+    
+    agent.llm._request = fake_request
+    first = await agent.process_message({"content": "Is web-1 healthy?"})
+    await agent.llm.semantic_cache.flush_writes()
+    second = await agent.process_message({"content": "is web-1 healthy"})
+    assert first == second == {"response": "web-1 is healthy"}
+    assert prompts == ["Is web-1 healthy?"]
+    agent.llm.close()
+
+@pytest.mark.asyncio
+async def test_hashing_embedder_is_refused_outside_tests():
+    from uruz.core.llm_agent import LLMAgent
+    
+    # Solo mide coincidencia léxica: una pregunta y su negación pasan el umbral
+    cache = SemanticCache(HashingEmbedder(), threshold=0.95)
+    await cache.add("should I restart the database server on db-3 now", "yes")
+    assert await cache.lookup("should I not restart the database server on db-3 now") == "yes"
+    with pytest.raises(ValueError):
+        LLMAgent("llm-agent", {"semantic_cache": {"embedder": "hashing"}})
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import pytest
+from uruz.core.agent import Agent
+from uruz.core.message import Message
+from uruz.core.sharding import (ShardedEnvironment, _ShardBroker, _ShardEnvironment,
+                                owner_shard, shard_for)
+
+class PidAgent(Agent):
+    def __init__(self, agent_id: str, config: dict):
+        super().__init__(agent_id, config)
+        self.received = []
+    
+    async def process_message(self, message):
+        if isinstance(message, Message):
+            self.received.append(message.content)
+            return {"status": "received"}
+        return {"response": len(self.received), "pid": os.getpid()}
+    
+    async def act(self):
+        return [{"agent": self.agent_id, "pid": os.getpid()}]
+
+class AlertingAgent(PidAgent):
+    async def act(self):
+        return [{"topic": "ops.alerts", "from": self.agent_id}]
+
+def on_shard(shard_id, num_shards=2):
+    return next(f"agent{i}" for i in range(50) if shard_for(f"agent{i}", num_shards) == shard_id)
+
+def test_shard_for_is_stable():
+    assert shard_for("monitor", 4) == shard_for("monitor", 4)
+    assert {shard_for(f"agent{i}", 4) for i in range(50)} == {0, 1, 2, 3}
+
+@pytest.mark.asyncio
+async def test_sharded_environment_spreads_agents_across_processes():
+    async with ShardedEnvironment(num_shards=2) as env:
+        agent_ids = [f"agent{i}" for i in range(6)]
+        for agent_id in agent_ids:
+            env.add_agent(PidAgent(agent_id, {}))
+        
+        results = await env.step()
+        assert sorted(r["agent"] for r in results) == agent_ids
+        assert len({r["pid"] for r in results}) == 2
+        assert os.getpid() not in {r["pid"] for r in results}
+        
+        await env.message_broker.publish(Message.create("x", "agent3", {"n": 1}))
+        await env.message_broker.join()
+        response = await env.get_agent("agent3").process_message({"content": "count"})
+        assert response["response"] == 1
+        assert env.get_agent("unknown") is None
+
+def test_shard_environment_subscribes_topics_on_its_broker(tmp_path, monkeypatch):
+    monkeypatch.setenv("URUZ_AGENTS_DIR", str(tmp_path / "agents"))
+    monkeypatch.setenv("URUZ_DATA_DIR", str(tmp_path / "data"))
+    (tmp_path / "agents").mkdir()
+    agent_id = next(f"agent{i}" for i in range(50) if shard_for(f"agent{i}", 2) == 0)
+    (tmp_path / "agents" / f"{agent_id}.yaml").write_text(
+        "config:\n  topics: [ops.alerts]\n"
+    )
+    
+    env = _ShardEnvironment(0, 2, lambda message: None)
+    assert env.message_broker.topics.match("ops.alerts") == {agent_id}
+
+@pytest.mark.asyncio
+async def test_topic_messages_reach_subscribers_on_other_shards():
+    publisher, subscriber = on_shard(0), on_shard(1)
+    async with ShardedEnvironment(num_shards=2) as env:
+        env.add_agent(AlertingAgent(publisher, {"interval": 3600}))
+        env.add_agent(PidAgent(subscriber, {"topics": ["ops.*"], "interval": 3600}))
+        
+        await env.step()
+        for _ in range(100):
+            response = await env.get_agent(subscriber).process_message({"content": "count"})
+            if response["response"]:
+                break
+            await asyncio.sleep(0.02)
+        assert response["response"] == 1
+        
+        # Desde el coordinador el tópico llega a todos los shards
+        assert await env.message_broker.publish_topic("ops.db", Message.create("x", "ops.db", {})) == 1
+
+@pytest.mark.asyncio
+async def test_shard_brokers_route_requests_and_batches_across_shards():
+    brokers = []
+    
+    def forward(message):
+        # Hace de coordinador: entrega en el shard dueño del receptor
+        asyncio.ensure_future(brokers[owner_shard(message.receiver_id, 2)].publish(message))
+    
+    brokers.extend(_ShardBroker(shard_id, 2, forward) for shard_id in range(2))
+    local, remote = on_shard(0), on_shard(1)
+    received = []
+    
+    async def handler(message):
+        received.append(message.receiver_id)
+        return "pong"
+    
+    brokers[0].subscribe(local, handler)
+    brokers[1].subscribe(remote, handler)
+    
+    reply = await brokers[0].request(Message.create(local, remote, "ping"), 1)
+    assert reply.content == "pong"
+    
+    await brokers[0].publish_many([Message.create(local, remote, 1), Message.create(remote, local, 2)])
+    await asyncio.sleep(0.05)
+    assert sorted(received) == sorted([remote, remote, local])
+    for broker in brokers:
+        broker.close()
@@ -0,0 +1,107 @@
+import asyncio
+import fakeredis
+import pytest
+from uruz.llm.base import LLMProvider
+from uruz.llm.singleflight import SingleFlight, acquire_lock, release_lock
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_flight():
+    flights = SingleFlight()
+    calls = []
+    
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+    
+    leader = asyncio.ensure_future(flights.do("key", call))
+    followers = [asyncio.ensure_future(flights.do("key", call)) for _ in range(9)]
+    await asyncio.sleep(0)
+    # Cancelar al primero no cancela la llamada de los demás
+    leader.cancel()
+    assert await asyncio.gather(*followers) == ["answer"] * 9
+    assert len(calls) == 1
+    assert flights.get_stats() == {"calls": 1, "coalesced": 9, "in_flight": 0}
+    
+    async def failing():
+        raise RuntimeError("upstream down")
+    
+    results = await asyncio.gather(flights.do("bad", failing), flights.do("bad", failing),
+                                   return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+class FakeProvider(LLMProvider):
+    def __init__(self, server, requests):
+        super().__init__({"singleflight_lock_ms": 2000})
+        self.cache.redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        self.cache.timeout = 1
+        # Un SingleFlight propio simula un proceso distinto
+        self.flights = SingleFlight()
+        self.requests = requests
+    
+    async def _request(self, prompt):
+        self.requests.append(prompt)
+        await asyncio.sleep(0.1)
+        return f"re: {prompt}"
+    
+    def stream(self, prompt):
+        return self._cached_stream(prompt, self._request_stream)
+    
+    async def _request_stream(self, prompt):
+        yield await self._request(prompt)
+
+@pytest.mark.asyncio
+async def test_redis_lock_coalesces_calls_across_processes():
+    server = fakeredis.FakeServer()
+    requests = []
+    providers = [FakeProvider(server, requests) for _ in range(3)]
+    
+    answers = await asyncio.gather(*(provider.generate("hola") for provider in providers))
+    assert answers == ["re: hola"] * 3
+    assert requests == ["hola"]
+    for provider in providers:
+        provider.close()
+
+@pytest.mark.asyncio
+async def test_release_lock_only_deletes_its_own_token():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    token = await acquire_lock(redis, "lock", 1000, 1)
+    assert token and await acquire_lock(redis, "lock", 1000, 1) is None
+    
+    # El lock expiró y lo tomó otro proceso: liberar con el token viejo no lo borra
+    await redis.set("lock", "otro", px=1000)
+    await release_lock(redis, "lock", token, 1)
+    assert await redis.get("lock") == "otro"
+    await release_lock(redis, "lock", "otro", 1)
+    assert await redis.get("lock") is None
+
+class PlainProvider(LLMProvider):
+    name = "plain"
+    
+    def __init__(self, **attributes):
+        super().__init__({})
+        self.__dict__.update(attributes)
+    
+    async def _request(self, prompt):
+        return prompt
+    
+    def stream(self, prompt):
+        return self._cached_stream(prompt, self._request_stream)
+    
+    async def _request_stream(self, prompt):
+        yield prompt
+
+def test_flight_key_separates_providers_models_and_system_prompts():
+    base = {"model": "m1", "temperature": 0.7, "system_prompt": "eres un asistente"}
+    providers = [
+        PlainProvider(**base),
+        PlainProvider(**{**base, "model": "m2"}),
+        PlainProvider(**{**base, "system_prompt": "eres un auditor"}),
+        PlainProvider(**{**base, "name": "other"}),
+        PlainProvider(**base),
+    ]
+    keys = [provider._get_cache_key("hola") for provider in providers]
+    assert len(set(keys)) == 4
+    assert keys[0] == keys[-1]
+    for provider in providers:
+        provider.close()
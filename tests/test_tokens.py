@@ -0,0 +1,106 @@
+import sqlite3
+from types import SimpleNamespace
+import fakeredis
+import pytest
+from uruz.llm.base import LLMProvider
+from uruz.llm.openai_provider import OpenAIProvider
+from uruz.llm.tokens import (LLMResult, PromptTooLongError, Usage, context_window,
+                             estimate_tokens, fit_prompt)
+from uruz.storage.database_manager import DatabaseManager
+
+class MeteredProvider(LLMProvider):
+    name = "metered"
+    
+    def __init__(self, config):
+        super().__init__(config)
+        self.model = "claude-3-haiku-20240307"
+        self.max_tokens = 100
+        self.cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.cache.timeout = 1
+        self.prompts = []
+    
+    async def _request(self, prompt):
+        self.prompts.append(prompt)
+        usage = SimpleNamespace(input_tokens=20, output_tokens=7,
+                                cache_read_input_tokens=30, cache_creation_input_tokens=0)
+        return LLMResult("ok", Usage.from_anthropic(usage))
+    
+    def stream(self, prompt):
+        return self._cached_stream(prompt, self._request_stream)
+    
+    async def _request_stream(self, prompt):
+        yield (await self._request(prompt)).text
+
+def test_prompts_are_trimmed_or_rejected_to_fit_the_budget():
+    prompt = "instrucciones " + "dato " * 500 + "pregunta final"
+    assert estimate_tokens(prompt) >= 500
+    assert context_window("claude-3-haiku-20240307") == 200000
+    
+    trimmed = fit_prompt(prompt, 100)
+    assert estimate_tokens(trimmed) <= 100
+    assert trimmed.startswith("instrucciones") and trimmed.endswith("pregunta final")
+    assert fit_prompt("corto", 100) == "corto"
+    with pytest.raises(PromptTooLongError):
+        fit_prompt(prompt, 100, "reject")
+    # Sin ventana conocida no se recorta nada
+    assert context_window("modelo-desconocido") is None
+    assert fit_prompt(prompt, None) == prompt
+
+@pytest.mark.asyncio
+async def test_provider_reports_real_usage_and_rejects_before_calling():
+    provider = MeteredProvider({"prompt_overflow": "reject", "context_window": 150})
+    
+    result = await provider.complete("¿Cuánto espacio libre hay?")
+    assert result.usage == Usage(input_tokens=50, output_tokens=7, cached_tokens=30)
+    await provider.cache.flush_writes()
+    again = await provider.complete("¿Cuánto espacio libre hay?")
+    assert again.cached and again.usage.total_tokens == 0
+    assert provider.usage.total_tokens == 57
+    
+    # 150 de ventana menos 100 de respuesta: el prompt largo no llega a la red
+    with pytest.raises(PromptTooLongError):
+        await provider.complete("palabra " * 200)
+    assert len(provider.prompts) == 1
+    provider.close()
+
+@pytest.mark.asyncio
+async def test_openai_stream_with_custom_params_is_fitted_and_limited():
+    provider = OpenAIProvider({"api_key": "sk-test", "prompt_overflow": "reject",
+                               "context_window": 150, "max_tokens": 100})
+    limited = []
+    calls = []
+    
+    async def fake_stream(prompt, max_tokens=None, temperature=None, **kwargs):
+        calls.append((prompt, max_tokens, temperature))
+        yield "ok"
+    
+    async def call_stream(chunks, prompt):
+        limited.append(prompt)
+        async for chunk in chunks(prompt):
+            yield chunk
+    
+    provider._stream = fake_stream
+    provider._call_stream = call_stream
+    chunks = [chunk async for chunk in provider.stream("hola", max_tokens=5, temperature=0)]
+    assert chunks == ["ok"]
+    assert calls == [("hola", 5, 0)] and limited == ["hola"]
+    with pytest.raises(PromptTooLongError):
+        [chunk async for chunk in provider.stream("palabra " * 200, max_tokens=5)]
+    assert len(calls) == 1
+    provider.close()
+
+def test_token_columns_are_added_to_existing_metrics_table(tmp_path):
+    path = tmp_path / "metrics.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE agent_metrics (id INTEGER PRIMARY KEY, agent_id VARCHAR NOT NULL, "
+            "timestamp DATETIME, request_type VARCHAR NOT NULL, processing_time FLOAT, "
+            "tokens_used INTEGER, success BOOLEAN, error_message VARCHAR, extra_data JSON)"
+        )
+    
+    db = DatabaseManager(f"sqlite:///{path}")
+    db.log_agent_metrics("agent", "message", 0.5, 57, input_tokens=50,
+                         output_tokens=7, cached_tokens=30)
+    metric = db.get_agent_metrics()[0]
+    assert (metric.tokens_used, metric.input_tokens, metric.output_tokens,
+            metric.cached_tokens) == (57, 50, 7, 30)
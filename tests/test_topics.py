@@ -0,0 +1,55 @@
+import pytest
+from uruz.core.agent import Agent
+from uruz.core.environment import Environment
+from uruz.core.topics import TopicIndex
+
+class AlertingAgent(Agent):
+    async def process_message(self, message):
+        return {}
+    
+    async def act(self):
+        return [{"type": "alert", "topic": "ops.db.alerts", "message": "disk"}]
+
+class ListeningAgent(Agent):
+    def __init__(self, agent_id: str, config: dict):
+        super().__init__(agent_id, config)
+        self.received = []
+    
+    async def process_message(self, message):
+        self.received.append((message.topic, message.content["message"]))
+        return {}
+    
+    async def act(self):
+        return []
+
+def test_topic_index_wildcards():
+    index = TopicIndex()
+    index.add("ops.*.alerts", "star")
+    index.add("ops.#", "hash")
+    index.add("ops.db.alerts", "exact")
+    index.add("billing.*", "billing")
+    
+    assert index.match("ops.db.alerts") == {"star", "hash", "exact"}
+    assert index.match("ops.web.alerts") == {"star", "hash"}
+    assert index.match("ops") == {"hash"}
+    assert index.match("ops.web.alerts.critical") == {"hash"}
+    assert index.match("billing") == set()
+    
+    index.remove("ops.#", "hash")
+    assert index.match("ops.web.alerts") == {"star"}
+    with pytest.raises(ValueError):
+        index.add("ops.#.alerts", "bad")
+
+@pytest.mark.asyncio
+async def test_environment_publishes_topic_actions_to_subscribers():
+    env = Environment()
+    ops = ListeningAgent("ops", {"topics": ["ops.*.alerts"]})
+    billing = ListeningAgent("billing", {"topics": ["billing.#"]})
+    env.add_agent(ops)
+    env.add_agent(billing)
+    env.add_agent(AlertingAgent("db_monitor", {}))
+    
+    await env.step()
+    await env.message_broker.join()
+    assert ops.received == [("ops.db.alerts", "disk")]
+    assert billing.received == []